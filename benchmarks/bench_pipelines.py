@@ -0,0 +1,143 @@
+# meet de doorvoer van fc_plline.py en berm.py van begin tot eind (modellen maken,
+# rekenen met de nep console en de resultaten verwerken) voor een aantal processen,
+# gebruik
+#
+# python benchmarks/bench_pipelines.py [--pipeline fc berm] [--processes 1 2 4 8] [--latency 0.5]
+#
+# de stix bestanden en parameter bestanden uit fc_plline.py en berm.py worden gebruikt
+# tenzij ze met --stixfiles, --fc-parameters en --berm-parameters opgegeven worden, de
+# berekeningen en resultaten worden in een tijdelijke map geschreven
+import argparse
+import logging
+import tempfile
+import time
+from itertools import chain
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from common import FAKE_CONSOLE, print_table, set_fake_console
+
+import berm
+import fc_plline
+from helpers import read_param_lines
+from results_store import ResultsStore
+from scheduler import Scheduler
+
+
+def run(
+    pipelines: List[str],
+    param_lines: Dict[str, List[str]],
+    stixfiles: Optional[str],
+    nprocesses: int,
+    path: Path,
+) -> Dict[str, float]:
+    """Run the pipelines with the fake console in the given (empty) path
+
+    Returns:
+        Dict[str, float]: the wall time, the number of calculations and the number of points in the store
+    """
+    for module in [fc_plline, berm]:
+        module.CALCULATIONS_PATH = str(path / module.__name__)
+        Path(module.CALCULATIONS_PATH).mkdir()
+        if stixfiles is not None:
+            module.PATH_TO_STIXFILES = stixfiles
+
+    store = ResultsStore(str(path / "results.sqlite"))
+    sections = []
+    if "fc" in pipelines:
+        sections.append(
+            fc_plline.fragility_curve_section(param_line, store)
+            for param_line in param_lines["fc"]
+        )
+    if "berm" in pipelines:
+        sections.append(
+            berm.berm_section(param_line, store) for param_line in param_lines["berm"]
+        )
+
+    # no cache and no journal, every model is calculated
+    scheduler = Scheduler(FAKE_CONSOLE, nprocesses)
+    start = time.perf_counter()
+    scheduler.run(chain(*sections))
+    wall = time.perf_counter() - start
+    num_points = len(store.query())
+    store.close()
+    return {
+        "wall": wall,
+        "calculations": scheduler.num_calculated,
+        "points": num_points,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Measure the end-to-end throughput of fc_plline.py and berm.py with the fake console"
+    )
+    parser.add_argument(
+        "--pipeline", nargs="+", choices=["fc", "berm"], default=["fc", "berm"]
+    )
+    parser.add_argument("--processes", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--latency", type=float, default=0.5)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--stixfiles", default=None)
+    parser.add_argument("--fc-parameters", default=fc_plline.PARAMETERS_FILE)
+    parser.add_argument("--berm-parameters", default=berm.PARAMETERS_FILE)
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        format="%(asctime)s %(levelname)s %(message)s",
+        datefmt="%H:%M:%S",
+        level=logging.WARNING,
+    )
+    set_fake_console(args.latency, args.jitter, args.failure_rate)
+
+    param_lines = {
+        "fc": read_param_lines(args.fc_parameters) if "fc" in args.pipeline else [],
+        "berm": (
+            read_param_lines(args.berm_parameters) if "berm" in args.pipeline else []
+        ),
+    }
+
+    rows = []
+    wall_first = None  # the speedup is relative to the first number of processes
+    for nprocesses in args.processes:
+        with tempfile.TemporaryDirectory() as path:
+            result = run(
+                args.pipeline, param_lines, args.stixfiles, nprocesses, Path(path)
+            )
+        wall = result["wall"]
+        if wall_first is None:
+            wall_first = wall
+        rows.append(
+            {
+                "processes": nprocesses,
+                "sections": len(param_lines["fc"]) + len(param_lines["berm"]),
+                "calculations": result["calculations"],
+                "points": result["points"],
+                "wall [s]": wall,
+                "calculations/s": result["calculations"] / wall,
+                "speedup": wall_first / wall,
+                "efficiency": wall_first / wall / nprocesses * args.processes[0],
+            }
+        )
+
+    print(
+        f"pipelines: {', '.join(args.pipeline)}, latency: {args.latency}s, failure rate: {args.failure_rate}"
+    )
+    print_table(
+        rows,
+        [
+            "processes",
+            "sections",
+            "calculations",
+            "points",
+            "wall [s]",
+            "calculations/s",
+            "speedup",
+            "efficiency",
+        ],
+    )
+
+
+if __name__ == "__main__":
+    main()
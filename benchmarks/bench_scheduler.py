@@ -0,0 +1,94 @@
+# meet de overhead van de scheduler per model (starten van de console, lezen van het
+# resultaat, journaal en cache) en de schaling met het aantal processen met de nep
+# console (fake_console.py), gebruik
+#
+# python benchmarks/bench_scheduler.py <stix bestand> [--models 32] [--processes 1 2 4 8] [--latency 0 0.5] [--driver]
+import argparse
+import math
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+from common import FAKE_CONSOLE, print_table, set_fake_console
+
+from console_driver import ConsoleExecutor
+from scheduler import Job, Scheduler
+
+
+def run(
+    stixfile: str, num_models: int, nprocesses: int, path: Path, driver: bool = False
+) -> float:
+    """Calculate num_models copies of the stix file and get the wall time"""
+    jobs = []
+    for i in range(num_models):
+        filename = path / f"model_{i}.stix"
+        shutil.copy(stixfile, filename)
+        jobs.append(Job(f"model_{i}", filename))
+
+    def section():
+        yield jobs
+
+    executor = ConsoleExecutor(nprocesses) if driver else None
+    scheduler = Scheduler(FAKE_CONSOLE, nprocesses, executor=executor)
+    start = time.perf_counter()
+    scheduler.run([section()])
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Measure the overhead per model and the scaling of the scheduler with the fake console"
+    )
+    parser.add_argument("stixfile")
+    parser.add_argument("--models", type=int, default=32)
+    parser.add_argument("--processes", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--latency", type=float, nargs="+", default=[0.0, 0.5])
+    parser.add_argument(
+        "--driver",
+        action="store_true",
+        help="use the asyncio console driver (console_driver.py) instead of a process pool",
+    )
+    args = parser.parse_args()
+
+    rows = []
+    for latency in args.latency:
+        set_fake_console(latency=latency)
+        wall_first = None  # the speedup is relative to the first number of processes
+        for nprocesses in args.processes:
+            with tempfile.TemporaryDirectory() as path:
+                wall = run(
+                    args.stixfile, args.models, nprocesses, Path(path), args.driver
+                )
+            if wall_first is None:
+                wall_first = wall
+            # the time the console is busy if there was no overhead at all
+            ideal = math.ceil(args.models / nprocesses) * latency
+            rows.append(
+                {
+                    "latency": latency,
+                    "processes": nprocesses,
+                    "models": args.models,
+                    "wall [s]": wall,
+                    "models/s": args.models / wall,
+                    "overhead/model [s]": (wall - ideal) * nprocesses / args.models,
+                    "speedup": wall_first / wall,
+                }
+            )
+
+    print_table(
+        rows,
+        [
+            "latency",
+            "processes",
+            "models",
+            "wall [s]",
+            "models/s",
+            "overhead/model [s]",
+            "speedup",
+        ],
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,36 @@
+import os
+import sys
+from pathlib import Path
+from typing import Any, Dict, List
+
+# the benchmarks use the scripts in the root of the repository
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.append(str(ROOT))
+
+FAKE_CONSOLE = str(ROOT / "fake_console.py")
+
+
+def set_fake_console(
+    latency: float = 0.0, jitter: float = 0.0, failure_rate: float = 0.0, seed: int = 0
+):
+    """Set the behaviour of the fake console (see fake_console.py)
+
+    The settings are passed as environment variables so they are inherited by the
+    worker processes of the scheduler and the console processes.
+    """
+    os.environ["FAKE_CONSOLE_LATENCY"] = str(latency)
+    os.environ["FAKE_CONSOLE_JITTER"] = str(jitter)
+    os.environ["FAKE_CONSOLE_FAILURE_RATE"] = str(failure_rate)
+    os.environ["FAKE_CONSOLE_SEED"] = str(seed)
+
+
+def print_table(rows: List[Dict[str, Any]], columns: List[str]):
+    """Print the rows as a table with the given columns"""
+    cells = [
+        [f"{row[c]:.3f}" if isinstance(row[c], float) else str(row[c]) for c in columns]
+        for row in rows
+    ]
+    widths = [max([len(c)] + [len(r[i]) for r in cells]) for i, c in enumerate(columns)]
+    print("  ".join(c.rjust(w) for c, w in zip(columns, widths)))
+    for r in cells:
+        print("  ".join(v.rjust(w) for v, w in zip(r, widths)))
@@ -1,11 +1,33 @@
 from pathlib import Path
 from leveelogic.deltares.dstability import DStability
 from leveelogic.deltares.algorithms.algorithm_berm_wsbd import AlgorithmBermWSBD
-from leveelogic.deltares.dseries_calculator import DSeriesCalculator
+from geolib.models.dstability.internal import AnalysisTypeEnum
+import argparse
 import logging
 from copy import deepcopy
 from settings import SF_REQUIRED
-
+from helpers import (
+    read_param_lines,
+    get_model_factors,
+    sf_to_beta,
+    beta_to_pf,
+    get_pf_category,
+    parse_stix_filename,
+)
+from berm_search import search_berm, search_berm_2d
+from multi_scenario import clear_results, pack_models
+from prescreening import set_cheap_analysis, get_equivalent_sf, needs_full_analysis_sf
+from result_cache import ResultCache
+from results_store import ResultsStore, BERM, BERM_PRESCREEN
+from search_area import warm_start, is_on_edge, set_calculation_settings
+from journal import RunJournal
+import instrumentation
+from instrumentation import stage
+from workspace import ScratchWorkspace
+from scheduler import Scheduler, Job, JobResult, Submit, Wait, Cancel
+from console_driver import ConsoleExecutor
+from typing import Dict, List, Optional, Tuple
+import numpy as np
 
 PATH_TO_STIXFILES = "Y:\\Documents\\Klanten\\OneDrive\\WSBD\\calamiteiten\\StixFiles"
 PARAMETERS_FILE = "Y:\\Documents\\Klanten\\OneDrive\\WSBD\\calamiteiten\\StixFiles\\parameters_berm.csv"
@@ -15,6 +37,7 @@ LOG_FILE = "Y:\\Documents\\Klanten\\Output\\WSBD\\Bermen\\bermen.log"
 DSTABILITY_EXE = (
     "Y:\\Apps\\Deltares\\Consoles\\DStabilityConsole\\D-Stability Console.exe"
 )
+MAX_THREADS = 8  # het aantal berekeningen dat tegelijk uitgevoerd wordt
 
 
 SLOPE_TOP = 10
@@ -23,20 +46,445 @@ BERM_MATERIAAL = "Dijksmateriaal (klei)_K4_Su"
 SLOOT_MATERIAAL = "Dijksmateriaal (klei)_K4_Su"
 BERM_SECTIONS = 10  # de hoeveelheid bermen die we tussen min en max willen berekenen, hoe meer hoe langzamer maar ook nauwkeuriger
 
-# get the params from the csv file
-param_lines = [
-    l.strip() for l in open(PARAMETERS_FILE, "r").readlines() if l.strip() != ""
-][1:]
-
-logging.basicConfig(
-    filename=LOG_FILE,
-    filemode="w",
-    format="%(asctime)s %(levelname)s %(message)s",
-    datefmt="%H:%M:%S",
-    level=logging.INFO,
-)
+# "scan" berekent BERM_SECTIONS bermen tussen min en max
+# "bisect" zoekt de berm op de lijn tussen min en max met regula falsi / bisectie
+# "2d" zoekt per berm hoogte (vanaf zmin in stappen van BERM_HEIGHT_STEP) de benodigde breedte
+BERM_SEARCH = "scan"
+BERM_SEARCH_TOLERANCE = 0.25  # stop met zoeken als het verschil tussen de bermen kleiner is dan deze afstand [m]
+BERM_SEARCH_PARALLEL = 1  # het aantal bermen per zoekstap, 1 voor regula falsi, > 1 om meerdere cores te gebruiken
+BERM_HEIGHT_STEP = 0.5
+
+# resultaten van eerder berekende (identieke) modellen worden uit deze cache gehaald
+USE_RESULT_CACHE = True
+RESULT_CACHE_FILE = "Y:\\Documents\\Klanten\\Output\\WSBD\\Bermen\\result_cache.sqlite"
+RESULT_CACHE_MAX_SIZE = 500 * 1024 * 1024  # bytes
+
+# finished calculations are written to this journal, use --resume to continue a run
+JOURNAL_FILE = "Y:\\Documents\\Klanten\\Output\\WSBD\\Bermen\\journal.jsonl"
+
+# every calculated point is written to this database (see results_store.py)
+RESULTS_STORE_FILE = "Y:\\Documents\\Klanten\\Output\\WSBD\\Bermen\\results.sqlite"
+
+# write the stix files for the console to a local scratch directory (in SCRATCH_PATH or
+# the temp directory of the system if None) instead of CALCULATIONS_PATH, at the end
+# the calculated stix files are copied to CALCULATIONS_PATH in one step (if
+# COPY_BACK_CALCULATIONS) and the scratch directory is removed
+USE_SCRATCH = False
+SCRATCH_PATH = None
+COPY_BACK_CALCULATIONS = True
+
+# controleer het parameter bestand, de minimale / maximale berm en de gedempte sloot van
+# elke regel (zie preflight.py) voordat er gerekend wordt, bij fouten stopt de run
+PREFLIGHT = True
+
+# start de consoles vanuit een asyncio loop (zie console_driver.py) in plaats van een
+# blokkerend proces per console, een console die langer dan CONSOLE_TIMEOUT seconden
+# rekent wordt gestopt en mislukte berekeningen worden CONSOLE_RETRIES keer opnieuw
+# gestart (na CONSOLE_RETRY_DELAY seconden, verdubbeld bij elke volgende poging)
+USE_CONSOLE_DRIVER = False
+CONSOLE_TIMEOUT = 3600
+CONSOLE_RETRIES = 1
+CONSOLE_RETRY_DELAY = 10.0
+
+# duration, bytes read / written and peak memory per stage and model (see instrumentation.py)
+EVENTS_FILE = "Y:\\Documents\\Klanten\\Output\\WSBD\\Bermen\\stages.jsonl"
+
+# zet alle varianten van een stap (ini / min / max / ditch of de bermen) als scenario's
+# in een stix bestand zodat de console maar een keer per stap gestart hoeft te worden
+PACK_BERM_VARIANTS = False
+
+# start de tussenliggende bermen (BERM_SEARCH = "scan") tegelijk met ini / min / max / ditch
+# en annuleer ze zodra een van deze 4 de uitkomst al bepaalt
+SPECULATIVE_BERMS = False
+
+# bereken alle modellen eerst met Bishop brute force op een grof grid en alleen de
+# modellen met een (met de modelfactoren omgerekende) veiligheidsfactor binnen
+# PRESCREEN_SF_MARGIN van SF_REQUIRED met de originele analyse
+PRESCREENING = False
+PRESCREEN_GRID_POINTS = 5
+PRESCREEN_TANGENT_LINES = 5
+PRESCREEN_SF_MARGIN = 0.1
+
+# verklein het zoekgebied rond het glijvlak van de dichtstbijzijnde al berekende berm,
+# WARM_START_FACTOR is de grootte van het verkleinde gebied ten opzichte van het origineel,
+# als het nieuwe glijvlak op de rand van het verkleinde gebied ligt wordt de berm
+# opnieuw berekend met het originele zoekgebied
+WARM_START_SEARCH = False
+WARM_START_FACTOR = 0.5
+
+
+def create_berm_model(ds: DStability, name: str, **kwargs) -> DStability:
+    """Copy the model and apply AlgorithmBermWSBD with the given arguments to the copy
+
+    Args:
+        ds (DStability): the original model
+        name (str): the name of the new model (for the instrumentation)
+
+    Returns:
+        DStability: the model with the berm (or the filled ditch), raises an exception on errors
+    """
+    with stage("copy", name):
+        ds_berm = ds.copy(deep=True)
+    with stage("berm_geometry", name):
+        return AlgorithmBermWSBD(ds=ds_berm, **kwargs).execute()
+
+
+def create_jobs(filename: str, models: Dict[str, DStability]) -> List[Job]:
+    """Serialize the given models and create the jobs for the scheduler
+
+    Args:
+        filename (str): name of the original stix file
+        models (Dict[str, DStability]): the models to calculate by name
+
+    Returns:
+        List[Job]: the jobs, the results have the names of the models
+    """
+    jobs = []
+    if PACK_BERM_VARIANTS and len(models) > 1:
+        names = list(models.keys())
+        model_filename = (
+            Path(CALCULATIONS_PATH)
+            / f"{Path(filename).stem}_{names[0]}_{names[-1]}_packed.stix"
+        )
+        # the models are copies of the same model and share the current scenario
+        labels = pack_models(
+            {name: ds.model for name, ds in models.items()},
+            model_filename,
+            int(models[names[0]].model.current_scenario),
+        )
+        jobs.append(
+            Job(f"{Path(filename).stem}_packed", model_filename, scenarios=labels)
+        )
+    else:
+        for name, ds in models.items():
+            model_filename = (
+                Path(CALCULATIONS_PATH) / f"{Path(filename).stem}_{name}.stix"
+            )
+            clear_results(ds.model)
+            with stage("serialize", model_filename):
+                ds.model.serialize(model_filename)
+            jobs.append(Job(name, model_filename))
+    return jobs
+
+
+def collect_results(
+    filename: str,
+    job_results: Dict[str, JobResult],
+    store: Optional[ResultsStore] = None,
+    berms: Optional[Dict[str, Tuple[float, float]]] = None,
+    kind: str = BERM,
+) -> Dict[str, float]:
+    """Write the results to the store (as points of the given kind) and get the safety factor per name
+
+    Returns:
+        Dict[str, float]: the safety factor per name (only for the succesful calculations)
+    """
+    if store is not None:
+        store_berm_points(store, filename, job_results, berms, kind)
+    return {
+        name: job_result.factor_of_safety
+        for name, job_result in job_results.items()
+        if job_result.ok
+    }
+
+
+def calculate_models(
+    filename: str,
+    models: Dict[str, DStability],
+    store: Optional[ResultsStore] = None,
+    berms: Optional[Dict[str, Tuple[float, float]]] = None,
+    slip_planes: Optional[Dict[Tuple[float, float], Dict]] = None,
+):
+    """Serialize the given models and yield them as jobs for the scheduler
+
+    Args:
+        filename (str): name of the original stix file
+        models (Dict[str, DStability]): the models to calculate by name
+        store (Optional[ResultsStore], optional): store to write the results to. Defaults to None.
+        berms (Optional[Dict[str, Tuple[float, float]]], optional): the x, z of the berm per name (for the store). Defaults to None.
+        slip_planes (Optional[Dict[Tuple[float, float], Dict]], optional): the slip planes of the calculated berms by x, z, used and filled if WARM_START_SEARCH is set. Defaults to None.
+
+    Returns:
+        Dict[str, float]: the safety factor per name (only for the succesful calculations)
+    """
+    if PRESCREENING:
+        return (yield from prescreen_models(filename, models, store, berms))
+    if WARM_START_SEARCH and slip_planes is not None:
+        return (
+            yield from warm_started_models(filename, models, store, berms, slip_planes)
+        )
+
+    jobs = create_jobs(filename, models)
+    if len(jobs) == 0:
+        return {}
+
+    job_results = yield jobs
+    return collect_results(filename, job_results, store, berms)
+
+
+def warm_started_models(
+    filename: str,
+    models: Dict[str, DStability],
+    store: Optional[ResultsStore],
+    berms: Optional[Dict[str, Tuple[float, float]]],
+    slip_planes: Dict[Tuple[float, float], Dict],
+):
+    """Calculate the models with the search area narrowed around the slip plane of the nearest calculated berm
+
+    Models with a result on the edge of the narrowed search area are calculated again
+    with the original search area (as <name>_full). The slip planes of the calculated
+    berms are added to slip_planes.
+
+    Returns:
+        Dict[str, float]: the safety factor per name (only for the succesful calculations)
+    """
+    berms = {} if berms is None else berms
+    narrowed = {}
+    for name, ds in models.items():
+        if name not in berms or len(slip_planes) == 0:
+            continue
+        x, z = berms[name]
+        nearest = min(
+            slip_planes.keys(), key=lambda b: (b[0] - x) ** 2 + (b[1] - z) ** 2
+        )
+        original, settings = warm_start(
+            ds.model,
+            slip_planes[nearest],
+            WARM_START_FACTOR,
+            int(ds.model.current_scenario),
+        )
+        if settings is not None:
+            narrowed[name] = (original, settings)
+
+    jobs = create_jobs(filename, models)
+    if len(jobs) == 0:
+        return {}
+    job_results = yield jobs
+
+    full_models = {}
+    for name, (original, settings) in narrowed.items():
+        job_result = job_results.get(name)
+        if job_result is None or not job_result.ok:
+            continue
+        if is_on_edge(settings, job_result.slip_plane):
+            ds = models[name]
+            set_calculation_settings(ds.model, int(ds.model.current_scenario), original)
+            full_models[f"{name}_full"] = ds
+            del job_results[name]
+    result = collect_results(filename, job_results, store, berms)
+
+    if len(full_models) > 0:
+        logging.info(
+            f"The critical slip plane lies on the edge of the narrowed search area for {len(full_models)} model(s) of '{filename}', calculating them again with the original search area"
+        )
+        full_berms = {name: berms[name[: -len("_full")]] for name in full_models}
+        full_results = yield create_jobs(filename, full_models)
+        job_results.update(
+            {
+                name[: -len("_full")]: job_result
+                for name, job_result in full_results.items()
+            }
+        )
+        result.update(
+            {
+                name[: -len("_full")]: sf
+                for name, sf in collect_results(
+                    filename, full_results, store, full_berms
+                ).items()
+            }
+        )
 
-dsc = DSeriesCalculator()
+    for name, job_result in job_results.items():
+        if name in berms and job_result.ok and job_result.slip_plane is not None:
+            slip_planes[berms[name]] = job_result.slip_plane
+    return result
+
+
+def prescreen_models(
+    filename: str,
+    models: Dict[str, DStability],
+    store: Optional[ResultsStore] = None,
+    berms: Optional[Dict[str, Tuple[float, float]]] = None,
+):
+    """Calculate the models with the cheap analysis and only the models close to SF_REQUIRED with the full analysis
+
+    The safety factor of the cheap analysis is converted to the original analysis
+    using the model factors (see prescreening.py). The cheap results are stored as
+    BERM_PRESCREEN points so they are never taken for a calculated berm.
+
+    Returns:
+        Dict[str, float]: the (equivalent) safety factor per name (only for the succesful calculations)
+    """
+    dtcode = parse_stix_filename(filename)[0]
+    berms = {} if berms is None else berms
+
+    cheap_models, original_analysis_types = {}, {}
+    for name, ds in models.items():
+        with stage("copy", f"{filename}:{name}"):
+            ds_cheap = ds.copy(deep=True)
+        try:
+            original_analysis_type = set_cheap_analysis(
+                ds_cheap.model,
+                PRESCREEN_GRID_POINTS,
+                PRESCREEN_TANGENT_LINES,
+                int(ds_cheap.model.current_scenario),
+            )
+        except Exception as e:
+            logging.info(f"Cannot create the pre-screening model for '{name}', '{e}'.")
+            continue
+        if original_analysis_type != AnalysisTypeEnum.BISHOP_BRUTE_FORCE:
+            cheap_models[f"{name}_prescreen"] = ds_cheap
+            original_analysis_types[name] = original_analysis_type
+
+    result = {}
+    jobs = create_jobs(filename, cheap_models)
+    if len(jobs) > 0:
+        job_results = yield jobs
+        cheap_result = collect_results(
+            filename,
+            job_results,
+            store,
+            {f"{name}_prescreen": berms[name] for name in berms},
+            BERM_PRESCREEN,
+        )
+        for name, original_analysis_type in original_analysis_types.items():
+            if f"{name}_prescreen" not in cheap_result:
+                continue
+            sf = get_equivalent_sf(
+                cheap_result[f"{name}_prescreen"],
+                AnalysisTypeEnum(job_results[f"{name}_prescreen"].analysis_type),
+                original_analysis_type,
+            )
+            if not needs_full_analysis_sf(
+                [sf], SF_REQUIRED[dtcode], PRESCREEN_SF_MARGIN
+            )[0]:
+                result[name] = sf
+
+    full_models = {name: ds for name, ds in models.items() if name not in result}
+    logging.info(
+        f"Pre-screening '{filename}', {len(full_models)} of {len(models)} model(s) need the full analysis"
+    )
+    jobs = create_jobs(filename, full_models)
+    if len(jobs) > 0:
+        job_results = yield jobs
+        result.update(collect_results(filename, job_results, store, berms))
+    return result
+
+
+def store_berm_points(
+    store: ResultsStore,
+    filename: str,
+    job_results: Dict[str, JobResult],
+    berms: Optional[Dict[str, Tuple[float, float]]] = None,
+    kind: str = BERM,
+):
+    """Write the succesful calculations of the berm models to the results store"""
+    berms = {} if berms is None else berms
+    dtcode, start_chainage, end_chainage = parse_stix_filename(filename)
+    job_results = [job_result for job_result in job_results.values() if job_result.ok]
+    if len(job_results) == 0:
+        return
+
+    sfs = np.array([job_result.factor_of_safety for job_result in job_results])
+    model_factors = get_model_factors(
+        [job_result.analysis_type for job_result in job_results]
+    )
+    betas = sf_to_beta(sfs, model_factors)
+    pfs = beta_to_pf(betas)
+    categories = get_pf_category(pfs, dtcode)
+    store.add_points(
+        [
+            {
+                "kind": kind,
+                "trajectory": dtcode,
+                "start_chainage": start_chainage,
+                "end_chainage": end_chainage,
+                "filename": filename,
+                "name": job_result.name,
+                "berm_x": berms.get(job_result.name, (None, None))[0],
+                "berm_z": berms.get(job_result.name, (None, None))[1],
+                "factor_of_safety": float(sfs[i]),
+                "model_factor": float(model_factors[i]),
+                "beta": float(betas[i]),
+                "pf": float(pfs[i]),
+                "category": str(categories[i]),
+                "analysis_type": job_result.analysis_type,
+                "runtime": job_result.runtime,
+            }
+            for i, job_result in enumerate(job_results)
+        ]
+    )
+
+
+def calculate_berms(
+    ds: DStability,
+    filename: str,
+    points: List[Tuple[float, float]],
+    store: Optional[ResultsStore] = None,
+    slip_planes: Optional[Dict[Tuple[float, float], Dict]] = None,
+):
+    """Create the berms with the given top right corners and yield them as jobs for the scheduler
+
+    Args:
+        ds (DStability): the original model
+        filename (str): name of the original stix file
+        points (List[Tuple[float, float]]): the x, z coordinates of the top right corner of the berms
+        store (Optional[ResultsStore], optional): store to write the results to. Defaults to None.
+        slip_planes (Optional[Dict[Tuple[float, float], Dict]], optional): the slip planes of the calculated berms (see calculate_models). Defaults to None.
+
+    Returns:
+        List[Optional[float]]: the safety factor per berm or None if the berm could not be created or calculated
+    """
+    models = {}
+    names = []
+    berms = {}
+    for x, z in points:
+        name = f"berm_x{x:.2f}_z{z:.2f}"
+        berms[name] = (x, z)
+        try:
+            models[name] = create_berm_model(
+                ds,
+                f"{filename}:{name}",
+                soilcode=BERM_MATERIAAL,
+                fixed_x=x,
+                fixed_z=z,
+                slope_bottom=SLOPE_BOTTOM,
+                slope_top=SLOPE_TOP,
+            )
+            names.append(name)
+        except Exception as e:
+            logging.info(f"Error creating berm with x={x:.2f} and z={z:.2f}, '{e}'.")
+            names.append(None)
+
+    logging.info(f"Started {len(models)} calculations for '{filename}'...")
+    result = yield from calculate_models(filename, models, store, berms, slip_planes)
+    for (x, z), name in zip(points, names):
+        if name in result:
+            logging.info(
+                f"Veiligheidsfactor bij berm met x={x:.2f} en z={z:.2f}: {result[name]:.3f}"
+            )
+    return [result.get(name) if name is not None else None for name in names]
+
+
+def run_berm_search(
+    ds: DStability,
+    filename: str,
+    search,
+    store: Optional[ResultsStore] = None,
+    slip_planes: Optional[Dict[Tuple[float, float], Dict]] = None,
+):
+    """Calculate the berms requested by a berm search (see berm_search.py)
+
+    Returns:
+        Optional[Tuple[float, float, float]]: the solution of the search
+    """
+    try:
+        points = next(search)
+        while True:
+            sfs = yield from calculate_berms(ds, filename, points, store, slip_planes)
+            points = search.send(sfs)
+    except StopIteration as e:
+        return e.value
 
 
 # def calculate_sf(filename, result):
@@ -54,8 +502,116 @@ dsc = DSeriesCalculator()
 #     logging.info(msg)
 
 
-# handle all files
-for param_line in param_lines:
+def log_result(name: str, result: Dict[str, float]):
+    """Log the safety factor of the initial model, the min / max berm or the filled ditch"""
+    label = {
+        "ini": "Initiele veiligheidsfactor",
+        "min": "Veiligheidsfactor bij minimale berm",
+        "max": "Veiligheidsfactor bij maximale berm",
+        "ditch": "Veiligheidsfactor bij gedempte sloot",
+    }[name]
+    logging.info(f"{label}: {result[name]:.3f}")
+
+
+def is_decided(name: str, result: Dict[str, float], dtcode: str) -> bool:
+    """Check if the result of the initial model, the min / max berm or the filled ditch decides the outcome
+
+    Args:
+        name (str): ini, min, max or ditch
+        result (Dict[str, float]): the safety factors by name
+        dtcode (str): dike trajectory code like 34-1
+
+    Returns:
+        bool: True if no intermediate berms need to be calculated
+    """
+    if name == "ini" and result["ini"] >= SF_REQUIRED[dtcode]:
+        logging.info(
+            f"De initiele veiligheidsfactor ({result['ini']:.3f}) voldoet al aan de vereiste veiligheidsfactor ({SF_REQUIRED[dtcode]})."
+        )
+        return True
+    if name == "min" and result["min"] >= SF_REQUIRED[dtcode]:
+        logging.info(
+            f"De veiligheidsfactor bij de minimale berm ({result['min']:.3f}) voldoet aan de vereiste veiligheidsfactor ({SF_REQUIRED[dtcode]})."
+        )
+        return True
+    if name == "max" and result["max"] < SF_REQUIRED[dtcode]:
+        logging.info(
+            f"De veiligheidsfactor bij de maximale berm ({result['max']:.3f}) voldoet niet aan de vereiste veiligheidsfactor ({SF_REQUIRED[dtcode]}). Geen oplossing voor deze berekening."
+        )
+        return True
+    if name == "ditch" and result["ditch"] >= SF_REQUIRED[dtcode]:
+        logging.info(
+            f"De veiligheidsfactor bij het dempen van de sloot ({result['ditch']:.3f}) voldoet aan de vereiste veiligheidsfactor ({SF_REQUIRED[dtcode]})."
+        )
+        return True
+    return False
+
+
+def create_scan_models(
+    ds: DStability, dtcode: str, xmin: float, zmin: float, xmax: float, zmax: float
+) -> Tuple[Dict[str, DStability], Dict[str, Tuple[float, float]]]:
+    """Create the BERM_SECTIONS berms between the minimum and maximum berm
+
+    Returns:
+        Tuple[Dict[str, DStability], Dict[str, Tuple[float, float]]]: the models and the x, z of the berms by name
+    """
+    # note that we use our own multithreading code because the current geolib solution is not that nice...
+    x = xmin
+    z = zmin
+    xstep = (xmax - xmin) / (BERM_SECTIONS + 1)
+    zstep = (zmax - zmin) / (BERM_SECTIONS + 1)
+    models = {}
+    berms = {}
+    for i in range(BERM_SECTIONS):
+        x += xstep
+        z += zstep
+        xr = round(x, 2)
+        zr = round(z, 2)
+
+        try:
+            models[f"{dtcode}_berm_{i:0d}"] = create_berm_model(
+                ds,
+                f"{dtcode}_berm_{i:0d}",
+                soilcode=BERM_MATERIAAL,
+                fixed_x=xr,
+                fixed_z=zr,
+                slope_bottom=SLOPE_BOTTOM,
+                slope_top=SLOPE_TOP,
+            )
+            berms[f"{dtcode}_berm_{i:0d}"] = (xr, zr)
+        except Exception as e:
+            logging.info(f"Error creating berm with x={xr:.2f} and z={zr:.2f}, '{e}'.")
+            continue
+    return models, berms
+
+
+def log_scan_result(result: Dict[str, float], dtcode: str):
+    """Log the first scan berm that meets the required safety factor"""
+    result = sorted([(k, v) for k, v in result.items()], key=lambda x: x[0])
+    result = [r for r in result if r[1] > SF_REQUIRED[dtcode]]
+    if len(result) == 0:
+        logging.error("Geen enkele berm voldoet aan de vereiste veiligheid")
+    else:
+        logging.info(
+            f"De berekening '{result[0][0]}' met een veiligheidsfactor van {result[0][1]:.3f} voldoet aan de vereiste veiligheid"
+        )
+
+
+def berm_section(
+    param_line: str, store: Optional[ResultsStore] = None, resume: bool = False
+):
+    """Determine the berm for one line of the parameter file
+
+    This is a section for the scheduler, it yields the jobs to calculate and
+    gets the results sent back.
+
+    Args:
+        param_line (str): line from the parameter file (filename,xmin,zmin,xmax,zmax)
+        store (Optional[ResultsStore], optional): store to write the calculated points to. Defaults to None.
+        resume (bool, optional): keep the points of the stix file from the previous run, else they are removed from the store first. Defaults to False.
+    """
+    # the filename is used in the error message if the line cannot be parsed
+    filename = param_line.split(",")[0].strip()
     try:
         filename, xmin, zmin, xmax, zmax = [p.strip() for p in param_line.split(",")]
         xmin = float(xmin)
@@ -67,6 +623,12 @@ for param_line in param_lines:
         logging.error(
             f"Invalid parameter line '{param_line}' or invalid filename '{filename}' (should be <dijkcode>_<van>-<tot>.stix), got error '{e}'"
         )
+        return
+
+    # points of an earlier run might have other berms
+    if store is not None and not resume:
+        store.delete_points(BERM, filename)
+        store.delete_points(BERM_PRESCREEN, filename)
 
     logging.info(f"Automatische bermbepaling voor bestand {filename}")
     logging.info(
@@ -74,137 +636,251 @@ for param_line in param_lines:
     )
     logging.info(f"Benodigde veiligheidsfactor: {SF_REQUIRED[dtcode]}")
 
-    ds = DStability.from_stix(Path(PATH_TO_STIXFILES) / dtcode / filename)
+    with stage("parse", filename):
+        ds = DStability.from_stix(Path(PATH_TO_STIXFILES) / dtcode / filename)
 
-    ds_initial = ds.copy(deep=True)
-    dsc.add_model(ds_initial, "ini")
+    models = {}
+    with stage("copy", f"{filename}:ini"):
+        models["ini"] = ds.copy(deep=True)
 
-    ds_min_berm = ds.copy(deep=True)
-    alg_min = AlgorithmBermWSBD(
-        ds=ds_min_berm,
-        soilcode=BERM_MATERIAAL,
-        fixed_x=xmin,
-        fixed_z=zmin,
-        slope_bottom=SLOPE_BOTTOM,
-        slope_top=SLOPE_TOP,
-    )
     try:
-        ds_min_berm = alg_min.execute()
+        ds_min_berm = create_berm_model(
+            ds,
+            f"{filename}:min",
+            soilcode=BERM_MATERIAAL,
+            fixed_x=xmin,
+            fixed_z=zmin,
+            slope_bottom=SLOPE_BOTTOM,
+            slope_top=SLOPE_TOP,
+        )
     except Exception as e:
         logging.info(
             f"Error creating minimal berm with x={xmin:.2f} and z={zmin:.2f}, '{e}'."
         )
-        continue
+        return
 
     # ds_min_berm.serialize(Path(CALCULATIONS_PATH) / "min.stix")
-    dsc.add_model(ds_min_berm, "min")
-
-    ds_max_berm = ds.copy(deep=True)
-    alg_max = AlgorithmBermWSBD(
-        ds=ds_max_berm,
-        soilcode=BERM_MATERIAAL,
-        fixed_x=xmax,
-        fixed_z=zmax,
-        slope_bottom=SLOPE_BOTTOM,
-        slope_top=SLOPE_TOP,
-    )
+    models["min"] = ds_min_berm
+
     try:
-        ds_max_berm = alg_max.execute()
+        ds_max_berm = create_berm_model(
+            ds,
+            f"{filename}:max",
+            soilcode=BERM_MATERIAAL,
+            fixed_x=xmax,
+            fixed_z=zmax,
+            slope_bottom=SLOPE_BOTTOM,
+            slope_top=SLOPE_TOP,
+        )
     except Exception as e:
         logging.info(
             f"Error creating maximum berm with x={xmax:.2f} and z={zmax:.2f}, '{e}'."
         )
-        continue
+        return
 
-    dsc.add_model(ds_max_berm, "max")
+    models["max"] = ds_max_berm
 
-    ds_filled_ditch = ds.copy(deep=True)
-    alg_fill_ditch = AlgorithmBermWSBD(
-        ds=ds_filled_ditch,
-        fill_ditch=True,
-        ditch_soilcode=SLOOT_MATERIAAL,
-    )
     try:
-        ds_filled_ditch = alg_fill_ditch.execute()
+        ds_filled_ditch = create_berm_model(
+            ds, f"{filename}:ditch", fill_ditch=True, ditch_soilcode=SLOOT_MATERIAAL
+        )
     except Exception as e:
         logging.info(f"Error filling ditch, '{e}'.")
-        continue
+        return
 
-    dsc.add_model(ds_filled_ditch, "ditch")
+    models["ditch"] = ds_filled_ditch
 
-    # calculate these 4
-    dsc.calculate()
+    berms = {"min": (xmin, zmin), "max": (xmax, zmax)}
+    if SPECULATIVE_BERMS and BERM_SEARCH == "scan":
+        # start the scan berms together with these 4 and cancel them if one of
+        # these 4 already decides the outcome
+        scan_models, scan_berms = create_scan_models(ds, dtcode, xmin, zmin, xmax, zmax)
+        yield Submit(create_jobs(filename, models))
+        yield Submit(create_jobs(filename, scan_models))
+        logging.info(
+            f"Started {len(models)} calculations and {len(scan_models)} speculative berm calculations..."
+        )
 
-    result = dsc.get_model_result_dict()
+        # handle the results of these 4 as they come in, the speculative berms are
+        # cancelled as soon as one of them decides the outcome, the others are still
+        # collected for the store
+        result = {}
+        remaining = list(models.keys())
+        decided = False
+        while len(remaining) > 0:
+            job_results = yield Wait(remaining, any_of=True)
+            result.update(collect_results(filename, job_results, store, berms))
+            for name in [name for name in remaining if name in job_results]:
+                remaining.remove(name)
+                if name not in result:
+                    logging.error(f"Could not calculate ['{name}'] for '{filename}'.")
+                    yield Cancel(list(scan_models.keys()) + remaining)
+                    return
+                log_result(name, result)
+                if not decided and is_decided(name, result, dtcode):
+                    yield Cancel(list(scan_models.keys()))
+                    decided = True
+        if decided:
+            return
 
-    logging.info(f"Initiele veiligheidsfactor: {result['ini']:.3f}")
-    logging.info(f"Veiligheidsfactor bij minimale berm:  {result['min']:.3f}")
-    logging.info(f"Veiligheidsfactor bij maximale berm:  {result['max']:.3f}")
-    logging.info(f"Veiligheidsfactor bij gedempte sloot:  {result['ditch']:.3f}")
+        job_results = yield Wait(list(scan_models.keys()))
+        result = collect_results(filename, job_results, store, scan_berms)
+        log_scan_result(result, dtcode)
+        return
 
-    if result["ini"] >= SF_REQUIRED[dtcode]:
-        logging.info(
-            f"De initiele veiligheidsfactor ({result['ini']:.3f}) voldoet al aan de vereiste veiligheidsfactor ({SF_REQUIRED[dtcode]})."
-        )
-        continue
-    if result["min"] >= SF_REQUIRED[dtcode]:
-        logging.info(
-            f"De veiligheidsfactor bij de minimale berm ({result['min']:.3f}) voldoet aan de vereiste veiligheidsfactor ({SF_REQUIRED[dtcode]})."
-        )
-        continue
-    if result["max"] < SF_REQUIRED[dtcode]:
-        logging.info(
-            f"De veiligheidsfactor bij de maximale berm ({result['min']:.3f}) voldoet niet aan de vereiste veiligheidsfactor ({SF_REQUIRED[dtcode]}). Geen oplossing voor deze berekening."
-        )
-        continue
-    if result["ditch"] >= SF_REQUIRED[dtcode]:
-        logging.info(
-            f"De veiligheidsfactor bij het dempen van de sloot ({result['min']:.3f}) voldoet aan de vereiste veiligheidsfactor ({SF_REQUIRED[dtcode]})."
+    # the slip planes of the calculated berms to narrow the search area of the next berms
+    slip_planes = {} if WARM_START_SEARCH else None
+
+    # calculate these 4
+    result = yield from calculate_models(filename, models, store, berms, slip_planes)
+    if len(result) < len(models):
+        logging.error(
+            f"Could not calculate {[name for name in models if name not in result]} for '{filename}'."
         )
-        continue
+        return
+
+    for name in models.keys():
+        log_result(name, result)
+    for name in models.keys():
+        if is_decided(name, result, dtcode):
+            return
 
-    dsc.clear()
+    if BERM_SEARCH in ["bisect", "2d"]:
+        if BERM_SEARCH == "bisect":
+            search = search_berm(
+                (xmin, zmin),
+                (xmax, zmax),
+                result["min"],
+                result["max"],
+                SF_REQUIRED[dtcode],
+                BERM_SEARCH_TOLERANCE,
+                parallel=BERM_SEARCH_PARALLEL,
+            )
+        else:
+            heights = [
+                round(zmin + i * BERM_HEIGHT_STEP, 2)
+                for i in range(int((zmax - zmin) / BERM_HEIGHT_STEP) + 1)
+            ]
+            if heights[-1] < zmax:
+                heights.append(zmax)
+            search = search_berm_2d(
+                xmin,
+                xmax,
+                heights,
+                SF_REQUIRED[dtcode],
+                BERM_SEARCH_TOLERANCE,
+                parallel=BERM_SEARCH_PARALLEL,
+                known={(xmin, zmin): result["min"], (xmax, zmax): result["max"]},
+            )
+        solution = yield from run_berm_search(ds, filename, search, store, slip_planes)
+
+        if solution is None:
+            logging.error("Geen enkele berm voldoet aan de vereiste veiligheid")
+        else:
+            logging.info(
+                f"De berm met x={solution[0]:.2f} en z={solution[1]:.2f} met een veiligheidsfactor van {solution[2]:.3f} voldoet aan de vereiste veiligheid"
+            )
+        return
 
     # apperently we have no solution yet but now we can interpolate between min and max
-    # note that we use our own multithreading code because the current geolib solution is not that nice...
-    x = xmin
-    z = zmin
-    xstep = (xmax - xmin) / (BERM_SECTIONS + 1)
-    zstep = (zmax - zmin) / (BERM_SECTIONS + 1)
-    threads = []
-    result = {}
-    for i in range(BERM_SECTIONS):
-        x += xstep
-        z += zstep
-        xr = round(x, 2)
-        zr = round(z, 2)
+    models, berms = create_scan_models(ds, dtcode, xmin, zmin, xmax, zmax)
+    logging.info(f"Started {len(models)} calculations...")
+    result = yield from calculate_models(filename, models, store, berms, slip_planes)
+    log_scan_result(result, dtcode)
 
-        ds_berm = ds.copy(deep=True)
-        alg_berm = AlgorithmBermWSBD(
-            ds=ds_berm,
-            soilcode=BERM_MATERIAAL,
-            fixed_x=xr,
-            fixed_z=zr,
-            slope_bottom=SLOPE_BOTTOM,
-            slope_top=SLOPE_TOP,
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Determine the berms of all lines in the parameter file"
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="continue the previous run, calculations in the journal are not calculated again",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="profile the python side stages with cProfile (written to EVENTS_FILE.prof)",
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        filename=LOG_FILE,
+        filemode="a" if args.resume else "w",
+        format="%(asctime)s %(levelname)s %(message)s",
+        datefmt="%H:%M:%S",
+        level=logging.INFO,
+    )
+    instrumentation.enable(EVENTS_FILE, profile=args.profile)
+
+    if PREFLIGHT:
+        # preflight.py imports this script, import it here to avoid a circular import
+        from preflight import run_preflight
+
+        report = run_preflight(
+            berm_parameters_file=PARAMETERS_FILE, nprocesses=MAX_THREADS
         )
-        try:
-            ds_berm = alg_berm.execute()
-            dsc.add_model(ds_berm, f"{dtcode}_berm_{i:0d}")
-        except Exception as e:
-            logging.info(f"Error creating berm with x={xr:.2f} and z={zr:.2f}, '{e}'.")
-            continue
+        report.log()
+        if not report.ok:
+            instrumentation.close()
+            return
 
-    logging.info(f"Started {len(threads)} calculations...")
-    dsc.calculate()
+    global CALCULATIONS_PATH
+    workspace = (
+        ScratchWorkspace(CALCULATIONS_PATH, SCRATCH_PATH) if USE_SCRATCH else None
+    )
+    if workspace is not None:
+        CALCULATIONS_PATH = str(workspace.path)
 
-    result = dsc.get_model_result_dict()
-    result = sorted([(k, v) for k, v in result.items()], key=lambda x: x[0])
-    result = [r for r in result if r[1] > SF_REQUIRED[dtcode]]
-    if len(result) == 0:
-        logging.error("Geen enkele berm voldoet aan de vereiste veiligheid")
-    else:
+    # get the params from the csv file
+    param_lines = read_param_lines(PARAMETERS_FILE)
+
+    result_cache = (
+        ResultCache(RESULT_CACHE_FILE, max_size=RESULT_CACHE_MAX_SIZE)
+        if USE_RESULT_CACHE
+        else None
+    )
+
+    # handle all files, the calculations of all files share the same processes
+    journal = RunJournal(JOURNAL_FILE, resume=args.resume)
+    store = ResultsStore(RESULTS_STORE_FILE)
+
+    executor = (
+        ConsoleExecutor(
+            MAX_THREADS, CONSOLE_TIMEOUT, CONSOLE_RETRIES, CONSOLE_RETRY_DELAY
+        )
+        if USE_CONSOLE_DRIVER
+        else None
+    )
+    scheduler = Scheduler(
+        DSTABILITY_EXE,
+        MAX_THREADS,
+        cache=result_cache,
+        journal=journal,
+        executor=executor,
+    )
+    try:
+        scheduler.run(
+            berm_section(param_line, store, args.resume) for param_line in param_lines
+        )
+    finally:
+        if workspace is not None:
+            workspace.close(copy_back=COPY_BACK_CALCULATIONS)
+            CALCULATIONS_PATH = workspace.target
+
+    if result_cache is not None:
         logging.info(
-            f"De berekening '{result[0][0]}' met een veiligheidsfactor van {result[0][1]:.3f} voldoet aan de vereiste veiligheid"
+            f"Result cache hits: {result_cache.hits}, misses: {result_cache.misses}"
         )
-    dsc.export_files(CALCULATIONS_PATH)
+        result_cache.close()
+
+    journal.close()
+    store.close()
+
+    instrumentation.log_summary()
+    instrumentation.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+from math import hypot
+from typing import Dict, Generator, List, Optional, Tuple
+
+# the searches are generators that yield the berms they need, given by the (x, z)
+# coordinate of the top right corner, and expect the safety factor per berm (or None
+# if the berm could not be created or calculated) to be sent back, the solution is
+# the return value of the generator so use it like
+#
+# solution = yield from search_berm(...)
+#
+BermSearch = Generator[
+    List[Tuple[float, float]],
+    List[Optional[float]],
+    Optional[Tuple[float, float, float]],
+]
+
+
+def search_berm(
+    start: Tuple[float, float],
+    end: Tuple[float, float],
+    sf_start: float,
+    sf_end: float,
+    sf_required: float,
+    tolerance: float,
+    parallel: int = 1,
+    max_rounds: int = 20,
+) -> BermSearch:
+    """Find the smallest berm on the line from start to end that meets the required safety factor
+
+    The safety factor is assumed to increase with the position along the line so the
+    required safety factor can be bracketed between the start (failing) and end (passing)
+    berm. With parallel = 1 the bracket is narrowed using regula falsi steps with a
+    bisection fallback, with parallel > 1 each round evaluates parallel berms that split
+    the bracket in equal parts so the available cores are used.
+
+    Args:
+        start (Tuple[float, float]): x, z of the smallest berm
+        end (Tuple[float, float]): x, z of the largest berm
+        sf_start (float): safety factor of the smallest berm
+        sf_end (float): safety factor of the largest berm
+        sf_required (float): the required safety factor
+        tolerance (float): stop if the distance between the failing and passing berm is less than this value [m]
+        parallel (int, optional): number of berms to calculate per round. Defaults to 1.
+        max_rounds (int, optional): maximum number of rounds. Defaults to 20.
+
+    Returns:
+        Optional[Tuple[float, float, float]]: x, z and safety factor of the smallest passing berm or None if the end berm does not pass
+    """
+    if sf_start >= sf_required:
+        return (start[0], start[1], sf_start)
+    if sf_end < sf_required:
+        return None
+
+    length = hypot(end[0] - start[0], end[1] - start[1])
+
+    def point(t: float) -> Tuple[float, float]:
+        return (
+            round(start[0] + t * (end[0] - start[0]), 2),
+            round(start[1] + t * (end[1] - start[1]), 2),
+        )
+
+    lo, sf_lo = 0.0, sf_start
+    hi, sf_hi = 1.0, sf_end
+    last_moved = []
+
+    for _ in range(max_rounds):
+        width = hi - lo
+        if width * length <= tolerance:
+            break
+
+        if parallel > 1:
+            ts = [lo + i * width / (parallel + 1) for i in range(1, parallel + 1)]
+        elif len(last_moved) >= 2 and last_moved[-1] == last_moved[-2]:
+            # regula falsi got stuck on one side of the bracket, bisect instead
+            ts = [lo + 0.5 * width]
+        else:
+            t = lo + (sf_required - sf_lo) / (sf_hi - sf_lo) * width
+            ts = [min(max(t, lo + 0.05 * width), hi - 0.05 * width)]
+
+        sfs = yield [point(t) for t in ts]
+        evaluated = [(t, sf) for t, sf in zip(ts, sfs) if sf is not None]
+        if len(evaluated) == 0:
+            break
+
+        passing = [(t, sf) for t, sf in evaluated if sf >= sf_required]
+        if len(passing) > 0 and passing[0][0] < hi:
+            hi, sf_hi = passing[0]
+            last_moved.append("hi")
+        failing = [(t, sf) for t, sf in evaluated if sf < sf_required and t < hi]
+        if len(failing) > 0 and failing[-1][0] > lo:
+            lo, sf_lo = failing[-1]
+            last_moved.append("lo")
+
+    x, z = point(hi) if hi < 1.0 else end
+    return (x, z, sf_hi)
+
+
+def search_berm_2d(
+    xmin: float,
+    xmax: float,
+    heights: List[float],
+    sf_required: float,
+    tolerance: float,
+    parallel: int = 1,
+    known: Optional[Dict[Tuple[float, float], float]] = None,
+) -> BermSearch:
+    """Find the berm by increasing the height until the required safety factor can be met
+
+    For every height (starting with the lowest) the narrowest (xmin) and widest (xmax)
+    berm are calculated. If the required safety factor lies between the two the berm
+    width is found using search_berm, if not the next height is tried.
+
+    Args:
+        xmin (float): x coordinate of the narrowest berm
+        xmax (float): x coordinate of the widest berm
+        heights (List[float]): the (ascending) berm heights to try
+        sf_required (float): the required safety factor
+        tolerance (float): stop if the distance between the failing and passing berm is less than this value [m]
+        parallel (int, optional): number of berms to calculate per round. Defaults to 1.
+        known (Optional[Dict[Tuple[float, float], float]], optional): already calculated safety factors per (x, z). Defaults to None.
+
+    Returns:
+        Optional[Tuple[float, float, float]]: x, z and safety factor of the berm or None if no height leads to a solution
+    """
+    known = {} if known is None else dict(known)
+
+    for z in heights:
+        points = [p for p in [(xmin, z), (xmax, z)] if p not in known]
+        if len(points) > 0:
+            sfs = yield points
+            for p, sf in zip(points, sfs):
+                known[p] = sf
+
+        sf_narrow, sf_wide = known[(xmin, z)], known[(xmax, z)]
+        if sf_narrow is None or sf_wide is None:
+            continue
+        if sf_narrow >= sf_required:
+            return (xmin, z, sf_narrow)
+        if sf_wide >= sf_required:
+            return (
+                yield from search_berm(
+                    (xmin, z),
+                    (xmax, z),
+                    sf_narrow,
+                    sf_wide,
+                    sf_required,
+                    tolerance,
+                    parallel=parallel,
+                )
+            )
+
+    return None
@@ -0,0 +1,269 @@
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+from pathlib import Path
+from typing import AsyncIterator, Callable, Dict, Iterable, List, Optional, Tuple
+
+from instrumentation import PeakRssSampler, Recorder
+from scheduler import (
+    Job,
+    JobResult,
+    get_console_command,
+    get_error_results,
+    read_job_results,
+    run_job,
+)
+
+# runs the DStability console as asyncio subprocesses instead of one blocking
+# subprocess.run per worker process, every console run has a wall clock timeout after
+# which the console is killed and failed runs (timeout, crash or unreadable result) are
+# retried a limited number of times with an increasing delay
+#
+# use the ConsoleDriver directly to get the results as they come in;
+#
+# driver = ConsoleDriver(DSTABILITY_EXE, 8, timeout=600, retries=2)
+# async for job, results in driver.results(jobs):
+#     ...
+#
+# or the ConsoleExecutor as the executor of the Scheduler (see scheduler.py)
+
+
+class ConsoleDriver:
+    """Run jobs with the DStability console with a limited number of consoles at a time
+
+    Args:
+        console (str): path to the DStability console executable (or a python script like fake_console.py)
+        concurrency (int): the maximum number of consoles that run at the same time
+        timeout (Optional[float], optional): kill the console after this many seconds (no limit if None). Defaults to None.
+        retries (int, optional): the number of times a failed run is retried. Defaults to 0.
+        backoff (float, optional): the delay before the first retry, doubled for every next retry [s]. Defaults to 1.0.
+        parse_pool (Optional[Executor], optional): the pool to read the results in (the default executor of the loop if None). Defaults to None.
+    """
+
+    def __init__(
+        self,
+        console: str,
+        concurrency: int,
+        timeout: Optional[float] = None,
+        retries: int = 0,
+        backoff: float = 1.0,
+        parse_pool: Optional[Executor] = None,
+    ):
+        self.console = console
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.parse_pool = parse_pool
+        self.num_timeouts = 0
+        self.num_retries = 0
+        self._semaphore = None
+
+    async def _run_console(self, job: Job, recorder: Recorder) -> Optional[str]:
+        """Run the console once for the job
+
+        Returns:
+            Optional[str]: the error (timeout or exit code) or None if the console finished
+        """
+        with recorder.stage("console", job.filename, child_processes=True) as event:
+            event["bytes_read"] = Path(job.filename).stat().st_size
+            process = await asyncio.create_subprocess_exec(
+                *get_console_command(self.console),
+                job.filename,
+                stdout=asyncio.subprocess.DEVNULL,
+                stderr=asyncio.subprocess.DEVNULL,
+            )
+            sampler = PeakRssSampler(process.pid)
+            try:
+                returncode = await asyncio.wait_for(process.wait(), self.timeout)
+            except asyncio.TimeoutError:
+                process.kill()
+                await process.wait()
+                self.num_timeouts += 1
+                event["error"] = "timeout"
+                return f"the console did not finish within {self.timeout} seconds"
+            except asyncio.CancelledError:
+                process.kill()
+                await process.wait()
+                raise
+            finally:
+                event["peak_rss"] = sampler.stop()
+            event["bytes_written"] = Path(job.filename).stat().st_size
+        if returncode != 0:
+            return f"the console stopped with exit code {returncode}"
+        return None
+
+    async def run(
+        self, job: Job, on_start: Optional[Callable[[], bool]] = None
+    ) -> List[JobResult]:
+        """Calculate the job (with retries) and read the result(s)
+
+        The stix file is restored to its original content before every retry because a
+        killed console might have left a partially written file behind.
+
+        Args:
+            job (Job): the job to calculate
+            on_start (Optional[Callable[[], bool]], optional): called when the first console is about to start, the job is skipped if it returns False. Defaults to None.
+
+        Returns:
+            List[JobResult]: the result of the calculation or the results per scenario (empty if skipped)
+        """
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+
+        recorder = Recorder()
+        start = time.time()
+        original = None
+        error = ""
+        for attempt in range(self.retries + 1):
+            if attempt > 0:
+                self.num_retries += 1
+                delay = self.backoff * 2 ** (attempt - 1)
+                logging.warning(
+                    f"Retrying '{job.filename}' in {delay:.1f} seconds (attempt {attempt + 1} of {self.retries + 1}); '{error}'"
+                )
+                await asyncio.sleep(delay)
+                Path(job.filename).write_bytes(original)
+
+            async with self._semaphore:
+                if attempt == 0 and on_start is not None and not on_start():
+                    return []
+                if attempt == 0 and self.retries > 0:
+                    original = Path(job.filename).read_bytes()
+                try:
+                    error = await self._run_console(job, recorder)
+                except OSError as e:
+                    error = f"cannot start the console; '{e}'"
+            if error is not None:
+                continue
+
+            runtime = time.time() - start
+            try:
+                results, events = await asyncio.get_running_loop().run_in_executor(
+                    self.parse_pool, _read_job_results, job, runtime
+                )
+            except Exception as e:
+                error = f"cannot read the result; '{e}'"
+                continue
+            recorder.events += events
+            results[0].events = recorder.events
+            return results
+
+        return get_error_results(job, time.time() - start, error, recorder.events)
+
+    async def results(
+        self, jobs: Iterable[Job]
+    ) -> AsyncIterator[Tuple[Job, List[JobResult]]]:
+        """Calculate the jobs and yield the job and its results as soon as a job is finished"""
+        tasks = {}
+        for job in jobs:
+            task = asyncio.ensure_future(self.run(job))
+            tasks[task] = job
+        try:
+            while len(tasks) > 0:
+                done, _ = await asyncio.wait(
+                    tasks.keys(), return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    yield tasks.pop(task), task.result()
+        finally:
+            # the consumer stopped early, kill the remaining consoles
+            for task in tasks:
+                task.cancel()
+            if len(tasks) > 0:
+                await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def _read_job_results(job: Job, runtime: float) -> Tuple[List[JobResult], List[Dict]]:
+    """Read the results of the job with its own recorder (runs in the parse pool)"""
+    recorder = Recorder()
+    with recorder.stage("result_parse", job.filename):
+        results = read_job_results(job, runtime)
+    return results, recorder.events
+
+
+class ConsoleExecutor(Executor):
+    """An executor for the Scheduler that runs the jobs with a ConsoleDriver
+
+    The consoles are started from an asyncio loop in a background thread and the results
+    are read in a pool of processes. Only run_job can be submitted (as the Scheduler
+    does), submit(run_job, console, job) returns a future with the results. Jobs that
+    have not started a console yet can be cancelled.
+
+    Args:
+        concurrency (int): the maximum number of consoles that run at the same time
+        timeout (Optional[float], optional): kill the console after this many seconds (no limit if None). Defaults to None.
+        retries (int, optional): the number of times a failed run is retried. Defaults to 0.
+        backoff (float, optional): the delay before the first retry, doubled for every next retry [s]. Defaults to 1.0.
+    """
+
+    def __init__(
+        self,
+        concurrency: int,
+        timeout: Optional[float] = None,
+        retries: int = 0,
+        backoff: float = 1.0,
+    ):
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self._parse_pool = ProcessPoolExecutor(max_workers=concurrency)
+        self._drivers = {}  # console -> ConsoleDriver
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+        self._thread.start()
+
+    def _get_driver(self, console: str) -> ConsoleDriver:
+        if console not in self._drivers:
+            self._drivers[console] = ConsoleDriver(
+                console,
+                self.concurrency,
+                self.timeout,
+                self.retries,
+                self.backoff,
+                self._parse_pool,
+            )
+        return self._drivers[console]
+
+    def submit(self, fn, /, *args, **kwargs) -> Future:
+        if fn is not run_job:
+            raise TypeError("The ConsoleExecutor can only run scheduler.run_job")
+        console, job = args
+        driver = self._get_driver(console)
+        future = Future()
+
+        async def run():
+            # a future that is cancelled before its console starts is not calculated
+            try:
+                results = await driver.run(job, future.set_running_or_notify_cancel)
+            except Exception as e:
+                if future.running() or future.set_running_or_notify_cancel():
+                    future.set_exception(e)
+                return
+            if future.running():
+                future.set_result(results)
+
+        asyncio.run_coroutine_threadsafe(run(), self._loop)
+        return future
+
+    def shutdown(self, wait: bool = True, *, cancel_futures: bool = False):
+        # the jobs of the scheduler are done (or cancelled) before it shuts down the executor
+        async def stop():
+            tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+            for task in tasks if cancel_futures else []:
+                task.cancel()
+            if wait:
+                await asyncio.gather(*tasks, return_exceptions=True)
+
+        asyncio.run_coroutine_threadsafe(stop(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+        self._parse_pool.shutdown(wait=wait)
+        for driver in self._drivers.values():
+            logging.info(
+                f"Console driver '{driver.console}'; {driver.num_timeouts} timeout(s) and {driver.num_retries} retry(s)"
+            )
@@ -0,0 +1,422 @@
+# rekent de modellen op meerdere computers via een gedeelde map (wachtrij), gebruik
+#
+# op elke rekencomputer (meerdere keren op een computer mag ook)
+# python distributed.py worker <wachtrij map> --console "D-Stability Console.exe" [--processes 8]
+#
+# en zet DISTRIBUTED_QUEUE_PATH in sweep.py op dezelfde map, de scheduler zet de
+# modellen dan in de wachtrij in plaats van ze zelf te rekenen
+#
+# de wachtrij bestaat uit de mappen
+#
+# units     de stix bestanden (invoer, na de berekening het berekende bestand)
+# pending   een json bestand per model dat nog gerekend moet worden
+# claimed   de modellen die door een worker gerekend worden (het bestand wordt
+#           verplaatst, dat lukt maar voor een worker), de worker werkt de
+#           wijzigingsdatum regelmatig bij (heartbeat)
+# done      de resultaten
+#
+# als de wijzigingsdatum van een model in claimed langer dan HEARTBEAT_TIMEOUT niet
+# verandert is de worker verdwenen en wordt het model terug in pending gezet
+import argparse
+import json
+import logging
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import FIRST_COMPLETED, Executor, Future, ProcessPoolExecutor
+from concurrent.futures import wait as wait_futures
+from pathlib import Path
+from typing import Dict, Optional
+
+from scheduler import Job, JobResult, get_error_results, run_job
+
+HEARTBEAT_INTERVAL = 10.0  # seconds between the heartbeats of a worker
+# a model without a heartbeat for this long is given to another worker
+HEARTBEAT_TIMEOUT = 60.0
+POLL_INTERVAL = 0.5  # seconds between the checks of the queue
+# a model that lost its worker this many times is reported as failed
+MAX_ASSIGNMENTS = 3
+
+STATES = ["units", "pending", "claimed", "done"]
+
+
+def create_queue(path: str) -> Path:
+    path = Path(path)
+    for state in STATES:
+        (path / state).mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def write_json(filename: Path, data: Dict):
+    """Write the json file at once so a reader never sees a partial file"""
+    tmp_filename = filename.with_name(f".{filename.name}.{uuid.uuid4().hex}.tmp")
+    tmp_filename.write_text(json.dumps(data), encoding="utf-8")
+    os.replace(tmp_filename, filename)
+
+
+def result_to_dict(result: JobResult) -> Dict:
+    return {
+        "name": result.name,
+        "factor_of_safety": result.factor_of_safety,
+        "analysis_type": result.analysis_type,
+        "slip_plane": result.slip_plane,
+        "runtime": result.runtime,
+        "error": result.error,
+        "events": result.events,
+    }
+
+
+def result_from_dict(data: Dict) -> JobResult:
+    return JobResult(
+        name=data["name"],
+        factor_of_safety=data["factor_of_safety"],
+        analysis_type=data["analysis_type"],
+        slip_plane=data["slip_plane"],
+        runtime=data["runtime"],
+        error=data["error"],
+        events=data["events"],
+    )
+
+
+class DistributedExecutor(Executor):
+    """An executor for the Scheduler that puts the jobs in a queue in a shared directory
+
+    The jobs are calculated by workers (python distributed.py worker) on this or other
+    computers. A background thread collects the results, copies the calculated stix
+    files back and gives the jobs of workers without heartbeat to other workers. Only
+    run_job can be submitted (as the Scheduler does), the console of the workers is
+    used. Jobs can be cancelled as long as no worker claimed them.
+
+    Args:
+        path (str): the queue directory (shared by the coordinator and the workers)
+        local_workers (int, optional): the number of workers to start on this computer (to test without other computers). Defaults to 0.
+        console (Optional[str], optional): the console of the local workers. Defaults to None.
+    """
+
+    def __init__(
+        self, path: str, local_workers: int = 0, console: Optional[str] = None
+    ):
+        self.path = create_queue(path)
+        self.num_reassigned = 0
+        self._units = {}  # unit id -> (future, job)
+        # unit id -> (mtime of the claimed file, time it last changed)
+        self._heartbeats = {}
+        self._lost = {}  # unit id -> number of times the worker of the unit was lost
+        self._discarded = set()  # cancelled units that were claimed by a worker
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._poll, daemon=True)
+        self._thread.start()
+
+        self._workers = []
+        if local_workers > 0:
+            if console is None:
+                raise ValueError("The local workers need a console")
+            for i in range(local_workers):
+                self._workers.append(
+                    subprocess.Popen(
+                        [
+                            sys.executable,
+                            str(Path(__file__).resolve()),
+                            "worker",
+                            str(self.path),
+                            "--console",
+                            console,
+                            "--worker-id",
+                            f"{socket.gethostname()}-local{i}",
+                        ]
+                    )
+                )
+
+    def submit(self, fn, /, *args, **kwargs) -> Future:
+        if fn is not run_job:
+            raise TypeError("The DistributedExecutor can only run scheduler.run_job")
+        _, job = args
+        unit_id = f"{time.time_ns()}_{uuid.uuid4().hex[:8]}"
+        shutil.copyfile(job.filename, self.path / "units" / f"{unit_id}.stix")
+        future = Future()
+        with self._lock:
+            self._units[unit_id] = (future, job)
+            self._lost[unit_id] = 0
+        write_json(
+            self.path / "pending" / f"{unit_id}.json",
+            {
+                "id": unit_id,
+                "name": job.name,
+                "filename": Path(job.filename).name,
+                "scenarios": job.scenarios,
+            },
+        )
+        return future
+
+    def _remove_unit(self, unit_id: str):
+        for filename in [
+            self.path / "units" / f"{unit_id}.stix",
+            self.path / "pending" / f"{unit_id}.json",
+            self.path / "claimed" / f"{unit_id}.json",
+            self.path / "done" / f"{unit_id}.json",
+        ]:
+            try:
+                filename.unlink()
+            except FileNotFoundError:
+                pass
+        self._units.pop(unit_id, None)
+        self._heartbeats.pop(unit_id, None)
+        self._lost.pop(unit_id, None)
+
+    def _poll(self):
+        while not self._stop.wait(POLL_INTERVAL):
+            try:
+                with self._lock:
+                    self._check_queue()
+            except Exception as e:
+                logging.exception(f"Error checking the queue '{self.path}'; '{e}'")
+
+    def _check_queue(self):
+        now = time.time()
+        pending = {f.stem for f in (self.path / "pending").glob("*.json")}
+        claimed = {}
+        for f in (self.path / "claimed").glob("*.json"):
+            try:
+                claimed[f.stem] = f.stat().st_mtime
+            except FileNotFoundError:
+                # finished or given back in the meantime
+                pass
+        done = {f.stem for f in (self.path / "done").glob("*.json")}
+
+        for unit_id in done:
+            if unit_id not in self._units:
+                # a result of an earlier run, a worker that was given up on or a
+                # cancelled unit
+                self._remove_unit(unit_id)
+                self._discarded.discard(unit_id)
+                continue
+            future, job = self._units[unit_id]
+            if not future.running() and not future.set_running_or_notify_cancel():
+                # cancelled before the claim was seen, the result is not used
+                self._remove_unit(unit_id)
+                continue
+            data = json.loads(
+                (self.path / "done" / f"{unit_id}.json").read_text(encoding="utf-8")
+            )
+            results = [result_from_dict(r) for r in data["results"]]
+            if any(r.ok for r in results):
+                shutil.copyfile(self.path / "units" / f"{unit_id}.stix", job.filename)
+            self._remove_unit(unit_id)
+            future.set_result(results)
+
+        for unit_id, (future, job) in list(self._units.items()):
+            if unit_id in done:
+                continue
+            if future.cancelled():
+                # not claimed yet (the future would be running), remove it from the queue
+                try:
+                    os.remove(self.path / "pending" / f"{unit_id}.json")
+                    self._remove_unit(unit_id)
+                except FileNotFoundError:
+                    # claimed in the meantime, the result is removed when it arrives
+                    # as the result of an unknown unit
+                    self._discarded.add(unit_id)
+                    self._units.pop(unit_id)
+                    self._heartbeats.pop(unit_id, None)
+                    self._lost.pop(unit_id, None)
+                # the scheduler only sees the future as done once this is called
+                future.set_running_or_notify_cancel()
+                continue
+            if unit_id not in claimed:
+                continue
+
+            if not future.running():
+                future.set_running_or_notify_cancel()
+            # the clock of the file server might differ, only compare the own clock
+            mtime, changed = self._heartbeats.get(unit_id, (None, now))
+            if mtime != claimed[unit_id]:
+                self._heartbeats[unit_id] = (claimed[unit_id], now)
+                continue
+            if now - changed < HEARTBEAT_TIMEOUT:
+                continue
+
+            self._heartbeats.pop(unit_id)
+            self._lost[unit_id] += 1
+            if self._lost[unit_id] >= MAX_ASSIGNMENTS:
+                logging.error(
+                    f"Giving up on '{job.filename}', the worker was lost {self._lost[unit_id]} times"
+                )
+                self._remove_unit(unit_id)
+                future.set_result(
+                    get_error_results(job, 0.0, "the worker was lost too often")
+                )
+                continue
+            try:
+                os.rename(
+                    self.path / "claimed" / f"{unit_id}.json",
+                    self.path / "pending" / f"{unit_id}.json",
+                )
+                self.num_reassigned += 1
+                logging.warning(
+                    f"No heartbeat for '{job.filename}' in {HEARTBEAT_TIMEOUT} seconds, giving it to another worker"
+                )
+            except FileNotFoundError:
+                # finished in the meantime
+                pass
+
+    def shutdown(self, wait: bool = True, *, cancel_futures: bool = False):
+        while wait and not cancel_futures:
+            with self._lock:
+                if all(future.done() for future, _ in self._units.values()):
+                    break
+            time.sleep(POLL_INTERVAL)
+        self._stop.set()
+        self._thread.join()
+        with self._lock:
+            for unit_id, (future, _) in list(self._units.items()):
+                future.cancel()
+                self._remove_unit(unit_id)
+            for unit_id in self._discarded:
+                self._remove_unit(unit_id)
+            self._discarded.clear()
+        for worker in self._workers:
+            worker.terminate()
+            worker.wait()
+        logging.info(
+            f"Distributed queue '{self.path}'; {self.num_reassigned} job(s) given to another worker"
+        )
+
+
+def claim(path: Path) -> Optional[Dict]:
+    """Claim the oldest pending unit (None if there are no pending units)"""
+    for filename in sorted((path / "pending").glob("*.json")):
+        try:
+            os.rename(filename, path / "claimed" / filename.name)
+        except OSError:
+            # claimed by another worker
+            continue
+        # the rename keeps the modification time, this is the first heartbeat
+        os.utime(path / "claimed" / filename.name)
+        return json.loads(
+            (path / "claimed" / filename.name).read_text(encoding="utf-8")
+        )
+    return None
+
+
+def calculate_unit(console: str, path: str, unit: Dict, workdir: str) -> Dict:
+    """Calculate a unit in a local copy of the stix file (runs in a worker process)"""
+    path = Path(path)
+    local_filename = Path(workdir) / unit["id"] / unit["filename"]
+    local_filename.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        shutil.copyfile(path / "units" / f"{unit['id']}.stix", local_filename)
+        job = Job(unit["name"], str(local_filename), unit["scenarios"])
+        results = run_job(console, job)
+        if any(r.ok for r in results):
+            shutil.copyfile(local_filename, path / "units" / f"{unit['id']}.stix")
+    except Exception as e:
+        results = get_error_results(
+            Job(unit["name"], unit["filename"], unit["scenarios"]), 0.0, str(e)
+        )
+    finally:
+        shutil.rmtree(local_filename.parent, ignore_errors=True)
+    return {"id": unit["id"], "results": [result_to_dict(r) for r in results]}
+
+
+def run_worker(
+    path: str,
+    console: str,
+    nprocesses: int = 1,
+    worker_id: Optional[str] = None,
+    max_idle: Optional[float] = None,
+) -> int:
+    """Calculate the units in the queue until stopped (or idle for max_idle seconds)
+
+    Returns:
+        int: the number of calculated units
+    """
+    path = create_queue(path)
+    worker_id = (
+        f"{socket.gethostname()}-{os.getpid()}" if worker_id is None else worker_id
+    )
+    logging.info(
+        f"Worker '{worker_id}' started on '{path}' with {nprocesses} process(es)"
+    )
+
+    num_calculated = 0
+    running = {}  # future -> unit id
+    last_heartbeat = time.time()
+    idle_since = time.time()
+    with tempfile.TemporaryDirectory(prefix="wsbd_worker_") as workdir:
+        with ProcessPoolExecutor(max_workers=nprocesses) as pool:
+            while True:
+                while len(running) < nprocesses:
+                    unit = claim(path)
+                    if unit is None:
+                        break
+                    running[
+                        pool.submit(calculate_unit, console, str(path), unit, workdir)
+                    ] = unit["id"]
+
+                if len(running) == 0:
+                    if max_idle is not None and time.time() - idle_since > max_idle:
+                        break
+                    time.sleep(POLL_INTERVAL)
+                    continue
+
+                done, _ = wait_futures(
+                    running.keys(), timeout=POLL_INTERVAL, return_when=FIRST_COMPLETED
+                )
+                for future in done:
+                    unit_id = running.pop(future)
+                    write_json(path / "done" / f"{unit_id}.json", future.result())
+                    try:
+                        os.remove(path / "claimed" / f"{unit_id}.json")
+                    except FileNotFoundError:
+                        pass
+                    num_calculated += 1
+                idle_since = time.time()
+
+                if time.time() - last_heartbeat > HEARTBEAT_INTERVAL:
+                    for unit_id in running.values():
+                        try:
+                            os.utime(path / "claimed" / f"{unit_id}.json")
+                        except FileNotFoundError:
+                            # given to another worker, the first result is used
+                            pass
+                    last_heartbeat = time.time()
+
+    logging.info(f"Worker '{worker_id}' calculated {num_calculated} model(s)")
+    return num_calculated
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Calculate the models in a shared queue directory"
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    worker_parser = subparsers.add_parser("worker", help="start a worker")
+    worker_parser.add_argument("path", help="the queue directory")
+    worker_parser.add_argument("--console", required=True)
+    worker_parser.add_argument("--processes", type=int, default=1)
+    worker_parser.add_argument("--worker-id", default=None)
+    worker_parser.add_argument(
+        "--max-idle",
+        type=float,
+        default=None,
+        help="stop after this many seconds without work",
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        format="%(asctime)s %(levelname)s %(message)s",
+        datefmt="%H:%M:%S",
+        level=logging.INFO,
+    )
+    run_worker(args.path, args.console, args.processes, args.worker_id, args.max_idle)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,256 @@
+#!/usr/bin/env python
+# stand-in for the DStability console to test and benchmark the scripts without the
+# (Windows) console, point DSTABILITY_EXE to this file and use it like the console
+#
+# python fake_console.py <stix file>
+#
+# the safety factor is not calculated but derived from the geometry and the phreatic
+# line so the same input always gives the same result, a higher phreatic line gives
+# a lower safety factor and a larger profile (like a berm) a higher safety factor
+#
+# the behaviour can be changed with these environment variables
+#
+# FAKE_CONSOLE_LATENCY       time per calculation [s] (default 0)
+# FAKE_CONSOLE_JITTER        random extra time as a fraction of the latency (default 0)
+# FAKE_CONSOLE_FAILURE_RATE  fraction of the calculations that fail (default 0)
+# FAKE_CONSOLE_SEED          seed for the jitter and failures (default 0)
+#
+# only the standard library is used so the console starts as fast as possible
+import hashlib
+import json
+import os
+import random
+import sys
+import time
+import zipfile
+from typing import Dict, List, Optional, Tuple
+
+SF_BASE = 0.5
+SF_FILL_FACTOR = 2.0  # gain per fraction of the bounding box that is filled with soil
+SF_PHREATIC_FACTOR = 1.0  # loss per fraction of the height below the phreatic line
+SF_MIN = 0.3
+
+# the result file (in the results folder of the stix file) per analysis type
+RESULT_FOLDERS = {
+    "Bishop": "bishop",
+    "BishopBruteForce": "bishopbruteforce",
+    "Spencer": "spencer",
+    "SpencerGenetic": "spencergeneticalgorithm",
+    "UpliftVan": "upliftvan",
+    "UpliftVanParticleSwarm": "upliftvanparticleswarm",
+}
+
+
+def _read_folder(files: Dict[str, bytes], folder: str) -> Dict[str, Dict]:
+    """Get all json files in a folder of the stix file by id"""
+    items = {}
+    for name, content in files.items():
+        if name.startswith(f"{folder}/") and name.endswith(".json"):
+            item = json.loads(content)
+            items[item.get("Id")] = item
+    return items
+
+
+def _collect_ids(files: Dict[str, bytes]) -> List[str]:
+    """Get all numeric ids in the json files of the stix file"""
+    ids = []
+
+    def collect(data):
+        if isinstance(data, dict):
+            for k, v in data.items():
+                if k == "Id" and isinstance(v, str) and v.isdigit():
+                    ids.append(v)
+                else:
+                    collect(v)
+        elif isinstance(data, list):
+            for v in data:
+                collect(v)
+
+    for name, content in files.items():
+        if name.endswith(".json"):
+            collect(json.loads(content))
+    return ids
+
+
+def _polygon_area(points: List[Dict]) -> float:
+    area = 0.0
+    for p1, p2 in zip(points, points[1:] + points[:1]):
+        area += p1["X"] * p2["Z"] - p2["X"] * p1["Z"]
+    return abs(area) / 2.0
+
+
+def get_safety_factor(geometry: Dict, waternet: Optional[Dict]) -> float:
+    """Derive the safety factor from the geometry and the phreatic line
+
+    Args:
+        geometry (Dict): the geometry (layers with points)
+        waternet (Optional[Dict]): the waternet (head lines and the id of the phreatic line)
+
+    Returns:
+        float: the safety factor
+    """
+    points = [p for layer in geometry.get("Layers", []) for p in layer["Points"]]
+    if len(points) == 0:
+        raise ValueError("The geometry has no layers")
+    xmin, xmax = min(p["X"] for p in points), max(p["X"] for p in points)
+    zmin, zmax = min(p["Z"] for p in points), max(p["Z"] for p in points)
+    width, height = max(xmax - xmin, 1e-3), max(zmax - zmin, 1e-3)
+    fill = sum(
+        _polygon_area(layer["Points"]) for layer in geometry.get("Layers", [])
+    ) / (width * height)
+
+    wet = 0.0
+    if waternet is not None:
+        for headline in waternet.get("HeadLines", []):
+            if headline.get("Id") == waternet.get("PhreaticLineId"):
+                level = max(p["Z"] for p in headline["Points"])
+                wet = min(max((level - zmin) / height, 0.0), 1.0)
+
+    sf = SF_BASE + SF_FILL_FACTOR * min(fill, 1.0) - SF_PHREATIC_FACTOR * wet
+    return round(max(sf, SF_MIN), 3)
+
+
+def _center(point: Dict, width: float, height: float) -> Dict:
+    """Get the center of a search area given by its top left point"""
+    return {"X": point["X"] + width / 2.0, "Z": point["Z"] - height / 2.0}
+
+
+def create_result(analysis_type: str, settings: Dict, sf: float) -> Dict:
+    """Create the result with a slip plane in the middle of the search area of the settings"""
+    result = {"FactorOfSafety": sf, "Points": [], "Slices": []}
+    if analysis_type in ["UpliftVan", "UpliftVanParticleSwarm"]:
+        uplift_van = settings.get("UpliftVanParticleSwarm") or {}
+        area_a = uplift_van.get("SearchAreaA") or {}
+        area_b = uplift_van.get("SearchAreaB") or {}
+        tangent_area = uplift_van.get("TangentArea") or {}
+        if area_a.get("TopLeft") and area_b.get("TopLeft") and tangent_area:
+            result["LeftCenter"] = _center(
+                area_a["TopLeft"], area_a["Width"], area_a["Height"]
+            )
+            result["RightCenter"] = _center(
+                area_b["TopLeft"], area_b["Width"], area_b["Height"]
+            )
+            result["TangentLine"] = tangent_area["TopZ"] - tangent_area["Height"] / 2.0
+    elif analysis_type in ["Bishop", "BishopBruteForce"]:
+        bishop = settings.get("BishopBruteForce") or {}
+        grid = bishop.get("SearchGrid") or {}
+        tangents = bishop.get("TangentLines") or {}
+        if grid.get("BottomLeft") and tangents.get("BottomTangentLineZ") is not None:
+            center = {
+                "X": grid["BottomLeft"]["X"]
+                + (grid["NumberOfPointsInX"] - 1) * grid["Space"] / 2.0,
+                "Z": grid["BottomLeft"]["Z"]
+                + (grid["NumberOfPointsInZ"] - 1) * grid["Space"] / 2.0,
+            }
+            tangent = (
+                tangents["BottomTangentLineZ"]
+                + (tangents["NumberOfTangentLines"] - 1) * tangents["Space"] / 2.0
+            )
+            result["Circle"] = {
+                "Center": center,
+                "Radius": max(center["Z"] - tangent, 0.1),
+            }
+    else:
+        result["SlipPlane"] = []
+    return result
+
+
+def calculate(filename: str) -> int:
+    """Add a result to every calculation of every scenario in the stix file
+
+    Returns:
+        int: the number of calculations
+    """
+    with zipfile.ZipFile(filename) as z:
+        files = {name: z.read(name) for name in z.namelist()}
+
+    geometries = _read_folder(files, "geometries")
+    waternets = _read_folder(files, "waternets")
+    calculationsettings = _read_folder(files, "calculationsettings")
+    scenarios = [
+        (name, json.loads(content))
+        for name, content in sorted(files.items())
+        if name.startswith("scenarios/") and name.endswith(".json")
+    ]
+
+    ids = [int(i) for i in _collect_ids(files)]
+    next_id = max(ids, default=0) + 1
+    results = []  # (file name, result)
+    num_calculations = 0
+    for scenario_name, scenario in scenarios:
+        stage = scenario["Stages"][-1]
+        sf = get_safety_factor(
+            geometries[stage["GeometryId"]], waternets.get(stage.get("WaternetId"))
+        )
+        for calculation in scenario.get("Calculations", []):
+            settings = calculationsettings[calculation["CalculationSettingsId"]]
+            analysis_type = settings["AnalysisType"]
+            result = create_result(analysis_type, settings, sf)
+            result["Id"] = str(next_id)
+            calculation["ResultId"] = str(next_id)
+            next_id += 1
+            results.append((RESULT_FOLDERS[analysis_type], result))
+            num_calculations += 1
+        files[scenario_name] = json.dumps(scenario, indent=4).encode("utf-8")
+
+    # remove the old results and add the new ones
+    files = {
+        name: content
+        for name, content in files.items()
+        if not name.startswith("results/")
+    }
+    counts = {}
+    for folder, result in results:
+        i = counts.get(folder, 0)
+        counts[folder] = i + 1
+        name = f"{folder}.json" if i == 0 else f"{folder}_{i}.json"
+        files[f"results/{folder}/{name}"] = json.dumps(result, indent=4).encode("utf-8")
+
+    tmp_filename = f"{filename}.tmp"
+    with zipfile.ZipFile(tmp_filename, "w", zipfile.ZIP_DEFLATED) as z:
+        for name, content in files.items():
+            z.writestr(name, content)
+    os.replace(tmp_filename, filename)
+    return num_calculations
+
+
+def get_settings() -> Tuple[float, float, float, int]:
+    """Get the latency, jitter, failure rate and seed from the environment"""
+    return (
+        float(os.environ.get("FAKE_CONSOLE_LATENCY", 0.0)),
+        float(os.environ.get("FAKE_CONSOLE_JITTER", 0.0)),
+        float(os.environ.get("FAKE_CONSOLE_FAILURE_RATE", 0.0)),
+        int(os.environ.get("FAKE_CONSOLE_SEED", 0)),
+    )
+
+
+def main(args: List[str]) -> int:
+    if len(args) != 1:
+        print("usage: fake_console.py <stix file>", file=sys.stderr)
+        return 2
+    filename = args[0]
+    latency, jitter, failure_rate, seed = get_settings()
+
+    # the same file (and seed) always gives the same delay and failure
+    with open(filename, "rb") as f:
+        digest = hashlib.sha256(f.read()).hexdigest()
+    rng = random.Random(f"{seed}:{digest}")
+    delay = latency * (1.0 + jitter * rng.random())
+    failed = rng.random() < failure_rate
+
+    start = time.time()
+    if failed:
+        time.sleep(delay / 2.0)
+        print(f"Calculation of '{filename}' failed (simulated)", file=sys.stderr)
+        return 1
+    try:
+        num_calculations = calculate(filename)
+    except Exception as e:
+        print(f"Calculation of '{filename}' failed; '{e}'", file=sys.stderr)
+        return 1
+    time.sleep(max(delay * num_calculations - (time.time() - start), 0.0))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
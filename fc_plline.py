@@ -2,17 +2,42 @@
 # from leveelogic.deltares.algorithms.algorithm_fc_phreatic_line_wsbd import (
 #    AlgorithmFCPhreaticLineWSBD,
 # )
-import shutil, os
-from helpers import sf_to_beta, get_model_factor, beta_to_pf, case_insensitive_glob
+from helpers import (
+    sf_to_beta,
+    beta_to_pf,
+    get_model_factor,
+    get_pf_category,
+    get_pf_boundaries,
+    read_param_lines,
+    parse_stix_filename,
+)
+from fragility_curve import FragilityCurve
+from sampling import get_coarse_levels, refine_levels
+from result_cache import ResultCache
+from results_store import ResultsStore, FRAGILITY
+from journal import RunJournal
+from scheduler import Scheduler, Job, JobResult
+from console_driver import ConsoleExecutor
+from model_variants import WaternetVariantBuilder
+from plotting import render_fragility_curves
+from search_area import warm_start, is_on_edge
+import instrumentation
+from instrumentation import stage
+from workspace import ScratchWorkspace
+from prescreening import (
+    set_cheap_analysis,
+    get_equivalent_sf,
+    needs_full_analysis_pf,
+    needs_full_analysis_sf,
+)
 from pathlib import Path
-from geolib.models import DStabilityModel
-from geolib import BaseModelList
-import matplotlib.pyplot as plt
+from geolib.models.dstability.internal import AnalysisTypeEnum
+import argparse
 import logging
-from matplotlib.patches import Rectangle
 import numpy as np
+from typing import Dict, List, Optional, Tuple
 
-from settings import SF_REQUIRED, P_EIS_OND_DSN, P_EIS_SIG, P_EIS_OND, P_EIS_SIG_DSN
+from settings import SF_REQUIRED
 
 PATH_TO_STIXFILES = "Z:\\Documents\\Klanten\\OneDrive\\WSBD\\calamiteiten\\StixFiles"
 PARAMETERS_FILE = "Z:\\Documents\\Klanten\\OneDrive\\WSBD\\calamiteiten\\StixFiles\\parameters_fc_plline.csv"
@@ -20,33 +45,456 @@ OUTPUT_PATH = "Z:\\Documents\\Klanten\\Output\\WSBD\\FragilityCurves"
 CALCULATIONS_PATH = (
     "Z:\\Documents\\Klanten\\Output\\WSBD\\FragilityCurves\\Calculations"
 )
-TEMP_CALCULATIONS_PATH = (
-    "Z:\\Documents\\Klanten\\Output\\WSBD\\FragilityCurves\\Calculations\\Temp"
-)
 LOG_FILE = "Z:\\Documents\\Klanten\\Output\\WSBD\\FragilityCurves\\fc_plline.log"
+DSTABILITY_EXE = (
+    "Z:\\Apps\\Deltares\\Consoles\\DStabilityConsole\\D-Stability Console.exe"
+)
 MAX_THREADS = 8  # increase if you need more threads
 
-ADJUST_FOR_UPLIFT = True
+# results of models that have been calculated before are read from this cache
+USE_RESULT_CACHE = True
+RESULT_CACHE_FILE = (
+    "Z:\\Documents\\Klanten\\Output\\WSBD\\FragilityCurves\\result_cache.sqlite"
+)
+RESULT_CACHE_MAX_SIZE = 500 * 1024 * 1024  # bytes
+
+# finished calculations are written to this journal, use --resume to continue a run
+JOURNAL_FILE = "Z:\\Documents\\Klanten\\Output\\WSBD\\FragilityCurves\\journal.jsonl"
 
-logging.basicConfig(
-    filename=LOG_FILE,
-    filemode="w",
-    format="%(asctime)s %(levelname)s %(message)s",
-    datefmt="%H:%M:%S",
-    level=logging.INFO,
+# every calculated point is written to this database (see results_store.py)
+RESULTS_STORE_FILE = (
+    "Z:\\Documents\\Klanten\\Output\\WSBD\\FragilityCurves\\results.sqlite"
 )
 
+# write the stix files for the console to a local scratch directory (in SCRATCH_PATH or
+# the temp directory of the system if None) instead of CALCULATIONS_PATH, at the end
+# the calculated stix files are copied to CALCULATIONS_PATH in one step (if
+# COPY_BACK_CALCULATIONS) and the scratch directory is removed
+USE_SCRATCH = False
+SCRATCH_PATH = None
+COPY_BACK_CALCULATIONS = True
+
+# check the parameter file, generate_waternet of the lowest and highest river level of
+# every line (see preflight.py) before starting the calculations, the run stops if
+# there are errors
+PREFLIGHT = True
+
+# start the consoles from an asyncio loop (see console_driver.py) instead of one blocking
+# process per console, a console that runs longer than CONSOLE_TIMEOUT seconds is killed
+# and failed runs are retried CONSOLE_RETRIES times (after CONSOLE_RETRY_DELAY seconds,
+# doubled for every next retry)
+USE_CONSOLE_DRIVER = False
+CONSOLE_TIMEOUT = 3600
+CONSOLE_RETRIES = 1
+CONSOLE_RETRY_DELAY = 10.0
+
+# duration, bytes read / written and peak memory per stage and model (see instrumentation.py)
+EVENTS_FILE = "Z:\\Documents\\Klanten\\Output\\WSBD\\FragilityCurves\\stages.jsonl"
+
+ADJUST_FOR_UPLIFT = True
+
+# adaptive sampling, start with a coarse set of river levels and only add levels
+# where the failure probability crosses a category boundary or the curve bends
+# the coarse set uses every n-th river level (based on step_size) and the curve is
+# refined if the sf deviates more than ADAPTIVE_SF_TOLERANCE from the line between its neighbours
+ADAPTIVE_SAMPLING = False
+ADAPTIVE_COARSE_FACTOR = 4
+ADAPTIVE_SF_TOLERANCE = 0.02
+
+# pack all river levels of a cross section as scenarios in one stix file so the
+# DStability console only starts once per cross section (or per adaptive round)
+PACK_RIVER_LEVELS = False
+
+# validation, also calculate the original stix file and the same model with the
+# waternet generated at the river level of the original phreatic line, if this river
+# level is part of the fragility curve the result is used as that point of the curve
+COMPARE_WATERNET = False
+# pre-screening, calculate all river levels with Bishop brute force on a coarse grid
+# first and only calculate the river levels with the original analysis if the
+# reliability index is within PRESCREEN_BETA_MARGIN of a category boundary or the
+# (model factor corrected) safety factor within PRESCREEN_SF_MARGIN of SF_REQUIRED
+PRESCREENING = False
+PRESCREEN_GRID_POINTS = 5
+PRESCREEN_TANGENT_LINES = 5
+PRESCREEN_BETA_MARGIN = 0.5
+PRESCREEN_SF_MARGIN = 0.1
+
+# narrow the search area (grid / search areas and tangent lines) around the critical
+# slip plane of the nearest calculated river level, WARM_START_FACTOR is the size of the
+# narrowed area relative to the original one, if the new slip plane lies on the edge
+# of the narrowed area the river level is calculated again with the original area
+WARM_START_SEARCH = False
+WARM_START_FACTOR = 0.5
+
+ORIGINAL_JOB_NAME = "original"
+COMPARE_JOB_NAME = "compare"
+
 # logging.warning("Note that adjustment for uplift is not yet implemented!")
 
 
-# get the params from the csv file
-param_lines = [
-    l.strip() for l in open(PARAMETERS_FILE, "r").readlines() if l.strip() != ""
-][1:]
+def calculate_river_levels(
+    builder: WaternetVariantBuilder,
+    filename: str,
+    river_levels: List[float],
+    extra_jobs: Optional[List[Job]] = None,
+    extra_results: Optional[Dict[str, JobResult]] = None,
+    slip_planes: Optional[Dict[float, Dict]] = None,
+    widen: Optional[List[float]] = None,
+):
+    """Generate the models for the given river levels and yield them as jobs for the scheduler
+
+    Extra jobs (like the waternet comparison) are calculated in the same batch. If the
+    name of an extra job is a river level (str(river_level)) its result is used for that
+    river level and the river level is not generated again.
+
+    If a slip plane is given for a river level the search area is narrowed around it
+    (see search_area.py), if the result lies on the edge of the narrowed search area
+    the river level is added to widen (and left out of the results) so it can be
+    calculated again with the original search area. Results on the edge of the original
+    search area are reported in the log.
+
+    Args:
+        builder (WaternetVariantBuilder): the builder with the parsed stix file
+        filename (str): name of the stix file
+        river_levels (List[float]): the river levels to calculate
+        extra_jobs (Optional[List[Job]], optional): extra jobs to calculate. Defaults to None.
+        extra_results (Optional[Dict[str, JobResult]], optional): filled with the results of the extra jobs. Defaults to None.
+        slip_planes (Optional[Dict[float, Dict]], optional): slip plane of a neighbouring variant per river level. Defaults to None.
+        widen (Optional[List[float]], optional): filled with the river levels that need the original search area. Defaults to None.
+
+    Returns:
+        List[Tuple[float, float, float, JobResult]]: river level, safety factor, model factor and job result per succesful calculation
+    """
+    slip_planes = {} if slip_planes is None else slip_planes
+    scenario_index = int(builder.model.current_scenario)
+    search_settings = {}  # river level -> the calculation settings that are used
+    extra_jobs = [] if extra_jobs is None else extra_jobs
+    extra_names = [job.name for job in extra_jobs]
+    levels_to_build = [
+        river_level
+        for river_level in river_levels
+        if str(river_level) not in extra_names
+    ]
+    try:
+        jobs = list(extra_jobs)
+        if PACK_RIVER_LEVELS and len(levels_to_build) > 0:
+            logging.info(f"Packing river levels {levels_to_build} in one stix file")
+            new_filepath = str(
+                Path(CALCULATIONS_PATH)
+                / f"{filename}_{levels_to_build[0]}_{levels_to_build[-1]}_packed.stix"
+            )
+            labels = builder.build_packed(
+                levels_to_build, new_filepath, adjust_for_uplift=ADJUST_FOR_UPLIFT
+            )
+            jobs.append(Job(f"{filename}_packed", new_filepath, scenarios=labels))
+        elif not PACK_RIVER_LEVELS:
+            for river_level in levels_to_build:
+                logging.info(f"Handling river level {river_level}")
+                new_filepath = str(
+                    Path(CALCULATIONS_PATH) / f"{filename}_{river_level}.stix"
+                )
+                search_settings[river_level], narrowed = warm_start(
+                    builder.model,
+                    slip_planes.get(river_level),
+                    WARM_START_FACTOR,
+                    scenario_index,
+                )
+                if narrowed is not None:
+                    search_settings[river_level] = narrowed
+                # TODO > uplift implementeren
+                builder.build(
+                    river_level, new_filepath, adjust_for_uplift=ADJUST_FOR_UPLIFT
+                )
+                jobs.append(Job(str(river_level), new_filepath))
+    except Exception as e:
+        logging.error(
+            f"Skipping '{filename}' due to an error while running the algorithm, '{e}'."
+        )
+        return []
+
+    if len(jobs) == 0:
+        return []
+
+    logging.info(f"Starting {len(jobs)} calculation(s) for '{filename}'")
+    job_results = yield jobs
+    if extra_results is not None:
+        for name in extra_names:
+            extra_results[name] = job_results[name]
+
+    result = []
+    for river_level in river_levels:
+        job_result = job_results[str(river_level)]
+        if not job_result.ok:
+            continue
+        if river_level in search_settings and is_on_edge(
+            search_settings[river_level], job_result.slip_plane
+        ):
+            if river_level in slip_planes and widen is not None:
+                widen.append(river_level)
+                continue
+            logging.warning(
+                f"The critical slip plane of '{filename}' at river level {river_level} lies on the edge of the search area"
+            )
+        sf = job_result.factor_of_safety
+        logging.info(
+            f"Safety factor for '{filename}' at river level {river_level} = {sf:.3f}"
+        )
+        model_factor = get_model_factor(AnalysisTypeEnum(job_result.analysis_type))
+        result.append((river_level, sf, model_factor, job_result))
+
+    return result
+
+
+def warm_started_river_levels(
+    builder: WaternetVariantBuilder,
+    filename: str,
+    river_levels: List[float],
+    known: List[Tuple[float, float, float, JobResult]],
+    extra_jobs: Optional[List[Job]] = None,
+    extra_results: Optional[Dict[str, JobResult]] = None,
+):
+    """Calculate the river levels with the search area narrowed around the slip plane of the nearest calculated river level
+
+    If no river level is calculated yet the middle river level is calculated first with
+    the original search area. River levels with a result on the edge of the narrowed
+    search area are calculated again with the original search area.
+
+    Args:
+        builder (WaternetVariantBuilder): the builder with the parsed stix file
+        filename (str): name of the stix file
+        river_levels (List[float]): the river levels to calculate
+        known (List[Tuple[float, float, float, JobResult]]): the results of the river levels that are already calculated
+        extra_jobs (Optional[List[Job]], optional): extra jobs to calculate (see calculate_river_levels). Defaults to None.
+        extra_results (Optional[Dict[str, JobResult]], optional): filled with the results of the extra jobs. Defaults to None.
+
+    Returns:
+        List[Tuple[float, float, float, JobResult]]: river level, safety factor, model factor and job result per succesful calculation
+    """
+    result = []
+    slip_planes = {r[0]: r[3].slip_plane for r in known if r[3].slip_plane}
+    if len(slip_planes) == 0 and len(river_levels) > 1:
+        seed = river_levels[len(river_levels) // 2]
+        result += yield from calculate_river_levels(
+            builder,
+            filename,
+            [seed],
+            extra_jobs=extra_jobs,
+            extra_results=extra_results,
+        )
+        slip_planes = {r[0]: r[3].slip_plane for r in result if r[3].slip_plane}
+        river_levels = [r for r in river_levels if r != seed]
+        extra_jobs = None
+
+    widen = []
+    result += yield from calculate_river_levels(
+        builder,
+        filename,
+        river_levels,
+        extra_jobs=extra_jobs,
+        extra_results=extra_results,
+        slip_planes={
+            river_level: slip_planes[
+                min(slip_planes.keys(), key=lambda k: abs(k - river_level))
+            ]
+            for river_level in river_levels
+            if len(slip_planes) > 0
+        },
+        widen=widen,
+    )
+
+    if len(widen) > 0:
+        logging.info(
+            f"The critical slip plane lies on the edge of the narrowed search area for river level(s) {widen}, calculating them again with the original search area"
+        )
+        result += yield from calculate_river_levels(builder, f"{filename}_full", widen)
+    return result
+
+
+def prescreen_river_levels(
+    builder: WaternetVariantBuilder,
+    cheap_builder: WaternetVariantBuilder,
+    original_analysis_type: AnalysisTypeEnum,
+    filename: str,
+    dtcode: str,
+    river_levels: List[float],
+    extra_jobs: Optional[List[Job]] = None,
+    extra_results: Optional[Dict[str, JobResult]] = None,
+):
+    """Calculate the river levels with the cheap analysis and only the points close to a threshold with the full analysis
+
+    Args:
+        builder (WaternetVariantBuilder): the builder with the original analysis
+        cheap_builder (WaternetVariantBuilder): the builder with the cheap analysis (see prescreening.py)
+        original_analysis_type (AnalysisTypeEnum): the analysis type of the original model
+        filename (str): name of the stix file
+        dtcode (str): dike trajectory code like 34-1
+        river_levels (List[float]): the river levels to calculate
+        extra_jobs (Optional[List[Job]], optional): extra jobs to calculate (see calculate_river_levels). Defaults to None.
+        extra_results (Optional[Dict[str, JobResult]], optional): filled with the results of the extra jobs. Defaults to None.
+
+    Returns:
+        List[Tuple[float, float, float, JobResult]]: river level, safety factor, model factor and job result per succesful calculation
+    """
+    cheap_results = yield from calculate_river_levels(
+        cheap_builder,
+        f"{filename}_prescreen",
+        river_levels,
+        extra_jobs=extra_jobs,
+        extra_results=extra_results,
+    )
+    cheap = [
+        r
+        for r in cheap_results
+        if r[3].analysis_type == AnalysisTypeEnum.BISHOP_BRUTE_FORCE.value
+    ]
+    if len(cheap) > 0:
+        sfs = np.array([r[1] for r in cheap])
+        escalate = needs_full_analysis_pf(
+            sfs, [r[2] for r in cheap], dtcode, PRESCREEN_BETA_MARGIN
+        ) | needs_full_analysis_sf(
+            get_equivalent_sf(
+                sfs, AnalysisTypeEnum.BISHOP_BRUTE_FORCE, original_analysis_type
+            ),
+            SF_REQUIRED[dtcode],
+            PRESCREEN_SF_MARGIN,
+        )
+    else:
+        escalate = np.array([], dtype=bool)
+
+    calculated = [r[0] for r in cheap_results]
+    full_levels = [r[0] for r, e in zip(cheap, escalate) if e] + [
+        river_level for river_level in river_levels if river_level not in calculated
+    ]
+    logging.info(
+        f"Pre-screening '{filename}', {len(full_levels)} of {len(river_levels)} river level(s) need the full analysis"
+    )
+    if len(full_levels) == 0:
+        return cheap_results
+
+    full_results = yield from calculate_river_levels(
+        builder, filename, sorted(full_levels)
+    )
+    full = {r[0]: r for r in full_results}
+    return [full.get(r[0], r) for r in cheap_results] + [
+        r for r in full_results if r[0] not in calculated
+    ]
+
+
+def create_compare_jobs(
+    builder: WaternetVariantBuilder, filepath: Path, river_levels: List[float]
+) -> List[Job]:
+    """Create the jobs to compare the original calculation with the one generated using the waternet creator code
+
+    The original calculation is written (without its results) to the calculations
+    path and the river level of
+    the original phreatic line is used to generate the compare calculation. If this river
+    level is one of the given river levels the compare job gets the river level as its
+    name so it is also used as a point of the fragility curve.
+
+    Args:
+        builder (WaternetVariantBuilder): the builder with the parsed stix file
+        filepath (Path): the original stix file
+        river_levels (List[float]): the river levels of the fragility curve
+
+    Returns:
+        List[Job]: the jobs for the original and the generated calculation (empty on errors)
+    """
+    try:
+        riverlevel = builder.model.phreatic_line.Points[0].Z
+        original_filepath = Path(CALCULATIONS_PATH) / f"{filepath.name}.original.stix"
+        with stage("serialize", original_filepath):
+            builder.model.serialize(original_filepath)
+    except Exception as e:
+        logging.error(
+            f"Cannot determine the safety factor of the original calculation; {e}"
+        )
+        return []
+
+    compare_name = COMPARE_JOB_NAME
+    for river_level in river_levels:
+        if abs(river_level - riverlevel) < 0.0005:
+            riverlevel, compare_name = river_level, str(river_level)
+            break
+
+    try:
+        compare_filepath = Path(CALCULATIONS_PATH) / f"{filepath.name}.compare.stix"
+        builder.build(riverlevel, compare_filepath, adjust_for_uplift=ADJUST_FOR_UPLIFT)
+    except Exception as e:
+        logging.error(
+            f"Error creating a calculation with the same riverlevel using the waternet code; {e}"
+        )
+        return []
+
+    return [
+        Job(ORIGINAL_JOB_NAME, original_filepath),
+        Job(compare_name, compare_filepath),
+    ]
+
+
+def log_compare(compare_jobs: List[Job], compare_results: Dict[str, JobResult]):
+    """Log the safety factors of the original and the generated calculation"""
+    for job, label in zip(compare_jobs, ["Original", "Generated"]):
+        job_result = compare_results[job.name]
+        if not job_result.ok:
+            continue
+        logging.info(
+            f"{label} safety factor = {job_result.factor_of_safety:.3f} ({job.filename})"
+        )
+
+
+def store_fragility_points(
+    store: ResultsStore,
+    filename: str,
+    dtcode: str,
+    results: List[Tuple[float, float, float, JobResult]],
+):
+    """Write the calculated points of a fragility curve to the results store"""
+    _, start_chainage, end_chainage = parse_stix_filename(filename)
+    levels = np.array([r[0] for r in results])
+    sfs = np.array([r[1] for r in results])
+    model_factors = np.array([r[2] for r in results])
+    betas = sf_to_beta(sfs, model_factors)
+    pfs = beta_to_pf(betas)
+    categories = get_pf_category(pfs, dtcode)
+    store.add_points(
+        [
+            {
+                "kind": FRAGILITY,
+                "trajectory": dtcode,
+                "start_chainage": start_chainage,
+                "end_chainage": end_chainage,
+                "filename": filename,
+                "name": str(levels[i]),
+                "river_level": float(levels[i]),
+                "factor_of_safety": float(sfs[i]),
+                "model_factor": float(model_factors[i]),
+                "beta": float(betas[i]),
+                "pf": float(pfs[i]),
+                "category": str(categories[i]),
+                "analysis_type": results[i][3].analysis_type,
+                "runtime": results[i][3].runtime,
+            }
+            for i in range(len(results))
+        ]
+    )
 
 
-# handle all files
-for param_line in param_lines:
+def fragility_curve_section(
+    param_line: str, store: Optional[ResultsStore] = None, resume: bool = False
+):
+    """Create the fragility curve for one line of the parameter file
+
+    This is a section for the scheduler, it yields the jobs to calculate and
+    writes the points of the fragility curve to the store once all results are in,
+    the plots are made afterwards from the store (see plotting.py).
+
+    Args:
+        param_line (str): line from the parameter file (filename,min_level,max_level,step_size)
+        store (Optional[ResultsStore], optional): store to write the calculated points to. Defaults to None.
+        resume (bool, optional): keep the points of the stix file from the previous run, else they are removed from the store first. Defaults to False.
+    """
+    # the filename is used in the error message if the line cannot be parsed
+    filename = param_line.split(",")[0].strip()
     try:
         filename, min_level, max_level, step_size = [
             p.strip() for p in param_line.split(",")
@@ -64,199 +512,249 @@ for param_line in param_lines:
         )
     except Exception as e:
         logging.error(
-            "Invalid parameter line '{param_line}' or invalid filename '{filename}' (should be <dijkcode>_<van>-<tot>.stix), got error '{e}'"
+            f"Invalid parameter line '{param_line}' or invalid filename '{filename}' (should be <dijkcode>_<van>-<tot>.stix), got error '{e}'"
         )
+        return
 
     if step_size <= 0.0:
         logging.info(f"Skipping '{filename}' because no step size is given.")
-        continue
+        return
+
+    # points of an earlier run might have other river levels
+    if store is not None and not resume:
+        store.delete_points(FRAGILITY, filename)
 
     subdir = filename.split("_")[0]
 
-    #############################################################
-    # EXTRA CODE                                                #
-    #                                                           #
-    # Check the difference between the current calculation      #
-    # and the one generated using the waternet creator code     #
-    #############################################################
-    ds_org = DStabilityModel()
-    try:
-        filepath = Path(PATH_TO_STIXFILES) / subdir / filename
-        ds_org.parse(filepath)
-        ds_org.execute()
-        sf = ds_org.output[-1].FactorOfSafety
-        riverlevel = ds_org.phreatic_line.Points[0].Z
-        logging.info(f"Original safety factor at river level {riverlevel} = {sf:.3f}")
-    except Exception as e:
-        logging.error(
-            f"Cannot determine the safety factor of the original calculation; {e}"
+    if ADAPTIVE_SAMPLING:
+        river_levels = get_coarse_levels(
+            min_level, max_level, step_size, ADAPTIVE_COARSE_FACTOR
         )
+    else:
+        river_levels = [
+            round(river_level, 3)
+            for river_level in np.arange(
+                min_level, max_level + 0.5 * step_size, step_size
+            )
+        ]
 
     try:
-        filepath = Path(PATH_TO_STIXFILES) / subdir / f"{filename}.compare.stix"
-        ds_org.serialize(filepath)
-        ds_compare = DStabilityModel()
-        ds_compare.parse(filepath)
-        ds_compare.generate_waternet(
-            river_level_mhw=riverlevel, adjust_for_uplift=ADJUST_FOR_UPLIFT
+        builder = WaternetVariantBuilder(
+            Path(PATH_TO_STIXFILES) / subdir / filename, "Norm", "Norm"
         )
-        ds_compare.serialize(filepath)
-        ds_compare.execute()
-        sf = ds_compare.output[-1].FactorOfSafety
-        riverlevel = ds_compare.phreatic_line.Points[0].Z
-        logging.info(f"Generated safety factor at river level {riverlevel} = {sf:.3f}")
     except Exception as e:
-        logging.error(
-            f"Error creating a calculation with the same riverlevel using the waternet code; {e}"
-        )
+        logging.error(f"Skipping '{filename}', cannot read the stix file; '{e}'")
+        return
 
-    try:
-        models_to_calculate = []
-        for river_level in np.arange(min_level, max_level + 0.5 * step_size, step_size):
-            logging.info(f"Handling river level {river_level}")
-            # copy the file
-            filepath = str(Path(PATH_TO_STIXFILES) / subdir / filename)
-            new_filepath = str(
-                Path(CALCULATIONS_PATH) / f"{filename}_{river_level}.stix"
+    cheap_builder = None
+    if PRESCREENING:
+        try:
+            cheap_builder = WaternetVariantBuilder(
+                Path(PATH_TO_STIXFILES) / subdir / filename, "Norm", "Norm"
             )
-            shutil.copyfile(filepath, new_filepath)
-
-            ds = DStabilityModel()
-            ds.parse(new_filepath)
-            ds.set_scenario_and_stage_by_label("Norm", "Norm")
-            # TODO > uplift implementeren
-            ds.generate_waternet(
-                river_level_mhw=river_level, adjust_for_uplift=ADJUST_FOR_UPLIFT
+            original_analysis_type = set_cheap_analysis(
+                cheap_builder.model,
+                PRESCREEN_GRID_POINTS,
+                PRESCREEN_TANGENT_LINES,
+                int(cheap_builder.model.current_scenario),
             )
-            ds.serialize(new_filepath)
-            models_to_calculate.append(ds)
-    except Exception as e:
-        logging.error(
-            f"Skipping '{filename}' due to an error while running the algorithm, '{e}'."
+            cheap_builder.snapshot()
+            if original_analysis_type == AnalysisTypeEnum.BISHOP_BRUTE_FORCE:
+                cheap_builder = None
+        except Exception as e:
+            logging.error(
+                f"Cannot create the pre-screening model for '{filename}', using the full analysis; '{e}'"
+            )
+            cheap_builder = None
+
+    compare_jobs = []
+    if COMPARE_WATERNET:
+        compare_jobs = create_compare_jobs(
+            builder, Path(PATH_TO_STIXFILES) / subdir / filename, river_levels
         )
 
-    if len(models_to_calculate) == 0:
-        logging.info(f"Skipping '{filename}, got 0 calculations")
-        continue
+    calculated_levels = []
+    results = []
+    while len(river_levels) > 0:
+        compare_results = {}
+        if cheap_builder is not None:
+            results += yield from prescreen_river_levels(
+                builder,
+                cheap_builder,
+                original_analysis_type,
+                filename,
+                dtcode,
+                river_levels,
+                extra_jobs=compare_jobs,
+                extra_results=compare_results,
+            )
+        elif WARM_START_SEARCH and not PACK_RIVER_LEVELS:
+            results += yield from warm_started_river_levels(
+                builder,
+                filename,
+                river_levels,
+                results,
+                extra_jobs=compare_jobs,
+                extra_results=compare_results,
+            )
+        else:
+            results += yield from calculate_river_levels(
+                builder,
+                filename,
+                river_levels,
+                extra_jobs=compare_jobs,
+                extra_results=compare_results,
+            )
+        calculated_levels += river_levels
+        if len(compare_jobs) > 0:
+            log_compare(compare_jobs, compare_results)
+            compare_jobs = []
+        if not ADAPTIVE_SAMPLING:
+            break
 
-    logging.info(f"Starting {len(models_to_calculate)} calculation(s)")
-    bm = BaseModelList(models=models_to_calculate)
-    newbm = bm.execute(Path(TEMP_CALCULATIONS_PATH), nprocesses=MAX_THREADS)
-    logging.info("Calculations ready")
+        river_levels = refine_levels(
+            levels=[r[0] for r in results],
+            sfs=[r[1] for r in results],
+            pfs=FragilityCurve(
+                [r[0] for r in results],
+                [r[1] for r in results],
+                [r[2] for r in results],
+            ).pfs.tolist(),
+            pf_boundaries=get_pf_boundaries(dtcode),
+            min_level=min_level,
+            step_size=step_size,
+            sf_tolerance=ADAPTIVE_SF_TOLERANCE,
+            skip_levels=calculated_levels,
+        )
+        if len(river_levels) > 0:
+            logging.info(
+                f"Refining the fragility curve with river levels {river_levels}"
+            )
 
-    plt.clf()
-    fig, ax = plt.subplots()
-    fig.set_size_inches(10, 5)
+    if len(results) == 0:
+        logging.info(f"Skipping '{filename}, got 0 calculations")
+        return
 
-    waterlevels = []
-    sfs = []
-    betas = []
-    pfs = []
+    logging.info(
+        f"Calculated {len(results)} river level(s) for '{filename}' out of {len(calculated_levels)} attempt(s)"
+    )
 
-    for i, model in enumerate(newbm.models):
-        ds = DStabilityModel()
+    curve = FragilityCurve(
+        [r[0] for r in results], [r[1] for r in results], [r[2] for r in results]
+    )
+    if store is not None:
+        store_fragility_points(store, filename, dtcode, results)
 
-        try:
-            river_level = float(model.filename.name.split("_")[-1].replace(".stix", ""))
-            waterlevels.append(river_level)
-            sf = model.output[-1].FactorOfSafety
-            logging.info(f"Safety factor for river level {river_level} = {sf:.3f}")
-            sfs.append(sf)
-            model_factor = get_model_factor(
-                model.datastructure.calculationsettings[-1].AnalysisType
+    for pf_boundary, level in zip(
+        get_pf_boundaries(dtcode), curve.category_levels(dtcode)
+    ):
+        if not np.isnan(level):
+            logging.info(
+                f"Failure probability of '{filename}' reaches {pf_boundary:.3e} at river level {level:.3f}"
             )
-            beta = sf_to_beta(sf, model_factor)
-            betas.append(beta)
-            pfs.append(beta_to_pf(beta))
 
-        except Exception as e:
-            logging.error(
-                f"Error getting safety factor from '{model.filename.name}'; '{e}'"
-            )
 
-    xmin = min(waterlevels)
-    xmax = max(waterlevels)
-    fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(10, 10))
-    ax1.plot([xmin, xmax], [SF_REQUIRED[dtcode], SF_REQUIRED[dtcode]], "r--")
-    ax1.text(
-        xmin,
-        SF_REQUIRED[dtcode],
-        f"minimale veiligheidsfactor ({SF_REQUIRED[dtcode]:.3f})",
+def main():
+    parser = argparse.ArgumentParser(
+        description="Calculate the fragility curves of all lines in the parameter file"
     )
-    ax1.plot(waterlevels, sfs, "o-")
-    ax1.set_xlabel("Water level [m tov NAP]")
-    ax1.set_ylabel("Safety Factor")
-    ax2.set_yscale("log")
-
-    p_eis_sig = P_EIS_SIG[dtcode]
-    p_eis_sig_dsn = P_EIS_SIG_DSN[dtcode]
-    p_eis_ond = P_EIS_OND[dtcode]
-    p_eis_ond_dsn = P_EIS_OND_DSN[dtcode]
-
-    aIv = (
-        0,
-        1 / 30 * P_EIS_SIG_DSN[dtcode],
-        "Iv voldoet ruim aan signaleringswaarde",
-        "#00ff00",
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="continue the previous run, calculations in the journal are not calculated again",
     )
-    aIIv = (
-        1 / 30 * P_EIS_SIG_DSN[dtcode],
-        P_EIS_SIG_DSN[dtcode],
-        "IIv voldoet aan signaleringswaarde",
-        "#76933c",
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="profile the python side stages with cProfile (written to EVENTS_FILE.prof)",
     )
-    aIIIv = (
-        P_EIS_SIG_DSN[dtcode],
-        P_EIS_OND_DSN[dtcode],
-        "IIIv voldoet aan de ondergrens en mogelijk de signaleringswaarde",
-        "#ffff00",
-    )
-    aIVv = (
-        P_EIS_OND_DSN[dtcode],
-        P_EIS_OND[dtcode],
-        "IVv voldoet mogelijk aan de ondergrens of aan de signaleringwaarde",
-        "#ccc0da",
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        filename=LOG_FILE,
+        filemode="a" if args.resume else "w",
+        format="%(asctime)s %(levelname)s %(message)s",
+        datefmt="%H:%M:%S",
+        level=logging.INFO,
     )
-    aVv = (
-        P_EIS_OND[dtcode],
-        30 * P_EIS_OND[dtcode],
-        "Vv voldoet niet aan de ondergrens",
-        "#ff9900",
+    instrumentation.enable(EVENTS_FILE, profile=args.profile)
+
+    if PREFLIGHT:
+        # preflight.py imports this script, import it here to avoid a circular import
+        from preflight import run_preflight
+
+        report = run_preflight(
+            fc_parameters_file=PARAMETERS_FILE, nprocesses=MAX_THREADS
+        )
+        report.log()
+        if not report.ok:
+            instrumentation.close()
+            return
+
+    global CALCULATIONS_PATH
+    workspace = (
+        ScratchWorkspace(CALCULATIONS_PATH, SCRATCH_PATH) if USE_SCRATCH else None
     )
-    aVIv = (
-        30 * P_EIS_OND[dtcode],
-        1,
-        "VIv voldoet ruim niet aan de ondergrens",
-        "#ff0000",
+    if workspace is not None:
+        CALCULATIONS_PATH = str(workspace.path)
+
+    # get the params from the csv file
+    param_lines = read_param_lines(PARAMETERS_FILE)
+
+    result_cache = (
+        ResultCache(RESULT_CACHE_FILE, max_size=RESULT_CACHE_MAX_SIZE)
+        if USE_RESULT_CACHE
+        else None
     )
 
-    for top, bottom, label, color in [aIv, aIIv, aIIIv, aIVv, aVv, aVIv]:
-        ax2.add_patch(
-            Rectangle(
-                (xmin, bottom),
-                (xmax - xmin),
-                (top - bottom),
-                facecolor=color,
-                fill=True,
-            )
+    # handle all files, the calculations of all files share the same processes
+    journal = RunJournal(JOURNAL_FILE, resume=args.resume)
+    store = ResultsStore(RESULTS_STORE_FILE)
+
+    executor = (
+        ConsoleExecutor(
+            MAX_THREADS, CONSOLE_TIMEOUT, CONSOLE_RETRIES, CONSOLE_RETRY_DELAY
         )
-        ax2.plot([xmin, xmax], [bottom, bottom], "k--")
-        ax2.text(xmin, (top + bottom) / 2.0, label)
-
-    ax2.plot(waterlevels, pfs, "o-")
-    ax2.set_ylim(1e-8, 1.0)
-    ax2.set_xlabel("Water level [m tov NAP]")
-    ax2.set_ylabel("Faalkans")
-    ax1.grid()
-    ax2.grid()
-
-    fig.suptitle(
-        f"Fragility curve dijktraject {dtcode} van {start_chainage:.2f}km tot {end_chainage:.2f}km"
+        if USE_CONSOLE_DRIVER
+        else None
+    )
+    scheduler = Scheduler(
+        DSTABILITY_EXE,
+        MAX_THREADS,
+        cache=result_cache,
+        journal=journal,
+        executor=executor,
     )
-    figname = f"{dtcode}_{start_chainage:.2f}_{end_chainage:.2f}.png"
-    fig.savefig(Path(OUTPUT_PATH) / figname)
+    try:
+        scheduler.run(
+            fragility_curve_section(param_line, store, args.resume)
+            for param_line in param_lines
+        )
+    finally:
+        if workspace is not None:
+            workspace.close(copy_back=COPY_BACK_CALCULATIONS)
+            CALCULATIONS_PATH = workspace.target
+
+    # the plots are made after the calculations from the points in the store
+    render_fragility_curves(
+        store,
+        OUTPUT_PATH,
+        MAX_THREADS,
+        filenames=[param_line.split(",")[0].strip() for param_line in param_lines],
+    )
+
+    if result_cache is not None:
+        logging.info(
+            f"Result cache hits: {result_cache.hits}, misses: {result_cache.misses}"
+        )
+        result_cache.close()
+
+    journal.close()
+    store.close()
+
+    instrumentation.log_summary()
+    instrumentation.close()
+
 
-    # map met berekeningen leegmaken
-    files = case_insensitive_glob(TEMP_CALCULATIONS_PATH, ".stix")
-    for f in files:
-        os.remove(f)
+if __name__ == "__main__":
+    main()
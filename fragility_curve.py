@@ -0,0 +1,112 @@
+from typing import List, Union
+
+import numpy as np
+
+from helpers import beta_to_pf, get_pf_boundaries, pf_to_beta, sf_to_beta
+
+
+class FragilityCurve:
+    """The safety factor, reliability index and failure probability as a function of the river level
+
+    The points are sorted by river level. Values between the calculated river levels
+    are interpolated linearly on the reliability index (which is linear in the safety
+    factor) so the failure probability follows the normal distribution between points.
+    All methods accept single values as well as (numpy) arrays.
+    """
+
+    def __init__(
+        self,
+        levels: Union[List[float], np.ndarray],
+        sfs: Union[List[float], np.ndarray],
+        model_factors: Union[float, List[float], np.ndarray],
+    ):
+        """Create the fragility curve from the calculated points
+
+        Args:
+            levels (Union[List[float], np.ndarray]): the river levels
+            sfs (Union[List[float], np.ndarray]): the safety factor per river level (without model factor)
+            model_factors (Union[float, List[float], np.ndarray]): the model factor (per river level)
+        """
+        levels = np.asarray(levels, dtype=float)
+        order = np.argsort(levels, kind="stable")
+        self.levels = levels[order]
+        self.sfs = np.asarray(sfs, dtype=float)[order]
+        self.model_factors = np.broadcast_to(
+            np.asarray(model_factors, dtype=float), levels.shape
+        )[order]
+        self.betas = sf_to_beta(self.sfs, self.model_factors)
+        self.pfs = beta_to_pf(self.betas)
+
+    def __len__(self) -> int:
+        return len(self.levels)
+
+    def sf_at(self, level: Union[float, np.ndarray]) -> Union[float, np.ndarray]:
+        """The (interpolated) safety factor at the given river level(s)"""
+        return np.interp(level, self.levels, self.sfs)
+
+    def beta_at(self, level: Union[float, np.ndarray]) -> Union[float, np.ndarray]:
+        """The (interpolated) reliability index at the given river level(s)"""
+        return np.interp(level, self.levels, self.betas)
+
+    def pf_at(self, level: Union[float, np.ndarray]) -> Union[float, np.ndarray]:
+        """The (interpolated) failure probability at the given river level(s)"""
+        return beta_to_pf(self.beta_at(level))
+
+    def level_at_beta(self, beta: Union[float, np.ndarray]) -> Union[float, np.ndarray]:
+        """The lowest river level at which the reliability index drops to the given value(s)
+
+        Args:
+            beta (Union[float, np.ndarray]): the reliability index (or indices)
+
+        Returns:
+            Union[float, np.ndarray]: the river level or nan if the curve does not reach the value
+        """
+        targets = np.atleast_1d(np.asarray(beta, dtype=float))
+        result = np.full(targets.shape, np.nan)
+
+        if len(self.levels) > 0:
+            # the first point is already at or below the target
+            at_start = self.betas[0] <= targets
+            result[at_start] = self.levels[0]
+
+        if len(self.levels) > 1:
+            # per target (rows) the segments (columns) where beta crosses the target
+            b0 = self.betas[:-1][np.newaxis, :]
+            b1 = self.betas[1:][np.newaxis, :]
+            t = targets[:, np.newaxis]
+            crosses = (b0 > t) & (b1 <= t)
+            has_crossing = crosses.any(axis=1) & ~at_start
+            segment = np.argmax(crosses, axis=1)[has_crossing]
+
+            t = targets[has_crossing]
+            b0, b1 = self.betas[segment], self.betas[segment + 1]
+            x0, x1 = self.levels[segment], self.levels[segment + 1]
+            result[has_crossing] = x0 + (b0 - t) / (b0 - b1) * (x1 - x0)
+
+        return float(result[0]) if np.ndim(beta) == 0 else result
+
+    def level_at_pf(self, pf: Union[float, np.ndarray]) -> Union[float, np.ndarray]:
+        """The lowest river level at which the failure probability reaches the given value(s)
+
+        Example; the river level at which the failure probability hits P_EIS_OND_DSN
+
+            curve.level_at_pf(P_EIS_OND_DSN[dtcode])
+
+        Args:
+            pf (Union[float, np.ndarray]): the failure probability (or probabilities)
+
+        Returns:
+            Union[float, np.ndarray]: the river level or nan if the curve does not reach the value
+        """
+        return self.level_at_beta(pf_to_beta(pf))
+
+    def category_levels(self, dtcode: str) -> np.ndarray:
+        """The river levels at which the failure probability crosses the category boundaries (Iv - VIv)
+
+        Args:
+            dtcode (str): dike trajectory code like 34-1
+
+        Returns:
+            np.ndarray: the river level per boundary (see get_pf_boundaries), nan if the boundary is not reached
+        """
+        return self.level_at_pf(np.array(get_pf_boundaries(dtcode)))
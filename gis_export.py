@@ -0,0 +1,241 @@
+# zet de resultaten uit de resultaten database (zie results_store.py) als lijnen langs
+# de referentielijnen in een shapefile, gebruik
+#
+# python gis_export.py [--store results.sqlite] [--reflines map] [--output resultaten.shp]
+#
+# per stix bestand (<dijkcode>_<van>-<tot>.stix) wordt het deel van de referentielijn
+# tussen van en tot bepaald (alle delen van een traject in een keer), de richting van
+# de metrering per traject staat in REFLINE_REVERSED in settings.py
+import argparse
+import logging
+from itertools import groupby
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import shapefile
+
+from fragility_curve import FragilityCurve
+from old_code.get_reflines import CHAINAGE_TOLERANCE, ReferenceLine, get_reflines
+from results_store import BERM, FRAGILITY, ResultsStore
+from settings import REFLINE_REVERSED, SF_REQUIRED
+
+RESULTS_STORE_FILE = "Z:\\Documents\\Klanten\\Output\\WSBD\\results.sqlite"
+REFLINES_PATH = "Z:\\Documents\\Klanten\\OneDrive\\WSBD\\GIS\\referentielijnen"
+OUTPUT_FILE = "Z:\\Documents\\Klanten\\Output\\WSBD\\GIS\\resultaten.shp"
+
+# the chainage in the filenames is in km, the chainage along the reference lines in m
+CHAINAGE_FACTOR = 1000.0
+
+# the categories the river level fields are named after (h_IIv is the river level at
+# which the failure probability crosses from category Iv into IIv)
+CATEGORIES = ["Iv", "IIv", "IIIv", "IVv", "Vv", "VIv"]
+
+
+def get_chosen_berm(
+    points: List[Dict[str, Any]], sf_required: float
+) -> Tuple[str, Optional[float], Optional[float], Optional[float]]:
+    """Get the berm that is chosen for a stix file from its berm points
+
+    The berm is not needed if the initial model meets the required safety factor. Else
+    the passing berm closest to the minimum berm is chosen (the smallest berm found by
+    the search or the scan), if there is no passing berm but the filled ditch passes
+    the ditch is chosen.
+
+    Args:
+        points (List[Dict[str, Any]]): the berm points of one stix file
+        sf_required (float): the required safety factor
+
+    Returns:
+        Tuple[str, Optional[float], Optional[float], Optional[float]]: status, x, z and safety factor of the berm
+    """
+    by_name = {p["name"]: p for p in points}
+    if len(points) == 0:
+        return "", None, None, None
+    if "ini" in by_name and by_name["ini"]["factor_of_safety"] >= sf_required:
+        return "niet nodig", None, None, by_name["ini"]["factor_of_safety"]
+
+    berms = [
+        p
+        for p in points
+        if p["berm_x"] is not None
+        and p["berm_z"] is not None
+        and p["factor_of_safety"] >= sf_required
+    ]
+    if len(berms) > 0:
+        if "min" in by_name and by_name["min"]["berm_x"] is not None:
+            x0, z0 = by_name["min"]["berm_x"], by_name["min"]["berm_z"]
+        else:
+            x0, z0 = min((p["berm_x"], p["berm_z"]) for p in berms)
+        berm = min(berms, key=lambda p: np.hypot(p["berm_x"] - x0, p["berm_z"] - z0))
+        return "berm", berm["berm_x"], berm["berm_z"], berm["factor_of_safety"]
+
+    if "ditch" in by_name and by_name["ditch"]["factor_of_safety"] >= sf_required:
+        return "sloot dempen", None, None, by_name["ditch"]["factor_of_safety"]
+    return "geen oplossing", None, None, None
+
+
+def get_sections(store: ResultsStore) -> List[Dict[str, Any]]:
+    """Get the attributes of every stix file in the store (read in one query)
+
+    Returns:
+        List[Dict[str, Any]]: per stix file the trajectory, chainages, governing category, river level per category boundary and the chosen berm
+    """
+    sections = []
+    for filename, points in groupby(store.query(), key=lambda p: p["filename"]):
+        points = list(points)
+        dtcode = points[0]["trajectory"]
+        fc_points = [p for p in points if p["kind"] == FRAGILITY]
+        berm_points = [p for p in points if p["kind"] == BERM]
+
+        section = {
+            "trajectory": dtcode,
+            "start_chainage": points[0]["start_chainage"],
+            "end_chainage": points[0]["end_chainage"],
+            "filename": filename,
+            "category": "",
+            "levels": [None] * (len(CATEGORIES) - 1),
+        }
+        if len(fc_points) > 0:
+            # the category of the point with the highest failure probability governs
+            section["category"] = max(fc_points, key=lambda p: p["pf"])["category"]
+            curve = FragilityCurve(
+                [p["river_level"] for p in fc_points],
+                [p["factor_of_safety"] for p in fc_points],
+                [p["model_factor"] for p in fc_points],
+            )
+            section["levels"] = [
+                None if np.isnan(level) else round(float(level), 3)
+                for level in curve.category_levels(dtcode)
+            ]
+        (
+            section["berm"],
+            section["berm_x"],
+            section["berm_z"],
+            section["berm_sf"],
+        ) = get_chosen_berm(berm_points, SF_REQUIRED.get(dtcode, np.inf))
+        sections.append(section)
+    return sections
+
+
+def get_geometries(
+    sections: List[Dict[str, Any]], reflines: Dict[str, ReferenceLine]
+) -> List[Optional[np.ndarray]]:
+    """Get the part of the reference line of every section, all sections of a trajectory are mapped at once
+
+    Returns:
+        List[Optional[np.ndarray]]: the coordinates per section, None if the trajectory has no reference line or the chainage is outside the reference line
+    """
+    geometries = [None] * len(sections)
+    indices = {}
+    for i, section in enumerate(sections):
+        indices.setdefault(section["trajectory"], []).append(i)
+
+    for dtcode, idx in indices.items():
+        if dtcode not in reflines:
+            logging.warning(
+                f"No reference line for trajectory '{dtcode}', skipping {len(idx)} stix file(s)"
+            )
+            continue
+        refline = reflines[dtcode]
+        if REFLINE_REVERSED.get(dtcode, False):
+            refline = refline.reversed()
+
+        starts = (
+            np.array([sections[i]["start_chainage"] for i in idx]) * CHAINAGE_FACTOR
+        )
+        ends = np.array([sections[i]["end_chainage"] for i in idx]) * CHAINAGE_FACTOR
+        valid = (
+            (np.minimum(starts, ends) >= -CHAINAGE_TOLERANCE)
+            & (np.maximum(starts, ends) <= refline.length + CHAINAGE_TOLERANCE)
+            & (starts < ends)
+        )
+        for i in np.array(idx)[~valid]:
+            logging.warning(
+                f"Invalid chainage for '{sections[i]['filename']}', the reference line of '{dtcode}' is {refline.length:.1f}m long"
+            )
+        coords = refline.coords_between_many(starts[valid], ends[valid])
+        for i, xy in zip(np.array(idx)[valid], coords):
+            geometries[i] = xy
+    return geometries
+
+
+def export_results(
+    store: ResultsStore, reflines: Dict[str, ReferenceLine], output: str
+) -> int:
+    """Write the results of all stix files in the store as lines along the reference lines to a shapefile
+
+    Args:
+        store (ResultsStore): the results store
+        reflines (Dict[str, ReferenceLine]): the reference line per trajectory
+        output (str): the shapefile
+
+    Returns:
+        int: the number of written features
+    """
+    sections = get_sections(store)
+    geometries = get_geometries(sections, reflines)
+
+    num_features = 0
+    Path(output).parent.mkdir(parents=True, exist_ok=True)
+    w = shapefile.Writer(output, shapeType=shapefile.POLYLINE)
+    try:
+        w.field("dijkcode", "C", 10)
+        w.field("van", "N", 12, 3)
+        w.field("tot", "N", 12, 3)
+        w.field("stix", "C", 100)
+        w.field("categorie", "C", 5)
+        for category in CATEGORIES[1:]:
+            w.field(f"h_{category}", "N", 10, 3)
+        w.field("berm", "C", 20)
+        w.field("berm_x", "N", 10, 2)
+        w.field("berm_z", "N", 10, 2)
+        w.field("berm_sf", "N", 10, 3)
+        for section, xy in zip(sections, geometries):
+            if xy is None:
+                continue
+            w.line([xy.tolist()])
+            w.record(
+                section["trajectory"],
+                section["start_chainage"],
+                section["end_chainage"],
+                section["filename"],
+                section["category"],
+                *section["levels"],
+                section["berm"],
+                section["berm_x"],
+                section["berm_z"],
+                section["berm_sf"],
+            )
+            num_features += 1
+    finally:
+        w.close()
+
+    logging.info(
+        f"Written {num_features} of {len(sections)} stix file(s) to '{output}'"
+    )
+    return num_features
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Write the results database as lines along the reference lines to a shapefile"
+    )
+    parser.add_argument("--store", default=RESULTS_STORE_FILE)
+    parser.add_argument("--reflines", default=REFLINES_PATH)
+    parser.add_argument("--output", default=OUTPUT_FILE)
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        format="%(asctime)s %(levelname)s %(message)s",
+        datefmt="%H:%M:%S",
+        level=logging.INFO,
+    )
+
+    store = ResultsStore(args.store)
+    export_results(store, get_reflines(args.reflines), args.output)
+    store.close()
+
+
+if __name__ == "__main__":
+    main()
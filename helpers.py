@@ -1,7 +1,10 @@
-from statistics import NormalDist
 from geolib.models.dstability.internal import AnalysisTypeEnum
-from typing import List
+from typing import List, Tuple, Union
 from pathlib import Path
+import numpy as np
+from scipy.special import ndtr, ndtri
+
+from settings import P_EIS_OND, P_EIS_SIG_DSN, P_EIS_OND_DSN
 
 
 def case_insensitive_glob(filepath: str, fileextension: str) -> List[Path]:
@@ -22,26 +25,68 @@ def case_insensitive_glob(filepath: str, fileextension: str) -> List[Path]:
     return result
 
 
+def read_param_lines(filename: str) -> List[str]:
+    """Read the lines of a parameter file (skipping the header and empty lines)
+
+    Args:
+        filename (str): the parameter file
+
+    Returns:
+        List[str]: the lines with the parameters
+    """
+    return [l.strip() for l in open(filename, "r").readlines() if l.strip() != ""][1:]
+
+
+# Based on sh-macrostabiliteit-v4-28-mei-2021.pdf table 2-4
+MODEL_FACTORS = {
+    AnalysisTypeEnum.BISHOP: 1.11,
+    AnalysisTypeEnum.BISHOP_BRUTE_FORCE: 1.11,
+    AnalysisTypeEnum.SPENCER: 1.07,
+    AnalysisTypeEnum.SPENCER_GENETIC: 1.07,
+    AnalysisTypeEnum.UPLIFT_VAN: 1.06,
+    AnalysisTypeEnum.UPLIFT_VAN_PARTICLE_SWARM: 1.06,
+}
+
+
 def get_model_factor(analysis_type: AnalysisTypeEnum) -> float:
     """Based on sh-macrostabiliteit-v4-28-mei-2021.pdf table 2-4"""
-    if analysis_type in [AnalysisTypeEnum.BISHOP, AnalysisTypeEnum.BISHOP_BRUTE_FORCE]:
-        return 1.11
-    elif analysis_type in [AnalysisTypeEnum.SPENCER, AnalysisTypeEnum.SPENCER_GENETIC]:
-        return 1.07
-    elif analysis_type in [
-        AnalysisTypeEnum.UPLIFT_VAN,
-        AnalysisTypeEnum.UPLIFT_VAN_PARTICLE_SWARM,
-    ]:
-        return 1.06
-    else:
+    try:
+        return MODEL_FACTORS[AnalysisTypeEnum(analysis_type)]
+    except (KeyError, ValueError):
         raise ValueError(
             f"Cannot determine model factor, unknown analysistype '{analysis_type}'."
         )
 
 
-def sf_to_beta(sf: float, model_factor: float):
+def get_model_factors(analysis_types: Union[List, np.ndarray]) -> np.ndarray:
+    """Get the model factors for an array of analysis types
+
+    Args:
+        analysis_types (Union[List, np.ndarray]): the analysis types (AnalysisTypeEnum or their values like 'Bishop')
+
+    Returns:
+        np.ndarray: the model factor per analysis type
+    """
+    analysis_types = np.asarray(
+        [
+            a.value if isinstance(a, AnalysisTypeEnum) else a
+            for a in np.ravel(analysis_types)
+        ],
+        dtype=str,
+    )
+    # only the (few) unique analysis types need a lookup
+    unique_types, inverse = np.unique(analysis_types, return_inverse=True)
+    factors = np.array([get_model_factor(a) for a in unique_types], dtype=float)
+    return factors[inverse]
+
+
+def sf_to_beta(
+    sf: Union[float, np.ndarray], model_factor: Union[float, np.ndarray]
+) -> Union[float, np.ndarray]:
     """Generate reliability index from safety factor
 
+    Works on single values as well as (numpy) arrays
+
     Args:
         sf (float): Safety factor (without model factor)
         model_factor (float): Model factor
@@ -53,35 +98,140 @@ def sf_to_beta(sf: float, model_factor: float):
         Source: sh-macrostabiliteit-v4-28-mei-2021.pdf Table 2.4 (WBI)
 
     Returns:
-        _type_: Beta (reliability index)
+        Union[float, np.ndarray]: Beta (reliability index)
     """
+    if isinstance(sf, (list, tuple)):
+        sf = np.asarray(sf, dtype=float)
+    if isinstance(model_factor, (list, tuple)):
+        model_factor = np.asarray(model_factor, dtype=float)
     return (sf / model_factor - 0.41) / 0.15
 
 
-def beta_to_pf(beta: float) -> float:
+def beta_to_pf(beta: Union[float, np.ndarray]) -> Union[float, np.ndarray]:
     """Convert reliability index to faalkans
 
+    Works on single values as well as (numpy) arrays
+
     Source: handreiking_faalkansanalyses_macrostabiliteit_-_definitief - kader 2.1 (WBI)
 
     Args:
-        beta (float): reliability index
+        beta (Union[float, np.ndarray]): reliability index
 
     Returns:
-        float: faalkans
+        Union[float, np.ndarray]: faalkans
     """
-    a = NormalDist().cdf(-1 * beta)
-    return NormalDist().cdf(x=-beta)
+    pf = ndtr(-np.asarray(beta, dtype=float))
+    return float(pf) if pf.ndim == 0 else pf
 
 
-def pf_to_beta(pf: float) -> float:
+def pf_to_beta(pf: Union[float, np.ndarray]) -> Union[float, np.ndarray]:
     """Convert faalkans to reliability index
 
+    Works on single values as well as (numpy) arrays
+
     Source: handreiking_faalkansanalyses_macrostabiliteit_-_definitief - kader 2.1 (WBI)
 
     Args:
-        pf (float): faalkans
+        pf (Union[float, np.ndarray]): faalkans
+
+    Returns:
+        Union[float, np.ndarray]: reliability index
+    """
+    # -ndtri(pf) equals ndtri(1 - pf) but keeps its precision for small pf
+    beta = -ndtri(np.asarray(pf, dtype=float))
+    return float(beta) if beta.ndim == 0 else beta
+
+
+def get_pf_categories(dtcode: str) -> List[Tuple[float, float, str, str]]:
+    """Get the failure probability categories Iv - VIv for the given dike trajectory
+
+    Source: doc/kennis/bijlage3 tabel 2.3
+
+    Args:
+        dtcode (str): dike trajectory code like 34-1
+
+    Returns:
+        List[Tuple[float, float, str, str]]: lower limit, upper limit, label and color per category
+    """
+    return [
+        (
+            0,
+            1 / 30 * P_EIS_SIG_DSN[dtcode],
+            "Iv voldoet ruim aan signaleringswaarde",
+            "#00ff00",
+        ),
+        (
+            1 / 30 * P_EIS_SIG_DSN[dtcode],
+            P_EIS_SIG_DSN[dtcode],
+            "IIv voldoet aan signaleringswaarde",
+            "#76933c",
+        ),
+        (
+            P_EIS_SIG_DSN[dtcode],
+            P_EIS_OND_DSN[dtcode],
+            "IIIv voldoet aan de ondergrens en mogelijk de signaleringswaarde",
+            "#ffff00",
+        ),
+        (
+            P_EIS_OND_DSN[dtcode],
+            P_EIS_OND[dtcode],
+            "IVv voldoet mogelijk aan de ondergrens of aan de signaleringwaarde",
+            "#ccc0da",
+        ),
+        (
+            P_EIS_OND[dtcode],
+            30 * P_EIS_OND[dtcode],
+            "Vv voldoet niet aan de ondergrens",
+            "#ff9900",
+        ),
+        (
+            30 * P_EIS_OND[dtcode],
+            1,
+            "VIv voldoet ruim niet aan de ondergrens",
+            "#ff0000",
+        ),
+    ]
+
+
+def get_pf_boundaries(dtcode: str) -> List[float]:
+    """Get the failure probabilities that separate the categories Iv - VIv
+
+    Args:
+        dtcode (str): dike trajectory code like 34-1
+
+    Returns:
+        List[float]: the (ascending) failure probabilities at the category boundaries
+    """
+    return [c[1] for c in get_pf_categories(dtcode)[:-1]]
+
+
+def get_pf_category(
+    pf: Union[float, np.ndarray], dtcode: str
+) -> Union[str, np.ndarray]:
+    """Get the category (Iv - VIv) of the given failure probability (or probabilities)
+
+    Args:
+        pf (Union[float, np.ndarray]): the failure probability
+        dtcode (str): dike trajectory code like 34-1
+
+    Returns:
+        Union[str, np.ndarray]: the category like 'IIIv'
+    """
+    labels = np.array([c[2].split(" ")[0] for c in get_pf_categories(dtcode)])
+    idx = np.searchsorted(get_pf_boundaries(dtcode), pf, side="right")
+    return str(labels[idx]) if np.ndim(idx) == 0 else labels[idx]
+
+
+def parse_stix_filename(filename: str) -> Tuple[str, float, float]:
+    """Get the dike trajectory code and chainages from a filename like 34-1_12.30-12.50.stix
+
+    Args:
+        filename (str): the stix filename
 
     Returns:
-        float: reliability index
+        Tuple[str, float, float]: dike trajectory code, start and end chainage
     """
-    return NormalDist().inv_cdf(1 - pf)
+    dtcode, s = Path(filename).name.split("_")
+    start_chainage = float(s.split("-")[0])
+    end_chainage = float(s.split("-")[1].replace(".stix", ""))
+    return dtcode, start_chainage, end_chainage
@@ -0,0 +1,260 @@
+import cProfile
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+# the stages of the scripts, an event is recorded per stage and per model
+#
+# copy          copying stix files and (deep) copies of models
+# parse         parsing the original stix file
+# waternet      generate_waternet
+# berm_geometry creating the berm / filled ditch (AlgorithmBermWSBD)
+# serialize     writing the stix files for the console
+# console       the DStability console
+# result_parse  reading the results from the calculated stix file
+# plot          creating the fragility curve plots
+STAGES = [
+    "copy",
+    "parse",
+    "waternet",
+    "berm_geometry",
+    "serialize",
+    "console",
+    "result_parse",
+    "plot",
+]
+
+
+def _io_counters() -> Optional[Tuple[int, int]]:
+    """Get the bytes read and written by this process (None if not available)"""
+    try:
+        with open("/proc/self/io") as f:
+            counters = dict(line.split(":") for line in f if ":" in line)
+        return int(counters["rchar"]), int(counters["wchar"])
+    except (OSError, KeyError, ValueError):
+        pass
+    try:
+        import psutil
+
+        counters = psutil.Process().io_counters()
+        return counters.read_bytes, counters.write_bytes
+    except (ImportError, AttributeError):
+        return None
+
+
+# seconds between the samples of the resident set size during a stage
+RSS_SAMPLE_INTERVAL = 0.05
+
+
+def _rss(pid: int) -> Optional[int]:
+    """Get the current resident set size of the process in bytes (None if not available)"""
+    try:
+        with open(f"/proc/{pid}/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        pass
+    try:
+        import psutil
+
+        return psutil.Process(pid).memory_info().rss
+    except Exception:
+        # no psutil or the process is gone
+        return None
+
+
+class PeakRssSampler:
+    """Sample the resident set size of a process in a background thread and keep the peak
+
+    The peak memory of the operating system (like ru_maxrss) is the peak over the whole
+    life of a process, sampling gives the peak of one stage of this process or of one
+    child process (the console) instead. Peaks shorter than RSS_SAMPLE_INTERVAL can be
+    missed.
+
+    Args:
+        pid (Optional[int], optional): the process to sample (this process if None). Defaults to None.
+    """
+
+    def __init__(self, pid: Optional[int] = None):
+        self.pid = os.getpid() if pid is None else pid
+        self.peak = _rss(self.pid)
+        self._stop = threading.Event()
+        self._thread = None
+        if self.peak is not None:
+            self._thread = threading.Thread(target=self._sample, daemon=True)
+            self._thread.start()
+
+    def _sample(self):
+        while not self._stop.wait(RSS_SAMPLE_INTERVAL):
+            self._update()
+
+    def _update(self):
+        rss = _rss(self.pid)
+        if rss is not None:
+            self.peak = max(self.peak, rss)
+
+    def stop(self) -> Optional[int]:
+        """Stop sampling and get the peak resident set size in bytes (None if not available)"""
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+            self._update()
+        return self.peak
+
+
+class Recorder:
+    """Record the duration, bytes read and written and the peak memory use per stage and per model
+
+    Every stage results in an event (a dictionary), if a filename is given the events
+    are written to that file as JSON lines. Events of other processes (like the workers
+    of the scheduler) can be added with add. The events are only kept in memory (events)
+    if keep_events is set, the summary is updated per event so a long run does not
+    collect all its events.
+
+    If profile is set the python side stages (all but the console) are profiled with
+    cProfile, the statistics are written to <filename>.prof on close.
+    """
+
+    def __init__(
+        self,
+        filename: Optional[str] = None,
+        profile: bool = False,
+        keep_events: bool = True,
+    ):
+        self.filename = filename
+        self.keep_events = keep_events
+        self.events = []
+        # stage -> count, total and maximum duration, bytes read and written and peak rss
+        self._totals = {}
+        self._file = None
+        if filename is not None:
+            Path(filename).parent.mkdir(parents=True, exist_ok=True)
+            self._file = open(filename, "w", encoding="utf-8")
+        self._profile = cProfile.Profile() if profile else None
+        self._depth = 0  # the profiler can only be enabled once for nested stages
+
+    @contextmanager
+    def stage(
+        self, name: str, model: Any = "", child_processes: bool = False
+    ) -> Iterator[Dict[str, Any]]:
+        """Record the stage of the code within the with block
+
+        The event is yielded so the code can add fields or set the bytes read and
+        written itself (for example for work done by a child process).
+
+        Args:
+            name (str): the name of the stage (see STAGES)
+            model (Any, optional): the model (like the stix file or the name of the berm). Defaults to "".
+            child_processes (bool, optional): the work is done by a child process (the console), the peak memory of this process is not measured but can be set in the event (see PeakRssSampler). Defaults to False.
+        """
+        event = {
+            "stage": name,
+            "model": str(model),
+            "pid": os.getpid(),
+            "time": time.time(),
+        }
+        io = _io_counters()
+        sampler = None if child_processes else PeakRssSampler()
+        profiling = self._profile is not None and self._depth == 0 and name != "console"
+        self._depth += 1
+        if profiling:
+            self._profile.enable()
+        start = time.perf_counter()
+        try:
+            yield event
+        except Exception as e:
+            event["error"] = str(e)
+            raise
+        finally:
+            event["duration"] = time.perf_counter() - start
+            if profiling:
+                self._profile.disable()
+            self._depth -= 1
+            if io is not None:
+                read, written = _io_counters()
+                event.setdefault("bytes_read", read - io[0])
+                event.setdefault("bytes_written", written - io[1])
+            event.setdefault("peak_rss", None if sampler is None else sampler.stop())
+            self.add([event])
+
+    def add(self, events: List[Dict[str, Any]]):
+        """Add the events (of this or another process)"""
+        if self.keep_events:
+            self.events += events
+        for event in events:
+            totals = self._totals.setdefault(event["stage"], [0, 0.0, 0.0, 0, 0, 0])
+            totals[0] += 1
+            totals[1] += event["duration"]
+            totals[2] = max(totals[2], event["duration"])
+            totals[3] += event.get("bytes_read") or 0
+            totals[4] += event.get("bytes_written") or 0
+            totals[5] = max(totals[5], event.get("peak_rss") or 0)
+        if self._file is not None:
+            for event in events:
+                self._file.write(json.dumps(event) + "\n")
+            self._file.flush()
+
+    def summary(self) -> str:
+        """Get a table with the number of events, the total, mean and maximum duration, the bytes read and written and the peak memory per stage"""
+        names = [s for s in STAGES if s in self._totals] + sorted(
+            s for s in self._totals if s not in STAGES
+        )
+
+        lines = [
+            f"{'stage':<14}{'count':>8}{'total [s]':>12}{'mean [s]':>10}{'max [s]':>10}{'read [MB]':>11}{'written [MB]':>14}{'peak rss [MB]':>15}"
+        ]
+        for name in names:
+            count, total, maximum, read, written, peak_rss = self._totals[name]
+            lines.append(
+                f"{name:<14}{count:>8}{total:>12.2f}{total / count:>10.3f}{maximum:>10.3f}{read / 1e6:>11.1f}{written / 1e6:>14.1f}{peak_rss / 1e6:>15.1f}"
+            )
+        return "\n".join(lines)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if self._profile is not None:
+            profile_filename = (
+                f"{self.filename}.prof" if self.filename is not None else "stages.prof"
+            )
+            self._profile.dump_stats(profile_filename)
+            logging.info(f"Written the profile of the stages to '{profile_filename}'")
+
+
+# the recorder of this process, replace it with enable to write the events to a file,
+# it only keeps the summary in memory
+_recorder = Recorder(keep_events=False)
+
+
+def enable(filename: Optional[str] = None, profile: bool = False) -> Recorder:
+    """Start a new recorder for this process that writes the events to the given file"""
+    global _recorder
+    _recorder = Recorder(filename, profile, keep_events=False)
+    return _recorder
+
+
+def stage(
+    name: str, model: Any = "", child_processes: bool = False
+) -> Iterator[Dict[str, Any]]:
+    """Record a stage with the recorder of this process (see Recorder.stage)"""
+    return _recorder.stage(name, model, child_processes)
+
+
+def add_events(events: List[Dict[str, Any]]):
+    """Add the events of another process to the recorder of this process"""
+    _recorder.add(events)
+
+
+def log_summary():
+    """Log the summary table of the recorder of this process"""
+    logging.info(f"Time and resources per stage\n{_recorder.summary()}")
+
+
+def close():
+    _recorder.close()
@@ -0,0 +1,286 @@
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from settings import SF_REQUIRED
+
+# index of all stix files in a directory tree (like PATH_TO_STIXFILES) with the dike
+# trajectory, chainage, modification time, size and content hash of every file
+#
+# the index is a sqlite database next to the directory, on update only the
+# directories with a new modification time are listed again and only the new and
+# changed files are parsed and hashed, a full walk of a network share with thousands
+# of files is only needed the first time (or with update(full=True))
+#
+# note that only the standard library (and settings.py) is used so the old_code tooling
+# can use it
+
+COLUMNS = [
+    "path",
+    "name",
+    "trajectory",
+    "start_chainage",
+    "end_chainage",
+    "mtime",
+    "size",
+    "sha256",
+]
+
+CHAINAGE_PATTERN = re.compile(r"^\d+(\.\d+)?-\d+(\.\d+)?$")
+
+
+def get_inventory_filename(path: str) -> str:
+    """Get the filename of the index of the given directory (next to the directory)"""
+    path = Path(path)
+    return str(path.parent / f"{path.name}_inventory.sqlite")
+
+
+def parse_filename(
+    filename: str,
+) -> Tuple[Optional[str], Optional[float], Optional[float]]:
+    """Get the dike trajectory code and the start and end chainage [km] from a filename like 34-1_12.30-12.50.stix
+
+    The parts of the filename are separated by underscores and may be in any order, a
+    part is only taken as the dike trajectory if it is one of the known trajectories
+    (SF_REQUIRED in settings.py) so a chainage like 12-13 is never taken for one.
+
+    Returns:
+        Tuple[Optional[str], Optional[float], Optional[float]]: dike trajectory code, start and end chainage (None if not found)
+    """
+    trajectory, start, end = None, None, None
+    for part in Path(filename).stem.split("_"):
+        if trajectory is None and part.upper() in SF_REQUIRED:
+            trajectory = part.upper()
+        elif start is None and CHAINAGE_PATTERN.match(part):
+            start, end = [float(s) for s in part.split("-")]
+    return trajectory, start, end
+
+
+def file_hash(filename: str) -> str:
+    """Get the sha256 hash of the content of the file"""
+    h = hashlib.sha256()
+    with open(filename, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class StixInventory:
+    """Cached index of the stix files in a directory tree
+
+    Args:
+        path (str): the directory with the stix files (like PATH_TO_STIXFILES)
+        filename (Optional[str], optional): the index database (next to the directory if None). Defaults to None.
+    """
+
+    def __init__(self, path: str, filename: Optional[str] = None):
+        self.path = str(Path(path))
+        self.filename = get_inventory_filename(path) if filename is None else filename
+        self._connection = sqlite3.connect(self.filename)
+        self._connection.execute("""CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY,
+                name TEXT NOT NULL,
+                trajectory TEXT,
+                start_chainage REAL,
+                end_chainage REAL,
+                mtime REAL,
+                size INTEGER,
+                sha256 TEXT,
+                directory TEXT NOT NULL
+            )""")
+        self._connection.execute("""CREATE TABLE IF NOT EXISTS directories (
+                path TEXT PRIMARY KEY,
+                parent TEXT,
+                mtime REAL
+            )""")
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS idx_name ON files (name COLLATE NOCASE)"
+        )
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS idx_trajectory ON files (trajectory, start_chainage)"
+        )
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS idx_directory ON files (directory)"
+        )
+        self._connection.commit()
+
+    def _remove_directory(self, directory: str) -> int:
+        """Remove a directory, its subdirectories and their files from the index, returns the number of removed files"""
+        num_removed = 0
+        for (subdirectory,) in self._connection.execute(
+            "SELECT path FROM directories WHERE parent=?", (directory,)
+        ).fetchall():
+            num_removed += self._remove_directory(subdirectory)
+        num_removed += self._connection.execute(
+            "DELETE FROM files WHERE directory=?", (directory,)
+        ).rowcount
+        self._connection.execute("DELETE FROM directories WHERE path=?", (directory,))
+        return num_removed
+
+    def update(self, full: bool = False) -> Dict[str, int]:
+        """Update the index with the new, changed and removed stix files
+
+        Directories that have the same modification time as in the index are not
+        listed again (files that are added, removed or replaced change the
+        modification time of the directory). Use full to check the modification
+        time and size of every file, for example after files were changed in place.
+
+        Args:
+            full (bool, optional): list all directories and check all files. Defaults to False.
+
+        Returns:
+            Dict[str, int]: the number of added, changed and removed files
+        """
+        start = time.time()
+        counts = {"added": 0, "changed": 0, "removed": 0}
+        known_directories = {
+            path: mtime
+            for path, mtime in self._connection.execute(
+                "SELECT path, mtime FROM directories"
+            ).fetchall()
+        }
+
+        with self._connection:
+            stack = [self.path]
+            while len(stack) > 0:
+                directory = stack.pop()
+                try:
+                    mtime = os.stat(directory).st_mtime
+                except OSError:
+                    continue
+
+                if not full and known_directories.get(directory) == mtime:
+                    stack += [
+                        path
+                        for (path,) in self._connection.execute(
+                            "SELECT path FROM directories WHERE parent=?",
+                            (directory,),
+                        ).fetchall()
+                    ]
+                    continue
+
+                files, subdirectories = {}, []
+                try:
+                    with os.scandir(directory) as entries:
+                        for entry in entries:
+                            if entry.is_dir():
+                                subdirectories.append(entry.path)
+                            elif entry.name.lower().endswith(".stix"):
+                                # on windows scandir gets the stat without an extra request
+                                files[entry.path] = entry.stat()
+                except OSError as e:
+                    logging.warning(f"Cannot list '{directory}'; '{e}'")
+                    continue
+
+                known_files = {
+                    path: (mtime, size)
+                    for path, mtime, size in self._connection.execute(
+                        "SELECT path, mtime, size FROM files WHERE directory=?",
+                        (directory,),
+                    ).fetchall()
+                }
+                for path, stat in files.items():
+                    known = known_files.get(path)
+                    if known == (stat.st_mtime, stat.st_size):
+                        continue
+                    trajectory, start_chainage, end_chainage = parse_filename(path)
+                    self._connection.execute(
+                        f"INSERT OR REPLACE INTO files ({', '.join(COLUMNS)}, directory) VALUES ({', '.join('?' * (len(COLUMNS) + 1))})",
+                        (
+                            path,
+                            Path(path).name,
+                            trajectory,
+                            start_chainage,
+                            end_chainage,
+                            stat.st_mtime,
+                            stat.st_size,
+                            file_hash(path),
+                            directory,
+                        ),
+                    )
+                    counts["added" if known is None else "changed"] += 1
+                for path in set(known_files.keys()) - set(files.keys()):
+                    self._connection.execute("DELETE FROM files WHERE path=?", (path,))
+                    counts["removed"] += 1
+
+                for (path,) in self._connection.execute(
+                    "SELECT path FROM directories WHERE parent=?", (directory,)
+                ).fetchall():
+                    if path not in subdirectories:
+                        counts["removed"] += self._remove_directory(path)
+                for path in subdirectories:
+                    self._connection.execute(
+                        "INSERT OR IGNORE INTO directories (path, parent, mtime) VALUES (?, ?, NULL)",
+                        (path, directory),
+                    )
+                self._connection.execute(
+                    "INSERT OR REPLACE INTO directories (path, parent, mtime) VALUES (?, ?, ?)",
+                    (
+                        directory,
+                        None if directory == self.path else str(Path(directory).parent),
+                        mtime,
+                    ),
+                )
+                stack += subdirectories
+
+        logging.info(
+            f"Updated the inventory of '{self.path}' in {time.time() - start:.1f} seconds, {counts['added']} added, {counts['changed']} changed and {counts['removed']} removed file(s)"
+        )
+        return counts
+
+    def query(
+        self,
+        trajectory: Optional[str] = None,
+        min_chainage: Optional[float] = None,
+        max_chainage: Optional[float] = None,
+        name: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        """Get the stix files that match all given filters
+
+        Args:
+            trajectory (Optional[str], optional): dike trajectory code like 34-1. Defaults to None.
+            min_chainage (Optional[float], optional): only files that end after this chainage [km]. Defaults to None.
+            max_chainage (Optional[float], optional): only files that start before this chainage [km]. Defaults to None.
+            name (Optional[str], optional): the filename without the directory (case insensitive). Defaults to None.
+
+        Returns:
+            List[Dict[str, Any]]: the files (with the COLUMNS as keys) ordered by trajectory and chainage
+        """
+        conditions, params = [], []
+        for condition, value in [
+            ("trajectory = ?", trajectory.upper() if trajectory else None),
+            ("end_chainage >= ?", min_chainage),
+            ("start_chainage <= ?", max_chainage),
+            ("name = ? COLLATE NOCASE", name),
+        ]:
+            if value is not None:
+                conditions.append(condition)
+                params.append(value)
+
+        sql = f"SELECT {', '.join(COLUMNS)} FROM files"
+        if len(conditions) > 0:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY trajectory, start_chainage, path"
+        return [
+            dict(zip(COLUMNS, row))
+            for row in self._connection.execute(sql, params).fetchall()
+        ]
+
+    def find(self, name: str) -> Optional[Path]:
+        """Get the path of the stix file with the given name (None if it is not in the index)"""
+        files = self.query(name=Path(name).name)
+        if len(files) == 0:
+            return None
+        if len(files) > 1:
+            logging.warning(
+                f"Found {len(files)} stix files named '{name}', using '{files[0]['path']}'"
+            )
+        return Path(files[0]["path"])
+
+    def close(self):
+        self._connection.close()
@@ -0,0 +1,114 @@
+import json
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+
+class RunJournal:
+    """Append-only journal of the finished calculations of a run
+
+    Every finished calculation (succesful or not) is written as one json line and
+    flushed to disk right away so the journal survives a crash or reboot. If the run
+    is resumed the succesful calculations are read back and do not need to be
+    calculated again, failed and missing calculations are calculated again.
+
+    A calculation is identified by the name of the stix file and the result name (the
+    job name or the scenario label) so a resumed run needs to create the same stix
+    files. The directory is left out so a run in a (new) scratch directory (see
+    workspace.py) can be resumed.
+    """
+
+    def __init__(self, filename: str, resume: bool = False):
+        """Open the journal
+
+        Args:
+            filename (str): the journal file
+            resume (bool, optional): read the existing journal, if False the journal is cleared. Defaults to False.
+        """
+        self.filename = filename
+        self._done: Dict[Tuple[str, str], Dict] = {}
+
+        Path(filename).parent.mkdir(parents=True, exist_ok=True)
+        if resume and Path(filename).exists():
+            for line in open(filename, "r").readlines():
+                if line.strip() == "":
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # the last line might be incomplete if the run crashed while writing
+                    continue
+                key = (Path(record["filename"]).name, record["name"])
+                if record["factor_of_safety"] is None:
+                    self._done.pop(key, None)
+                else:
+                    self._done[key] = record
+            logging.info(
+                f"Resuming from '{filename}' with {len(self._done)} finished calculation(s)"
+            )
+
+        self._file = open(filename, "a" if resume else "w")
+        if resume and self._file.tell() > 0:
+            # start on a new line in case the last line is incomplete
+            self._file.write("\n")
+
+    def __len__(self) -> int:
+        return len(self._done)
+
+    def get(self, filename: str, name: str) -> Optional[Dict]:
+        """Get the journal record of a succesful calculation
+
+        Args:
+            filename (str): the stix file
+            name (str): the name of the result
+
+        Returns:
+            Optional[Dict]: the record or None if the calculation is not finished
+        """
+        return self._done.get((Path(filename).name, name))
+
+    def add(
+        self,
+        filename: str,
+        name: str,
+        factor_of_safety: Optional[float],
+        analysis_type: Optional[str],
+        slip_plane: Optional[Dict] = None,
+        runtime: float = 0.0,
+        error: str = "",
+    ):
+        """Write a finished calculation to the journal
+
+        Args:
+            filename (str): the stix file
+            name (str): the name of the result
+            factor_of_safety (Optional[float]): the safety factor, None if the calculation failed
+            analysis_type (Optional[str]): the analysis type used in the calculation
+            slip_plane (Optional[Dict], optional): the critical slip plane. Defaults to None.
+            runtime (float, optional): the runtime of the calculation [s]. Defaults to 0.0.
+            error (str, optional): the error if the calculation failed. Defaults to "".
+        """
+        record = {
+            "filename": str(filename),
+            "name": name,
+            "factor_of_safety": factor_of_safety,
+            "analysis_type": analysis_type,
+            "slip_plane": slip_plane,
+            "runtime": runtime,
+            "error": error,
+            "time": time.time(),
+        }
+        self._file.write(json.dumps(record) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+        key = (Path(filename).name, name)
+        if factor_of_safety is None:
+            self._done.pop(key, None)
+        else:
+            self._done[key] = record
+
+    def close(self):
+        self._file.close()
@@ -0,0 +1,125 @@
+from pathlib import Path
+from typing import List
+
+from geolib.models import DStabilityModel
+
+from instrumentation import stage
+from multi_scenario import append_scenario, clear_results
+
+
+class WaternetVariantBuilder:
+    """Create river level variants of a stix file without parsing the file for every level
+
+    The stix file is parsed once (and its results are removed), for every variant only
+    the waternet is regenerated and the model is serialized directly to the new file.
+    Afterwards the waternet of the base model is restored so every variant starts from
+    the original model.
+    """
+
+    def __init__(
+        self, filename: str, scenario_label: str = "Norm", stage_label: str = "Norm"
+    ):
+        """Parse the base model
+
+        Args:
+            filename (str): the original stix file
+            scenario_label (str, optional): the scenario to use. Defaults to "Norm".
+            stage_label (str, optional): the stage to use. Defaults to "Norm".
+        """
+        with stage("parse", filename):
+            self._model = DStabilityModel()
+            self._model.parse(Path(filename))
+        clear_results(self._model)
+        self._model.set_scenario_and_stage_by_label(scenario_label, stage_label)
+        self.snapshot()
+
+    def snapshot(self):
+        """Save the current state of the base model, restore() returns to this state
+
+        Call this after changing the base model on purpose (like the analysis type)
+        """
+        # the only parts of the model that are changed by generate_waternet (and the
+        # calculation settings which might be changed to narrow the search area)
+        self._calculationsettings = [
+            c.copy(deep=True) for c in self._model.datastructure.calculationsettings
+        ]
+        self._waternets = [
+            w.copy(deep=True) for w in self._model.datastructure.waternets
+        ]
+        self._waternetcreatorsettings = [
+            w.copy(deep=True) for w in self._model.datastructure.waternetcreatorsettings
+        ]
+
+    @property
+    def model(self) -> DStabilityModel:
+        """The base model, do not change it"""
+        return self._model
+
+    def build(self, river_level: float, filename: str, adjust_for_uplift: bool = True):
+        """Generate the waternet for the given river level and write the variant to a stix file
+
+        Args:
+            river_level (float): the river level
+            filename (str): the stix file to write the variant to
+            adjust_for_uplift (bool, optional): adjust the waternet for uplift. Defaults to True.
+        """
+        try:
+            with stage("waternet", filename):
+                self._model.generate_waternet(
+                    river_level_mhw=river_level, adjust_for_uplift=adjust_for_uplift
+                )
+            with stage("serialize", filename):
+                self._model.serialize(Path(filename))
+        finally:
+            self.restore()
+
+    def build_packed(
+        self, river_levels: List[float], filename: str, adjust_for_uplift: bool = True
+    ) -> List[str]:
+        """Write all river level variants as scenarios of one stix file
+
+        Every river level becomes a scenario labeled with str(river_level) so the
+        DStability console only has to start once for all levels. Use the labels as
+        the scenarios of the Job to get the result per level.
+
+        Args:
+            river_levels (List[float]): the river levels
+            filename (str): the stix file to write the variants to
+            adjust_for_uplift (bool, optional): adjust the waternet for uplift. Defaults to True.
+
+        Returns:
+            List[str]: the labels of the scenarios
+        """
+        labels = [str(river_level) for river_level in river_levels]
+        scenario_index = int(self._model.current_scenario)
+        packed = None
+        try:
+            for river_level, label in zip(river_levels, labels):
+                with stage("waternet", f"{filename}:{label}"):
+                    self._model.generate_waternet(
+                        river_level_mhw=river_level, adjust_for_uplift=adjust_for_uplift
+                    )
+                with stage("copy", f"{filename}:{label}"):
+                    if packed is None:
+                        packed = self._model.copy(deep=True)
+                        packed.datastructure.scenarios[scenario_index].Label = label
+                    else:
+                        append_scenario(packed, self._model, scenario_index, label)
+                self.restore()
+            with stage("serialize", filename):
+                packed.serialize(Path(filename))
+        finally:
+            self.restore()
+        return labels
+
+    def restore(self):
+        """Restore the original waternet and calculation settings of the base model"""
+        self._model.datastructure.calculationsettings = [
+            c.copy(deep=True) for c in self._calculationsettings
+        ]
+        self._model.datastructure.waternets = [
+            w.copy(deep=True) for w in self._waternets
+        ]
+        self._model.datastructure.waternetcreatorsettings = [
+            w.copy(deep=True) for w in self._waternetcreatorsettings
+        ]
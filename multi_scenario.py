@@ -0,0 +1,215 @@
+from pathlib import Path
+from typing import Any, Dict, List, Set
+
+from geolib.models import DStabilityModel
+
+from instrumentation import stage
+
+# the fields of a stage that refer to an item in one of the lists of the datastructure
+STAGE_REFERENCES = {
+    "GeometryId": "geometries",
+    "SoilLayersId": "soillayers",
+    "WaternetId": "waternets",
+    "WaternetCreatorSettingsId": "waternetcreatorsettings",
+    "StateId": "states",
+    "StateCorrelationsId": "statecorrelations",
+    "LoadsId": "loads",
+    "ReinforcementsId": "reinforcements",
+    "DecorationsId": "decorations",
+}
+CALCULATION_REFERENCES = {"CalculationSettingsId": "calculationsettings"}
+
+
+def _collect_ids(data: Any, ids: Set[str]):
+    """Collect the values of all 'Id' fields in the (nested) data"""
+    if isinstance(data, dict):
+        for k, v in data.items():
+            if k == "Id" and isinstance(v, str) and v.isdigit():
+                ids.add(v)
+            else:
+                _collect_ids(v, ids)
+    elif isinstance(data, list):
+        for v in data:
+            _collect_ids(v, ids)
+
+
+def _replace_ids(data: Any, id_map: Dict[str, str]) -> Any:
+    """Replace all ids (fields named like 'Id', 'LayerId', 'HeadLineIds' etc.) using the id map"""
+    if isinstance(data, dict):
+        result = {}
+        for k, v in data.items():
+            if k.endswith("Id") and isinstance(v, str):
+                result[k] = id_map.get(v, v)
+            elif k.endswith("Ids") and isinstance(v, list):
+                result[k] = [id_map.get(i, i) if isinstance(i, str) else i for i in v]
+            else:
+                result[k] = _replace_ids(v, id_map)
+        return result
+    elif isinstance(data, list):
+        return [_replace_ids(v, id_map) for v in data]
+    return data
+
+
+def _max_id(model: DStabilityModel) -> int:
+    ids = set()
+    _collect_ids(model.datastructure.dict(), ids)
+    return max([int(i) for i in ids], default=0)
+
+
+def append_scenario(
+    target: DStabilityModel,
+    source: DStabilityModel,
+    scenario_index: int,
+    label: str,
+) -> int:
+    """Copy a scenario (with its stages and calculation settings) from source to target
+
+    All items that are referenced by the stages and calculations of the scenario
+    (geometry, soil layers, waternet, states etc.) are copied and get new ids so
+    they do not clash with the ids in the target. Soils are not copied so the
+    source and target need to have the same soils. Results are not copied.
+
+    Args:
+        target (DStabilityModel): the model to add the scenario to
+        source (DStabilityModel): the model with the scenario (may be the target)
+        scenario_index (int): the index of the scenario in the source
+        label (str): the label of the new scenario
+
+    Returns:
+        int: the index of the new scenario in the target
+    """
+    scenario = source.datastructure.scenarios[scenario_index]
+
+    # find all items that belong to the scenario
+    references = []  # (list name, id)
+    for stage in scenario.Stages:
+        for field, list_name in STAGE_REFERENCES.items():
+            references.append((list_name, getattr(stage, field, None)))
+    for calculation in scenario.Calculations:
+        for field, list_name in CALCULATION_REFERENCES.items():
+            references.append((list_name, getattr(calculation, field, None)))
+
+    items = []  # (list name, dict of the item)
+    for list_name, item_id in dict.fromkeys(references):
+        if item_id is None:
+            continue
+        items += [
+            (list_name, item.dict())
+            for item in getattr(source.datastructure, list_name)
+            if item.Id == item_id
+        ]
+
+    # every id that is defined in the copied items gets a new id
+    scenario_data = scenario.dict()
+    ids = set()
+    _collect_ids(scenario_data, ids)
+    for _, item in items:
+        _collect_ids(item, ids)
+    next_id = _max_id(target) + 1
+    id_map = {}
+    for i in sorted(ids, key=int):
+        id_map[i] = str(next_id)
+        next_id += 1
+
+    for list_name, item in items:
+        items_list = getattr(target.datastructure, list_name)
+        item_type = type(getattr(source.datastructure, list_name)[0])
+        items_list.append(item_type.parse_obj(_replace_ids(item, id_map)))
+
+    scenario_data = _replace_ids(scenario_data, id_map)
+    scenario_data["Label"] = label
+    for calculation in scenario_data.get("Calculations") or []:
+        calculation["ResultId"] = None
+    target.datastructure.scenarios.append(type(scenario).parse_obj(scenario_data))
+
+    return len(target.datastructure.scenarios) - 1
+
+
+def clear_results(model: DStabilityModel):
+    """Remove all results (and the references to them) from the model
+
+    A stix file that is written for the console should not hold the results of the
+    model it was made from, if the console fails these would be read as its result.
+    """
+    for name in model.datastructure.__fields__:
+        if name.endswith("_results"):
+            setattr(model.datastructure, name, [])
+    for scenario in model.datastructure.scenarios:
+        for calculation in scenario.Calculations or []:
+            calculation.ResultId = None
+
+
+def pack_models(
+    models: Dict[str, DStabilityModel], filename: str, scenario_index: int = 0
+) -> List[str]:
+    """Write the models as scenarios of one stix file
+
+    The first model is used as the base (without its results), the given scenario of
+    every other model is appended to it. The models need to share the same soils (like
+    variants of the same model). Every scenario is labeled with the name of the model.
+
+    Args:
+        models (Dict[str, DStabilityModel]): the models by name
+        filename (str): the stix file to write the scenarios to
+        scenario_index (int, optional): the scenario to use from every model. Defaults to 0.
+
+    Returns:
+        List[str]: the labels of the scenarios (the names of the models)
+    """
+    labels = list(models.keys())
+    with stage("copy", filename):
+        packed = models[labels[0]].copy(deep=True)
+        clear_results(packed)
+        packed.datastructure.scenarios[scenario_index].Label = labels[0]
+        for label in labels[1:]:
+            append_scenario(packed, models[label], scenario_index, label)
+    with stage("serialize", filename):
+        packed.serialize(Path(filename))
+    return labels
+
+
+def get_calculation_settings(model: DStabilityModel, scenario_index: int) -> Any:
+    """Get the calculation settings of the first calculation of the given scenario"""
+    calculation = model.datastructure.scenarios[scenario_index].Calculations[0]
+    for calculation_settings in model.datastructure.calculationsettings:
+        if calculation_settings.Id == calculation.CalculationSettingsId:
+            return calculation_settings
+    raise ValueError(
+        f"Cannot find the calculation settings for scenario {scenario_index}"
+    )
+
+
+def get_scenario_index(model: DStabilityModel, label: str) -> int:
+    """Get the index of the scenario with the given label"""
+    for i, scenario in enumerate(model.datastructure.scenarios):
+        if scenario.Label == label:
+            return i
+    raise ValueError(f"Cannot find a scenario with label '{label}'")
+
+
+def get_scenario_results(
+    model: DStabilityModel, labels: List[str]
+) -> Dict[str, Dict[str, Any]]:
+    """Get the results of the first calculation of the scenarios with the given labels
+
+    Args:
+        model (DStabilityModel): the calculated model
+        labels (List[str]): the labels of the scenarios
+
+    Returns:
+        Dict[str, Dict[str, Any]]: per label the result ('result') and analysis type ('analysis_type')
+            or the error ('error') if there is no result
+    """
+    results = {}
+    for label in labels:
+        try:
+            scenario_index = get_scenario_index(model, label)
+            results[label] = {
+                "result": model.get_result(scenario_index, 0),
+                "analysis_type": get_calculation_settings(
+                    model, scenario_index
+                ).AnalysisType.value,
+            }
+        except Exception as e:
+            results[label] = {"error": str(e)}
+    return results
@@ -1,11 +1,9 @@
-# haalt dubbele regels uit results.csv
-lines = open("./output/results.csv", "r").readlines()
-
-result = []
-for line in lines:
-    if not line in result:
-        result.append(line)
-
-with open("./output/results_cleared.csv", "w") as f:
-    for line in result:
-        f.write(line)
+# haalt dubbele regels uit results.csv (extract_results.py slaat dubbele regels al over)
+seen = set()
+with open("./output/results.csv", "r") as f_in, open(
+    "./output/results_cleared.csv", "w"
+) as f_out:
+    for line in f_in:
+        if line not in seen:
+            seen.add(line)
+            f_out.write(line)
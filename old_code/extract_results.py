@@ -1,35 +1,167 @@
+import argparse
+import csv
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterator, List
+
 import shapefile
-import pandas as pd
 
 from helpers import case_insensitive_glob
 
 PATH_RESULTS = r"D:\Documents\WSBD\calamiteiten\GIS\toetsing"
+OUTPUT_FILE = "output/results.csv"
+
+CHUNK_SIZE = 10000  # number of records that are written at once
+
+# zet de resultaten van alle shapefiles in een tabel (csv of parquet)
+#
+# van elke shapefile wordt alleen de dbf (de attributen) gelezen, eerst de header
+# van alle bestanden om de kolommen te bepalen (de vereniging van alle velden) en
+# daarna worden de records een keer doorlopen en per CHUNK_SIZE records
+# weggeschreven, dubbele regels worden direct overgeslagen
+
+
+def get_dtcode(filename: Path) -> str:
+    """Get the dike trajectory code from a filename like 34-1.shp"""
+    dtcode = filename.stem.split("-")
+    return f"{dtcode[0]}-{dtcode[1]}"
+
+
+def open_dbf(filename: Path) -> shapefile.Reader:
+    """Open only the attribute table (dbf) of the shapefile, the geometries are not read"""
+    for suffix in [".dbf", ".DBF"]:
+        if filename.with_suffix(suffix).exists():
+            return shapefile.Reader(dbf=open(filename.with_suffix(suffix), "rb"))
+    raise FileNotFoundError(f"No dbf file found for '{filename}'")
+
+
+def field_type(field: Any) -> str:
+    """Get the type of the values of a dbf field (string, int, float, bool or date)"""
+    if field.field_type == "N":
+        return "int" if field.decimal == 0 else "float"
+    return {"F": "float", "L": "bool", "D": "date"}.get(field.field_type, "string")
+
+
+def get_columns(filenames: List[Path]) -> Dict[str, str]:
+    """Get the union of the fields of all shapefiles with their type (the first field is the dike trajectory code)
+
+    Fields with different types in different files are handled as strings.
+    """
+    columns = {"dijkcode": "string"}
+    for filename in filenames:
+        shape = open_dbf(filename)
+        for field in shape.fields[1:]:
+            dtype = field_type(field)
+            if columns.setdefault(field.name, dtype) != dtype:
+                columns[field.name] = "string"
+        shape.close()
+    return columns
 
-# loop alle bestand af en schrijf de resultaten als csv bestanden weg
+
+def iter_chunks(
+    filenames: List[Path], columns: List[str], chunk_size: int = CHUNK_SIZE
+) -> Iterator[Dict[str, List[Any]]]:
+    """Read the records of all shapefiles and yield them as columns of at most chunk_size unique rows"""
+    seen = set()
+    chunk = {column: [] for column in columns}
+    num_rows = 0
+    for filename in filenames:
+        dtcode = get_dtcode(filename)
+        shape = open_dbf(filename)
+        names = ["dijkcode"] + [field.name for field in shape.fields[1:]]
+        # the position of every column in the records of this file (None if missing)
+        index = {name: i for i, name in enumerate(names)}
+        positions = [index.get(column) for column in columns]
+        for record in shape.iterRecords():
+            values = [dtcode] + list(record)
+            row = tuple(None if p is None else values[p] for p in positions)
+            if row in seen:
+                continue
+            seen.add(row)
+            for column, value in zip(columns, row):
+                chunk[column].append(value)
+            num_rows += 1
+            if num_rows == chunk_size:
+                yield chunk
+                chunk = {column: [] for column in columns}
+                num_rows = 0
+        shape.close()
+    if num_rows > 0:
+        yield chunk
+
+
+def write_csv(
+    chunks: Iterator[Dict[str, List[Any]]], columns: List[str], filename: str
+) -> int:
+    num_rows = 0
+    with open(filename, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(columns)
+        for chunk in chunks:
+            rows = list(zip(*[chunk[column] for column in columns]))
+            writer.writerows(rows)
+            num_rows += len(rows)
+    return num_rows
+
+
+def write_parquet(
+    chunks: Iterator[Dict[str, List[Any]]], columns: Dict[str, str], filename: str
+) -> int:
+    # pyarrow is only needed for parquet output
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    types = {
+        "string": pa.string(),
+        "int": pa.int64(),
+        "float": pa.float64(),
+        "bool": pa.bool_(),
+        "date": pa.date32(),
+    }
+    schema = pa.schema([(column, types[dtype]) for column, dtype in columns.items()])
+    num_rows = 0
+    with pq.ParquetWriter(filename, schema) as writer:
+        for chunk in chunks:
+            arrays = []
+            for column, dtype in columns.items():
+                values = chunk[column]
+                if dtype == "string":
+                    values = [None if v is None else str(v) for v in values]
+                arrays.append(pa.array(values, type=types[dtype]))
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+            num_rows += len(chunk["dijkcode"])
+    return num_rows
+
+
+def extract_results(
+    path: str = PATH_RESULTS, output: str = OUTPUT_FILE, chunk_size: int = CHUNK_SIZE
+) -> int:
+    """Write the (unique) records of all shapefiles in the path to a csv or parquet file (based on the suffix of output)
+
+    Returns:
+        int: the number of written rows
+    """
+    filenames = case_insensitive_glob(path, ".shp")
+    columns = get_columns(filenames)
+    chunks = iter_chunks(filenames, list(columns.keys()), chunk_size)
+    Path(output).parent.mkdir(parents=True, exist_ok=True)
+    if Path(output).suffix.lower() == ".parquet":
+        return write_parquet(chunks, columns, output)
+    return write_csv(chunks, list(columns.keys()), output)
+
+
+# loop alle bestand af en schrijf de resultaten als csv (of parquet) bestand weg
 if __name__ == "__main__":
-    # get all (unique) fields
-    fieldnames = []
-    for filename in case_insensitive_glob(PATH_RESULTS, ".shp"):
-        shape = shapefile.Reader(filename)
-        fieldnames += [shape[0] for shape in shape.fields[1:]]
-
-    fieldnames = list(set(fieldnames))
-    df = pd.DataFrame({f: [] for f in fieldnames})
-
-    # fill the dataframe
-    for filename in case_insensitive_glob(PATH_RESULTS, ".shp"):
-        dtcode = filename.stem.split("-")
-        dtcode = f"{dtcode[0]}-{dtcode[1]}"
-        shape = shapefile.Reader(filename)
-        shape_fields = [shape[0] for shape in shape.fields[1:]]
-        shape_fields.append("dijkcode")
-        # add empty row
-        s = pd.Series([None] * len(shape_fields))
-        for i in range(len(shape.records())):
-            s["dijkcode"] = dtcode
-            rec = shape.record(i)
-            for j in range(len(rec)):
-                s[shape_fields[j]] = rec[j]
-            df = pd.concat([df, s.to_frame().T])
-
-    df.to_csv("output/results.csv")
+    parser = argparse.ArgumentParser(
+        description="Write the records of all shapefiles to one csv or parquet file"
+    )
+    parser.add_argument("--path", default=PATH_RESULTS)
+    parser.add_argument("--output", default=OUTPUT_FILE)
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    args = parser.parse_args()
+
+    start = time.time()
+    num_rows = extract_results(args.path, args.output, args.chunk_size)
+    print(
+        f"Written {num_rows} unique record(s) to '{args.output}' in {time.time() - start:.1f} seconds"
+    )
@@ -1,67 +1,135 @@
+import os
+from pathlib import Path
+from typing import Dict, List, Tuple, Union
+
+import numpy as np
 import shapefile
+
 from helpers import case_insensitive_glob
-from math import hypot
 
 REFLINES_PATH = r"D:\Documents\WSBD\calamiteiten\GIS\referentielijnen"
 
+# chainages this far outside the reference line are moved to the start or end [m]
+CHAINAGE_TOLERANCE = 1e-6
+
 
 class ReferenceLine:
-    def __init__(self):
-        self.name = ""
-        self.points = []
+    """Reference line with the (exact) cumulative chainage of every point
+
+    The coordinates and chainages are numpy arrays and chainages are looked up with a
+    binary search so arrays of chainages can be mapped at once (see xy_from_ls and
+    coords_between_many).
+    """
+
+    def __init__(self, name: str = "", xy: Union[List, np.ndarray, None] = None):
+        self.name = name
+        xy = np.zeros((0, 2)) if xy is None else np.asarray(xy, dtype=float)[:, :2]
+        self.x = xy[:, 0].copy()
+        self.y = xy[:, 1].copy()
+        self.l = np.zeros(len(xy))
+        if len(xy) > 1:
+            self.l[1:] = np.cumsum(np.hypot(np.diff(self.x), np.diff(self.y)))
 
     @classmethod
-    def from_shape(self, filename):
-        rl = ReferenceLine()
-        rl.name = filename.stem
-        shape = shapefile.Reader(filename)
-        feature = shape.shapeRecords()[0]
-        first = feature.shape.__geo_interface__
+    def from_shape(cls, filename):
+        shape = shapefile.Reader(str(filename))
+        try:
+            first = shape.shape(0).__geo_interface__
+        finally:
+            shape.close()
         if not first["type"] == "LineString":
             raise NotImplementedError(
                 f"ReferenceLine.from_shape only handles LineString geometries but got a '{first['type']}' geometry."
             )
-        rl.points = [[p[0], p[1], 0.0] for p in first["coordinates"]]
-
-        for i in range(1, len(rl.points)):
-            rl.points[i][-1] = round(
-                rl.points[i - 1][-1]
-                + hypot(
-                    rl.points[i][0] - rl.points[i - 1][0],
-                    rl.points[i][1] - rl.points[i - 1][1],
-                )
-            )
+        return cls(Path(filename).stem, first["coordinates"])
+
+    def reversed(self) -> "ReferenceLine":
+        """Get the reference line with the chainage running in the opposite direction"""
+        return ReferenceLine(self.name, np.column_stack([self.x, self.y])[::-1])
 
-        return rl
+    @property
+    def points(self) -> List[List[float]]:
+        """The points as [x, y, chainage]"""
+        return np.column_stack([self.x, self.y, self.l]).tolist()
 
     @property
-    def length(self):
-        return self.points[-1][-1]
+    def length(self) -> float:
+        return float(self.l[-1])
+
+    def xy_from_ls(self, ls) -> Tuple[np.ndarray, np.ndarray]:
+        """Get the coordinates of the points at the given chainages
+
+        Args:
+            ls (array like): the chainages [m]
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: the x and y coordinates
+        """
+        ls = np.asarray(ls, dtype=float)
+        invalid = (ls < -CHAINAGE_TOLERANCE) | (ls > self.length + CHAINAGE_TOLERANCE)
+        if invalid.any():
+            raise ValueError(
+                f"Invalid chainage {ls[invalid].flat[0]}, min=0.0, max={self.length:.1f}"
+            )
+        ls = np.clip(ls, 0.0, self.length)
+
+        # index of the end point of the segment of every chainage
+        i = np.clip(np.searchsorted(self.l, ls, side="right"), 1, len(self.l) - 1)
+        l1, l2 = self.l[i - 1], self.l[i]
+        t = np.divide(ls - l1, l2 - l1, out=np.zeros_like(ls), where=l2 > l1)
+        x = self.x[i - 1] + t * (self.x[i] - self.x[i - 1])
+        y = self.y[i - 1] + t * (self.y[i] - self.y[i - 1])
+        return x, y
+
+    def xy_from_l(self, l: float) -> Tuple[float, float]:
+        x, y = self.xy_from_ls([l])
+        return float(x[0]), float(y[0])
+
+    def coords_between_many(self, starts, ends) -> List[np.ndarray]:
+        """Get the parts of the reference line between the start and end chainages
+
+        Args:
+            starts (array like): the start chainages [m]
+            ends (array like): the end chainages [m]
+
+        Returns:
+            List[np.ndarray]: the coordinates (n x 2) of every part
+        """
+        starts = np.asarray(starts, dtype=float)
+        ends = np.asarray(ends, dtype=float)
+        xs, ys = self.xy_from_ls(starts)
+        xe, ye = self.xy_from_ls(ends)
+        # the points of the reference line strictly between start and end
+        first = np.searchsorted(self.l, starts, side="right")
+        last = np.searchsorted(self.l, ends, side="left")
+        xy = np.column_stack([self.x, self.y])
+        return [
+            np.vstack(
+                [[xs[k], ys[k]], xy[first[k] : max(first[k], last[k])], [xe[k], ye[k]]]
+            )
+            for k in range(len(starts))
+        ]
+
+    def coords_between(self, start: float, end: float) -> List[List[float]]:
+        return self.coords_between_many([start], [end])[0].tolist()
 
-    def xy_from_l(self, l):
-        for i in range(1, len(self.points)):
-            x1, y1, l1 = self.points[i - 1]
-            x2, y2, l2 = self.points[i]
 
-            if l1 <= l and l <= l2:
-                x = x1 + (l - l1) / (l2 - l1) * (x2 - x1)
-                y = y1 + (l - l1) / (l2 - l1) * (y2 - y1)
-                return x, y
+# parsed reference lines by filename, modification time and size
+_cache: Dict[Tuple[str, float, int], ReferenceLine] = {}
 
-        raise ValueError(f"Invalid chainage {l}, min=0.0, max={self.length:.1f}")
 
-    def coords_between(self, start, end):
-        points = [self.xy_from_l(start)]
-        points += [p for p in self.points if p[-1] > start and p[-1] < end]
-        points += [self.xy_from_l(end)]
-        return points
+def get_refline(filename) -> ReferenceLine:
+    """Get the reference line from the shapefile, the file is only read again if it has changed"""
+    stat = os.stat(filename)
+    key = (str(filename), stat.st_mtime, stat.st_size)
+    if key not in _cache:
+        _cache[key] = ReferenceLine.from_shape(filename)
+    return _cache[key]
 
 
-def get_reflines():
-    refline_files = case_insensitive_glob(REFLINES_PATH, ".shp")
-    reflines = [
-        ReferenceLine.from_shape(refline_file) for refline_file in refline_files
-    ]
+def get_reflines(path: str = REFLINES_PATH) -> Dict[str, ReferenceLine]:
+    refline_files = case_insensitive_glob(path, ".shp")
+    reflines = [get_refline(refline_file) for refline_file in refline_files]
     return {rl.name: rl for rl in reflines}
 
 
@@ -1,4 +1,8 @@
-from helpers import case_insensitive_glob
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from inventory import StixInventory
 
 STIX_PATH = r"D:\Documents\WSBD\calamiteiten\Berekeningen"
 
@@ -18,41 +22,30 @@ class StixFile:
 
 
 def get_stixes():
-    # get all stix files
-    stix_files = case_insensitive_glob(STIX_PATH, ".stix")
+    # get all stix files from the inventory (only new and changed files are read)
+    inventory = StixInventory(STIX_PATH)
+    inventory.update()
     stixes = []
-    # per file
-    for stix_file in stix_files:
+    for stix_file in inventory.query():
         # check if we have the traject name in the filename
-        args = [a.upper() for a in stix_file.stem.split("_")]
-        has_traject_code = len([a for a in args if a in TRAJECTEN]) > 0
-
-        # if not report this as unparsable
-        if not has_traject_code:
-            print(f"Unparsable filename '{stix_file.stem}', no traject code")
+        if stix_file["trajectory"] not in TRAJECTEN:
+            print(f"Unparsable filename '{stix_file['name']}', no traject code")
             continue
 
-        traject_code = [a for a in args if a in TRAJECTEN][0]
-
         # check if we have km-km in the filename
-        has_km = True
-        for a in args:
-            try:
-                args = a.split("-")
-                assert (len(args)) == 2
-                assert a.upper() not in TRAJECTEN
-                start = float(args[0]) * 1000
-                end = float(args[1]) * 1000
-                has_km = True
-                break
-            except:
-                has_km = False
-
-        if not has_km:
-            print(f"Unparsable filename '{stix_file.stem}', no chainage")
+        if stix_file["start_chainage"] is None:
+            print(f"Unparsable filename '{stix_file['name']}', no chainage")
             continue
 
-        stixes.append(StixFile(traject_code.upper(), start, end, stix_file))
+        stixes.append(
+            StixFile(
+                stix_file["trajectory"],
+                stix_file["start_chainage"] * 1000,
+                stix_file["end_chainage"] * 1000,
+                Path(stix_file["path"]),
+            )
+        )
+    inventory.close()
 
     return stixes
 
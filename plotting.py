@@ -0,0 +1,198 @@
+# maakt de grafieken van de fragility curves uit de resultaten database (zie results_store.py)
+#
+# de grafieken worden los van de berekeningen gemaakt zodat ze opnieuw gemaakt kunnen
+# worden zonder te rekenen, gebruik
+#
+# python plotting.py [--store results.sqlite] [--output map] [--processes 8]
+import argparse
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from itertools import groupby
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import matplotlib
+
+# headless backend, no windows and no gui event loop in the worker processes
+matplotlib.use("Agg")
+
+import matplotlib.pyplot as plt
+from matplotlib.patches import Rectangle
+
+from fragility_curve import FragilityCurve
+from helpers import get_pf_categories
+from instrumentation import Recorder, add_events
+from results_store import FRAGILITY, ResultsStore
+from settings import SF_REQUIRED
+
+RESULTS_STORE_FILE = (
+    "Z:\\Documents\\Klanten\\Output\\WSBD\\FragilityCurves\\results.sqlite"
+)
+OUTPUT_PATH = "Z:\\Documents\\Klanten\\Output\\WSBD\\FragilityCurves"
+MAX_PROCESSES = 8
+
+
+def plot_fragility_curve(
+    curve: FragilityCurve,
+    dtcode: str,
+    start_chainage: float,
+    end_chainage: float,
+    filename: str,
+):
+    """Plot the safety factor and the failure probability (with the categories) and save it as png
+
+    Args:
+        curve (FragilityCurve): the fragility curve
+        dtcode (str): dike trajectory code like 34-1
+        start_chainage (float): start chainage of the section
+        end_chainage (float): end chainage of the section
+        filename (str): the png file
+    """
+    waterlevels = curve.levels
+    xmin = waterlevels.min()
+    xmax = waterlevels.max()
+
+    fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(10, 10))
+    try:
+        ax1.plot([xmin, xmax], [SF_REQUIRED[dtcode], SF_REQUIRED[dtcode]], "r--")
+        ax1.text(
+            xmin,
+            SF_REQUIRED[dtcode],
+            f"minimale veiligheidsfactor ({SF_REQUIRED[dtcode]:.3f})",
+        )
+        ax1.plot(waterlevels, curve.sfs, "o-")
+        ax1.set_xlabel("Water level [m tov NAP]")
+        ax1.set_ylabel("Safety Factor")
+        ax2.set_yscale("log")
+
+        for top, bottom, label, color in get_pf_categories(dtcode):
+            ax2.add_patch(
+                Rectangle(
+                    (xmin, bottom),
+                    (xmax - xmin),
+                    (top - bottom),
+                    facecolor=color,
+                    fill=True,
+                )
+            )
+            ax2.plot([xmin, xmax], [bottom, bottom], "k--")
+            ax2.text(xmin, (top + bottom) / 2.0, label)
+
+        ax2.plot(waterlevels, curve.pfs, "o-")
+        ax2.set_ylim(1e-8, 1.0)
+        ax2.set_xlabel("Water level [m tov NAP]")
+        ax2.set_ylabel("Faalkans")
+        ax1.grid()
+        ax2.grid()
+
+        fig.suptitle(
+            f"Fragility curve dijktraject {dtcode} van {start_chainage:.2f}km tot {end_chainage:.2f}km"
+        )
+        fig.savefig(filename)
+    finally:
+        # release the memory of the figure, pyplot keeps a reference until it is closed
+        plt.close(fig)
+
+
+def get_figname(dtcode: str, start_chainage: float, end_chainage: float) -> str:
+    return f"{dtcode}_{start_chainage:.2f}_{end_chainage:.2f}.png"
+
+
+def _render(point_set: Dict, output_path: str) -> Tuple[str, List[Dict]]:
+    """Render one fragility curve (runs in a worker process), returns the png file and the stage events"""
+    recorder = Recorder()
+    figname = Path(output_path) / get_figname(
+        point_set["trajectory"], point_set["start_chainage"], point_set["end_chainage"]
+    )
+    with recorder.stage("plot", figname):
+        curve = FragilityCurve(
+            point_set["levels"], point_set["sfs"], point_set["model_factors"]
+        )
+        plot_fragility_curve(
+            curve,
+            point_set["trajectory"],
+            point_set["start_chainage"],
+            point_set["end_chainage"],
+            str(figname),
+        )
+    return str(figname), recorder.events
+
+
+def render_fragility_curves(
+    store: ResultsStore,
+    output_path: str,
+    nprocesses: int = MAX_PROCESSES,
+    filenames: Optional[List[str]] = None,
+) -> List[str]:
+    """Render the fragility curves in the store to png files using a pool of processes
+
+    The points are read from the store in one query and sent to the workers so the
+    workers do not need access to the store.
+
+    Args:
+        store (ResultsStore): the results store
+        output_path (str): the path to write the png files to
+        nprocesses (int, optional): the number of processes. Defaults to MAX_PROCESSES.
+        filenames (Optional[List[str]], optional): only render these stix files (all if None). Defaults to None.
+
+    Returns:
+        List[str]: the png files that were created
+    """
+    point_sets = []
+    for filename, points in groupby(
+        store.query(kind=FRAGILITY), key=lambda p: p["filename"]
+    ):
+        if filenames is not None and filename not in filenames:
+            continue
+        points = list(points)
+        point_sets.append(
+            {
+                "trajectory": points[0]["trajectory"],
+                "start_chainage": points[0]["start_chainage"],
+                "end_chainage": points[0]["end_chainage"],
+                "levels": [p["river_level"] for p in points],
+                "sfs": [p["factor_of_safety"] for p in points],
+                "model_factors": [p["model_factor"] for p in points],
+            }
+        )
+
+    if len(point_sets) == 0:
+        return []
+
+    result = []
+    with ProcessPoolExecutor(max_workers=min(nprocesses, len(point_sets))) as pool:
+        futures = [pool.submit(_render, p, output_path) for p in point_sets]
+        for future in futures:
+            try:
+                figname, events = future.result()
+                add_events(events)
+                result.append(figname)
+            except Exception as e:
+                logging.error(f"Error creating a fragility curve plot; '{e}'")
+
+    logging.info(f"Created {len(result)} fragility curve plot(s) in '{output_path}'")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Create the fragility curve plots from the results database"
+    )
+    parser.add_argument("--store", default=RESULTS_STORE_FILE)
+    parser.add_argument("--output", default=OUTPUT_PATH)
+    parser.add_argument("--processes", type=int, default=MAX_PROCESSES)
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        format="%(asctime)s %(levelname)s %(message)s",
+        datefmt="%H:%M:%S",
+        level=logging.INFO,
+    )
+
+    store = ResultsStore(args.store)
+    render_fragility_curves(store, args.output, args.processes)
+    store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,408 @@
+# controleert de parameter bestanden van fc_plline.py en berm.py voordat er gerekend
+# wordt, gebruik
+#
+# python preflight.py [--fc parameters_fc_plline.csv] [--berm parameters_berm.csv] [--processes 8] [--no-dry-run]
+#
+# per regel wordt gecontroleerd of de regel gelezen kan worden, of het dijktraject in
+# settings.py staat en of het stix bestand bestaat, daarna worden de stix bestanden in
+# aparte processen ingelezen en wordt generate_waternet (fragility curves) of de
+# minimale / maximale berm en de gedempte sloot (bermen) uitgeprobeerd zonder te rekenen,
+# alle problemen komen in een rapport
+import argparse
+import logging
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+import berm
+import fc_plline
+from helpers import parse_stix_filename, read_param_lines
+from model_variants import WaternetVariantBuilder
+from settings import P_EIS_OND, P_EIS_OND_DSN, P_EIS_SIG_DSN, SF_REQUIRED
+
+MAX_PROCESSES = 8
+
+# try generate_waternet for every river level instead of only the lowest and highest level
+PREFLIGHT_ALL_LEVELS = False
+
+ERROR = "error"
+WARNING = "warning"
+
+# the settings every dike trajectory in the parameter files needs
+TRAJECTORY_SETTINGS = {
+    "SF_REQUIRED": SF_REQUIRED,
+    "P_EIS_SIG_DSN": P_EIS_SIG_DSN,
+    "P_EIS_OND_DSN": P_EIS_OND_DSN,
+    "P_EIS_OND": P_EIS_OND,
+}
+
+
+class Issue:
+    def __init__(
+        self,
+        severity: str,
+        parameter_file: str,
+        line_number: int,
+        filename: str,
+        message: str,
+    ):
+        """A problem found in a line of a parameter file
+
+        Args:
+            severity (str): ERROR (the line cannot be calculated) or WARNING
+            parameter_file (str): the parameter file
+            line_number (int): the line number in the parameter file (0 if the problem is the file itself)
+            filename (str): the stix file of the line
+            message (str): the description of the problem
+        """
+        self.severity = severity
+        self.parameter_file = parameter_file
+        self.line_number = line_number
+        self.filename = filename
+        self.message = message
+
+    def __str__(self) -> str:
+        return f"{self.severity.upper():<8}{Path(self.parameter_file).name}:{self.line_number} {self.filename} {self.message}"
+
+
+class PreflightReport:
+    """All problems found by the preflight of one or more parameter files"""
+
+    def __init__(self):
+        self.issues: List[Issue] = []
+        self.num_lines = 0
+
+    def add(self, *args):
+        self.issues.append(Issue(*args))
+
+    @property
+    def errors(self) -> List[Issue]:
+        return [issue for issue in self.issues if issue.severity == ERROR]
+
+    @property
+    def ok(self) -> bool:
+        """True if none of the lines has an error"""
+        return len(self.errors) == 0
+
+    def __str__(self) -> str:
+        lines = [
+            f"Preflight of {self.num_lines} parameter line(s); {len(self.errors)} error(s), {len(self.issues) - len(self.errors)} warning(s)"
+        ]
+        lines += [
+            str(issue)
+            for issue in sorted(
+                self.issues,
+                key=lambda i: (i.severity != ERROR, i.parameter_file, i.line_number),
+            )
+        ]
+        return "\n".join(lines)
+
+    def log(self):
+        """Log the report as one message (error if there are errors)"""
+        if self.ok:
+            logging.info(str(self))
+        else:
+            logging.error(str(self))
+
+
+def check_trajectory(
+    report: PreflightReport, parameter_file: str, line_number: int, filename: str
+) -> Optional[str]:
+    """Check the filename (<dijkcode>_<van>-<tot>.stix) and the settings of the dike trajectory
+
+    Returns:
+        Optional[str]: the dike trajectory code or None if the filename is invalid
+    """
+    try:
+        dtcode, _, _ = parse_stix_filename(filename)
+    except Exception as e:
+        report.add(
+            ERROR,
+            parameter_file,
+            line_number,
+            filename,
+            f"invalid filename (should be <dijkcode>_<van>-<tot>.stix); '{e}'",
+        )
+        return None
+    missing = [
+        name for name, values in TRAJECTORY_SETTINGS.items() if dtcode not in values
+    ]
+    if len(missing) > 0:
+        report.add(
+            ERROR,
+            parameter_file,
+            line_number,
+            filename,
+            f"dike trajectory '{dtcode}' is missing in {', '.join(missing)} in settings.py",
+        )
+    return dtcode
+
+
+def parse_lines(
+    report: PreflightReport,
+    parameter_file: str,
+    param_lines: List[str],
+    num_fields: int,
+) -> List[Tuple[int, str, List[float]]]:
+    """Parse the lines of a parameter file (filename followed by num_fields - 1 numbers)
+
+    Returns:
+        List[Tuple[int, str, List[float]]]: the line number, stix file and numbers of the valid lines
+    """
+    result, seen = [], {}
+    # the header is line 1 (see read_param_lines, empty lines are not counted)
+    for line_number, param_line in enumerate(param_lines, start=2):
+        report.num_lines += 1
+        fields = [p.strip() for p in param_line.split(",")]
+        filename = fields[0]
+        if len(fields) != num_fields:
+            report.add(
+                ERROR,
+                parameter_file,
+                line_number,
+                filename,
+                f"expected {num_fields} values but got {len(fields)} in '{param_line}'",
+            )
+            continue
+        try:
+            values = [float(f) for f in fields[1:]]
+        except ValueError as e:
+            report.add(
+                ERROR,
+                parameter_file,
+                line_number,
+                filename,
+                f"invalid number in '{param_line}'; '{e}'",
+            )
+            continue
+        if check_trajectory(report, parameter_file, line_number, filename) is None:
+            continue
+        if filename in seen:
+            report.add(
+                WARNING,
+                parameter_file,
+                line_number,
+                filename,
+                f"the stix file is also in line {seen[filename]}",
+            )
+        seen[filename] = line_number
+        result.append((line_number, filename, values))
+    return result
+
+
+def get_stix_path(path_to_stixfiles: str, filename: str) -> Path:
+    return Path(path_to_stixfiles) / filename.split("_")[0] / filename
+
+
+def dry_run_fc(stix_path: str, river_levels: List[float]) -> List[str]:
+    """Generate the waternets of the river levels without writing or calculating (runs in a worker process)
+
+    Returns:
+        List[str]: the errors
+    """
+    try:
+        builder = WaternetVariantBuilder(stix_path, "Norm", "Norm")
+    except Exception as e:
+        return [f"cannot read the stix file; '{e}'"]
+
+    errors = []
+    for river_level in river_levels:
+        try:
+            builder.model.generate_waternet(
+                river_level_mhw=river_level,
+                adjust_for_uplift=fc_plline.ADJUST_FOR_UPLIFT,
+            )
+        except Exception as e:
+            errors.append(
+                f"generate_waternet fails at river level {river_level}; '{e}'"
+            )
+        finally:
+            builder.restore()
+    return errors
+
+
+def dry_run_berm(
+    stix_path: str, xmin: float, zmin: float, xmax: float, zmax: float
+) -> List[str]:
+    """Create the minimum and maximum berm and the filled ditch without calculating (runs in a worker process)
+
+    Returns:
+        List[str]: the errors
+    """
+    try:
+        ds = berm.DStability.from_stix(stix_path)
+    except Exception as e:
+        return [f"cannot read the stix file; '{e}'"]
+
+    errors = []
+    for name, kwargs in [
+        ("minimum berm", {"fixed_x": xmin, "fixed_z": zmin}),
+        ("maximum berm", {"fixed_x": xmax, "fixed_z": zmax}),
+    ]:
+        try:
+            berm.create_berm_model(
+                ds,
+                f"{Path(stix_path).name}:{name}",
+                soilcode=berm.BERM_MATERIAAL,
+                slope_bottom=berm.SLOPE_BOTTOM,
+                slope_top=berm.SLOPE_TOP,
+                **kwargs,
+            )
+        except Exception as e:
+            errors.append(
+                f"cannot create the {name} with x={kwargs['fixed_x']:.2f} and z={kwargs['fixed_z']:.2f}; '{e}'"
+            )
+    try:
+        berm.create_berm_model(
+            ds,
+            f"{Path(stix_path).name}:ditch",
+            fill_ditch=True,
+            ditch_soilcode=berm.SLOOT_MATERIAAL,
+        )
+    except Exception as e:
+        errors.append(f"cannot fill the ditch; '{e}'")
+    return errors
+
+
+def get_river_levels(
+    min_level: float, max_level: float, step_size: float
+) -> List[float]:
+    """The river levels to try (all levels if PREFLIGHT_ALL_LEVELS else the lowest and highest)"""
+    river_levels = [
+        round(river_level, 3)
+        for river_level in np.arange(min_level, max_level + 0.5 * step_size, step_size)
+    ]
+    if PREFLIGHT_ALL_LEVELS:
+        return river_levels
+    return sorted({river_levels[0], river_levels[-1]})
+
+
+def run_preflight(
+    fc_parameters_file: Optional[str] = None,
+    berm_parameters_file: Optional[str] = None,
+    nprocesses: int = MAX_PROCESSES,
+    dry_run: bool = True,
+) -> PreflightReport:
+    """Check the parameter files and (if dry_run) try the waternets and berm geometries of every line
+
+    Args:
+        fc_parameters_file (Optional[str], optional): the parameter file of fc_plline.py. Defaults to None.
+        berm_parameters_file (Optional[str], optional): the parameter file of berm.py. Defaults to None.
+        nprocesses (int, optional): the number of processes for the dry runs. Defaults to MAX_PROCESSES.
+        dry_run (bool, optional): read the stix files and try the waternets and geometries. Defaults to True.
+
+    Returns:
+        PreflightReport: the report with all problems
+    """
+    report = PreflightReport()
+    tasks: List[Tuple[str, int, str, Tuple]] = []
+
+    for parameter_file, num_fields, path_to_stixfiles in [
+        (fc_parameters_file, 4, fc_plline.PATH_TO_STIXFILES),
+        (berm_parameters_file, 5, berm.PATH_TO_STIXFILES),
+    ]:
+        if parameter_file is None:
+            continue
+        try:
+            param_lines = read_param_lines(parameter_file)
+        except OSError as e:
+            report.add(
+                ERROR, parameter_file, 0, "", f"cannot read the parameter file; '{e}'"
+            )
+            continue
+
+        for line_number, filename, values in parse_lines(
+            report, parameter_file, param_lines, num_fields
+        ):
+            stix_path = get_stix_path(path_to_stixfiles, filename)
+            if not stix_path.exists():
+                report.add(
+                    ERROR,
+                    parameter_file,
+                    line_number,
+                    filename,
+                    f"'{stix_path}' not found",
+                )
+                continue
+
+            if num_fields == 4:
+                min_level, max_level, step_size = values
+                if step_size <= 0.0:
+                    report.add(
+                        WARNING,
+                        parameter_file,
+                        line_number,
+                        filename,
+                        "no step size, the line is skipped",
+                    )
+                    continue
+                if min_level > max_level:
+                    report.add(
+                        ERROR,
+                        parameter_file,
+                        line_number,
+                        filename,
+                        f"the minimum river level ({min_level}) is above the maximum river level ({max_level})",
+                    )
+                    continue
+                task = (
+                    dry_run_fc,
+                    (str(stix_path), get_river_levels(min_level, max_level, step_size)),
+                )
+            else:
+                task = (dry_run_berm, (str(stix_path), *values))
+            tasks.append((parameter_file, line_number, filename, task))
+
+    if dry_run and len(tasks) > 0:
+        with ProcessPoolExecutor(max_workers=min(nprocesses, len(tasks))) as pool:
+            futures = [
+                pool.submit(function, *args) for _, _, _, (function, args) in tasks
+            ]
+            for (parameter_file, line_number, filename, _), future in zip(
+                tasks, futures
+            ):
+                try:
+                    errors = future.result()
+                except Exception as e:
+                    errors = [f"dry run failed; '{e}'"]
+                for error in errors:
+                    report.add(ERROR, parameter_file, line_number, filename, error)
+
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Check the parameter files and the stix files before calculating"
+    )
+    parser.add_argument("--fc", default=fc_plline.PARAMETERS_FILE)
+    parser.add_argument("--berm", default=berm.PARAMETERS_FILE)
+    parser.add_argument("--processes", type=int, default=MAX_PROCESSES)
+    parser.add_argument(
+        "--no-dry-run",
+        action="store_true",
+        help="only check the parameter files, do not read the stix files",
+    )
+    parser.add_argument(
+        "--report", default=None, help="also write the report to this file"
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        format="%(asctime)s %(levelname)s %(message)s",
+        datefmt="%H:%M:%S",
+        level=logging.INFO,
+    )
+
+    report = run_preflight(args.fc, args.berm, args.processes, not args.no_dry_run)
+    print(report)
+    if args.report is not None:
+        Path(args.report).write_text(str(report) + "\n", encoding="utf-8")
+    return 0 if report.ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
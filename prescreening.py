@@ -0,0 +1,124 @@
+from typing import List, Union
+
+import numpy as np
+from geolib.models import DStabilityModel
+from geolib.models.dstability.internal import AnalysisTypeEnum
+
+from helpers import get_model_factor, get_pf_boundaries, pf_to_beta, sf_to_beta
+from multi_scenario import get_calculation_settings
+
+# pre-screening runs every model with Bishop brute force on a coarse grid first and
+# only calculates the models with the original (expensive) analysis if the result
+# of the cheap calculation is close to a decision threshold
+
+
+def _coarsen(num_points: int, space: float, max_points: int):
+    """Get the number of points and the spacing that cover the same range with at most max_points"""
+    if num_points is None or space is None or num_points <= max_points:
+        return num_points, space
+    extent = (num_points - 1) * space
+    return max_points, extent / (max_points - 1)
+
+
+def set_cheap_analysis(
+    model: DStabilityModel,
+    grid_points: int = 5,
+    tangent_lines: int = 5,
+    scenario_index: int = 0,
+) -> AnalysisTypeEnum:
+    """Change the analysis of the model to Bishop brute force on a coarse grid
+
+    If the model has a Bishop brute force grid it is coarsened to at most grid_points
+    points per direction, if not the grid and tangent lines are taken from the search
+    area and tangent area of the Uplift-Van particle swarm settings.
+
+    Args:
+        model (DStabilityModel): the model to change
+        grid_points (int, optional): maximum number of grid points per direction. Defaults to 5.
+        tangent_lines (int, optional): maximum number of tangent lines. Defaults to 5.
+        scenario_index (int, optional): the scenario to change. Defaults to 0.
+
+    Returns:
+        AnalysisTypeEnum: the original analysis type
+    """
+    settings = get_calculation_settings(model, scenario_index)
+    original = AnalysisTypeEnum(settings.AnalysisType)
+
+    bishop = settings.BishopBruteForce
+    grid, tangents = bishop.SearchGrid, bishop.TangentLines
+    if grid.NumberOfPointsInX is None or grid.BottomLeft is None:
+        uplift_van = settings.UpliftVanParticleSwarm
+        area, tangent_area = uplift_van.SearchAreaA, uplift_van.TangentArea
+        if area is None or area.TopLeft is None or tangent_area is None:
+            raise ValueError(
+                "Cannot create a Bishop brute force grid, there is no Bishop grid or Uplift-Van search area"
+            )
+        space = max(area.Width, area.Height) / (grid_points - 1)
+        grid.BottomLeft = type(area.TopLeft)(
+            X=area.TopLeft.X, Z=area.TopLeft.Z - area.Height
+        )
+        grid.NumberOfPointsInX = int(round(area.Width / space)) + 1
+        grid.NumberOfPointsInZ = int(round(area.Height / space)) + 1
+        grid.Space = space
+        tangents.BottomTangentLineZ = tangent_area.TopZ - tangent_area.Height
+        tangents.NumberOfTangentLines = tangent_lines
+        tangents.Space = tangent_area.Height / (tangent_lines - 1)
+        if bishop.SlipPlaneConstraints is None:
+            bishop.SlipPlaneConstraints = uplift_van.SlipPlaneConstraints
+    else:
+        nx, space_x = _coarsen(grid.NumberOfPointsInX, grid.Space, grid_points)
+        nz, space_z = _coarsen(grid.NumberOfPointsInZ, grid.Space, grid_points)
+        # the grid has one spacing, use the largest so the whole area is covered
+        grid.Space = max(space_x, space_z)
+        grid.NumberOfPointsInX = int(round((nx - 1) * space_x / grid.Space)) + 1
+        grid.NumberOfPointsInZ = int(round((nz - 1) * space_z / grid.Space)) + 1
+        tangents.NumberOfTangentLines, tangents.Space = _coarsen(
+            tangents.NumberOfTangentLines, tangents.Space, tangent_lines
+        )
+
+    settings.AnalysisType = AnalysisTypeEnum.BISHOP_BRUTE_FORCE
+    return original
+
+
+def get_equivalent_sf(
+    sf: Union[float, np.ndarray],
+    analysis_type: AnalysisTypeEnum,
+    original_analysis_type: AnalysisTypeEnum,
+) -> Union[float, np.ndarray]:
+    """Convert the safety factor of the cheap analysis to the original analysis using the model factors
+
+    Both analyses lead to the same reliability index if sf / model_factor is the same.
+    """
+    return (
+        sf / get_model_factor(analysis_type) * get_model_factor(original_analysis_type)
+    )
+
+
+def needs_full_analysis_sf(
+    sfs: Union[List[float], np.ndarray], sf_required: float, margin: float
+) -> np.ndarray:
+    """Check which (equivalent) safety factors are within margin of the required safety factor"""
+    return np.abs(np.asarray(sfs, dtype=float) - sf_required) < margin
+
+
+def needs_full_analysis_pf(
+    sfs: Union[List[float], np.ndarray],
+    model_factors: Union[float, List[float], np.ndarray],
+    dtcode: str,
+    margin: float,
+) -> np.ndarray:
+    """Check which points have a reliability index within margin of a category boundary (Iv - VIv)
+
+    Args:
+        sfs (Union[List[float], np.ndarray]): the safety factors of the cheap analysis
+        model_factors (Union[float, List[float], np.ndarray]): the model factors of the cheap analysis
+        dtcode (str): dike trajectory code like 34-1
+        margin (float): the margin on the reliability index
+
+    Returns:
+        np.ndarray: True for the points that need the full analysis
+    """
+    betas = sf_to_beta(np.asarray(sfs, dtype=float), np.asarray(model_factors))
+    boundaries = pf_to_beta(np.array(get_pf_boundaries(dtcode)))
+    distance = np.abs(betas[:, np.newaxis] - boundaries[np.newaxis, :])
+    return (distance < margin).any(axis=1)
@@ -0,0 +1,160 @@
+import hashlib
+import json
+import sqlite3
+import time
+import zipfile
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+# bump this if the way the hash is created changes so old entries are not used anymore
+CACHE_VERSION = 1
+
+
+def stix_hash(filename: str) -> str:
+    """Create a canonical hash of the input of a stix file
+
+    The stix file is a zip file so the hash is created from the (sorted) file names
+    and contents. The results and the project info (dates, author etc.) are left out
+    so two files with the same geometry, soils, waternet and calculation settings
+    get the same hash.
+
+    Args:
+        filename (str): the stix file
+
+    Returns:
+        str: the sha256 hash of the model input
+    """
+    h = hashlib.sha256(f"cache_version={CACHE_VERSION}".encode("utf-8"))
+    with zipfile.ZipFile(filename) as z:
+        for name in sorted(z.namelist()):
+            if name.startswith("results/") or name == "projectinfo.json":
+                continue
+            h.update(name.encode("utf-8"))
+            h.update(z.read(name))
+    return h.hexdigest()
+
+
+def get_slip_plane(result: Any) -> Optional[Dict]:
+    """Get the critical slip plane from a DStability result as a (json serializable) dictionary
+
+    Args:
+        result (Any): the DStability result (like model.output[-1])
+
+    Returns:
+        Optional[Dict]: the result without its id or None if there is no result
+    """
+    if result is None:
+        return None
+    data = json.loads(result.json())
+    data.pop("Id", None)
+    return data
+
+
+class CachedResult:
+    def __init__(self, factor_of_safety: float, analysis_type: str, slip_plane: Dict):
+        self.factor_of_safety = factor_of_safety
+        self.analysis_type = analysis_type
+        self.slip_plane = slip_plane
+
+
+class ResultCache:
+    """Persistent cache of DStability results keyed by the hash of the model input
+
+    The cache is a sqlite database, if the size of the stored results exceeds
+    max_size the least recently used results are removed.
+    """
+
+    def __init__(self, filename: str, max_size: int = 500 * 1024 * 1024):
+        self.filename = filename
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        Path(filename).parent.mkdir(parents=True, exist_ok=True)
+        self._connection = sqlite3.connect(filename)
+        self._connection.execute("""CREATE TABLE IF NOT EXISTS results (
+                key TEXT PRIMARY KEY,
+                factor_of_safety REAL,
+                analysis_type TEXT,
+                slip_plane TEXT,
+                size INTEGER,
+                last_access REAL
+            )""")
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS idx_last_access ON results (last_access)"
+        )
+        self._connection.commit()
+
+    def get(self, key: str) -> Optional[CachedResult]:
+        """Get the cached result for the given key
+
+        Args:
+            key (str): the model hash
+
+        Returns:
+            Optional[CachedResult]: the result or None if the key is not in the cache
+        """
+        row = self._connection.execute(
+            "SELECT factor_of_safety, analysis_type, slip_plane FROM results WHERE key=?",
+            (key,),
+        ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self._connection.execute(
+            "UPDATE results SET last_access=? WHERE key=?", (time.time(), key)
+        )
+        self._connection.commit()
+        return CachedResult(
+            factor_of_safety=row[0],
+            analysis_type=row[1],
+            slip_plane=json.loads(row[2]) if row[2] is not None else None,
+        )
+
+    def put(
+        self,
+        key: str,
+        factor_of_safety: float,
+        analysis_type: str,
+        slip_plane: Optional[Dict] = None,
+    ):
+        """Add a result to the cache
+
+        Args:
+            key (str): the model hash
+            factor_of_safety (float): the calculated safety factor
+            analysis_type (str): the analysis type used in the calculation
+            slip_plane (Optional[Dict], optional): the critical slip plane. Defaults to None.
+        """
+        slip_plane = json.dumps(slip_plane) if slip_plane is not None else None
+        size = len(key) + len(analysis_type) + len(slip_plane or "") + 8
+        self._connection.execute(
+            "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?)",
+            (key, factor_of_safety, analysis_type, slip_plane, size, time.time()),
+        )
+        self._connection.commit()
+        self.evict()
+
+    def evict(self):
+        """Remove the least recently used results until the cache fits in max_size"""
+        total = self._connection.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM results"
+        ).fetchone()[0]
+        if total <= self.max_size:
+            return
+
+        removed = []
+        for key, size in self._connection.execute(
+            "SELECT key, size FROM results ORDER BY last_access ASC"
+        ).fetchall():
+            if total <= self.max_size:
+                break
+            removed.append((key,))
+            total -= size
+
+        self._connection.executemany("DELETE FROM results WHERE key=?", removed)
+        self._connection.commit()
+
+    def close(self):
+        self._connection.close()
@@ -0,0 +1,190 @@
+import sqlite3
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from fragility_curve import FragilityCurve
+
+# the kind of the points in the store
+FRAGILITY = "fragility"
+BERM = "berm"
+# the berms calculated with the cheap analysis of the pre-screening (see berm.py), these
+# are not used for the plots and the chosen berm
+BERM_PRESCREEN = "berm_prescreen"
+
+COLUMNS = [
+    "kind",
+    "trajectory",
+    "start_chainage",
+    "end_chainage",
+    "filename",
+    "name",
+    "river_level",
+    "berm_x",
+    "berm_z",
+    "factor_of_safety",
+    "model_factor",
+    "beta",
+    "pf",
+    "category",
+    "analysis_type",
+    "runtime",
+    "created",
+]
+
+
+class ResultsStore:
+    """Store of all calculated points of the fragility curves and berms
+
+    Every point is one row in a sqlite database with the dike trajectory, chainage,
+    river level (fragility curves) or berm x / z (berms), safety factor, model factor,
+    reliability index, failure probability, category (Iv - VIv) and the runtime of the
+    calculation. A point is identified by the kind, the stix file and its name (the
+    river level or the berm name) so calculating a point again replaces the old row.
+    """
+
+    def __init__(self, filename: str):
+        self.filename = filename
+        Path(filename).parent.mkdir(parents=True, exist_ok=True)
+        self._connection = sqlite3.connect(filename)
+        self._connection.execute("""CREATE TABLE IF NOT EXISTS points (
+                kind TEXT NOT NULL,
+                trajectory TEXT,
+                start_chainage REAL,
+                end_chainage REAL,
+                filename TEXT NOT NULL,
+                name TEXT NOT NULL,
+                river_level REAL,
+                berm_x REAL,
+                berm_z REAL,
+                factor_of_safety REAL,
+                model_factor REAL,
+                beta REAL,
+                pf REAL,
+                category TEXT,
+                analysis_type TEXT,
+                runtime REAL,
+                created REAL,
+                PRIMARY KEY (kind, filename, name)
+            )""")
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS idx_trajectory ON points (trajectory, start_chainage)"
+        )
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS idx_category ON points (kind, category)"
+        )
+        self._connection.commit()
+
+    def add_points(self, points: List[Dict[str, Any]]):
+        """Add (or replace) the points in one transaction
+
+        Args:
+            points (List[Dict[str, Any]]): the points with (a subset of) the COLUMNS as keys
+        """
+        now = time.time()
+        rows = [
+            tuple(
+                point.get(column, now if column == "created" else None)
+                for column in COLUMNS
+            )
+            for point in points
+        ]
+        with self._connection:
+            self._connection.executemany(
+                f"INSERT OR REPLACE INTO points ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})",
+                rows,
+            )
+
+    def delete_points(self, kind: str, filename: str):
+        """Remove all points of the given kind of the stix file (before it is calculated again)
+
+        Args:
+            kind (str): FRAGILITY, BERM or BERM_PRESCREEN
+            filename (str): the name of the original stix file
+        """
+        with self._connection:
+            self._connection.execute(
+                "DELETE FROM points WHERE kind=? AND filename=?", (kind, filename)
+            )
+
+    def query(
+        self,
+        kind: Optional[str] = None,
+        trajectory: Optional[str] = None,
+        filename: Optional[str] = None,
+        min_chainage: Optional[float] = None,
+        max_chainage: Optional[float] = None,
+        category: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        """Get the points that match all given filters
+
+        Args:
+            kind (Optional[str], optional): FRAGILITY, BERM or BERM_PRESCREEN. Defaults to None.
+            trajectory (Optional[str], optional): dike trajectory code like 34-1. Defaults to None.
+            filename (Optional[str], optional): the name of the original stix file. Defaults to None.
+            min_chainage (Optional[float], optional): only sections that end after this chainage. Defaults to None.
+            max_chainage (Optional[float], optional): only sections that start before this chainage. Defaults to None.
+            category (Optional[str], optional): category like 'IIIv'. Defaults to None.
+
+        Returns:
+            List[Dict[str, Any]]: the points ordered by trajectory, chainage, river level and berm
+        """
+        conditions, params = [], []
+        for column, operator, value in [
+            ("kind", "=", kind),
+            ("trajectory", "=", trajectory),
+            ("filename", "=", filename),
+            ("end_chainage", ">=", min_chainage),
+            ("start_chainage", "<=", max_chainage),
+            ("category", "=", category),
+        ]:
+            if value is not None:
+                conditions.append(f"{column} {operator} ?")
+                params.append(value)
+
+        sql = f"SELECT {', '.join(COLUMNS)} FROM points"
+        if len(conditions) > 0:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY trajectory, start_chainage, filename, river_level, berm_x, berm_z, name"
+
+        return [
+            dict(zip(COLUMNS, row))
+            for row in self._connection.execute(sql, params).fetchall()
+        ]
+
+    def to_dataframe(self, **filters):
+        """Get the points that match the filters (see query) as a pandas DataFrame"""
+        import pandas as pd
+
+        return pd.DataFrame(self.query(**filters), columns=COLUMNS)
+
+    def filenames(self, kind: str = FRAGILITY) -> List[str]:
+        """Get the names of the stix files that have points of the given kind"""
+        return [
+            row[0]
+            for row in self._connection.execute(
+                "SELECT DISTINCT filename FROM points WHERE kind=? ORDER BY filename",
+                (kind,),
+            ).fetchall()
+        ]
+
+    def fragility_curve(self, filename: str) -> Optional[FragilityCurve]:
+        """Get the fragility curve of the given stix file
+
+        Args:
+            filename (str): the name of the original stix file
+
+        Returns:
+            Optional[FragilityCurve]: the fragility curve or None if there are no points
+        """
+        points = self.query(kind=FRAGILITY, filename=filename)
+        if len(points) == 0:
+            return None
+        return FragilityCurve(
+            [p["river_level"] for p in points],
+            [p["factor_of_safety"] for p in points],
+            [p["model_factor"] for p in points],
+        )
+
+    def close(self):
+        self._connection.close()
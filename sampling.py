@@ -0,0 +1,87 @@
+from bisect import bisect_right
+from typing import List, Optional
+
+
+def get_coarse_levels(
+    min_level: float, max_level: float, step_size: float, coarse_factor: int
+) -> List[float]:
+    """Get the coarse set of river levels to start the adaptive sampling with
+
+    All levels (including the ones added during refinement) are on the grid
+    min_level + i * step_size so the adaptive sampling never calculates more
+    levels than the regular sampling would.
+
+    Args:
+        min_level (float): the lowest river level
+        max_level (float): the highest river level
+        step_size (float): the smallest step between two river levels
+        coarse_factor (int): use every n-th level of the grid for the coarse set
+
+    Returns:
+        List[float]: the coarse river levels
+    """
+    num_steps = int(round((max_level - min_level) / step_size))
+    indices = list(range(0, num_steps + 1, max(1, coarse_factor)))
+    if indices[-1] != num_steps:
+        indices.append(num_steps)
+    return [round(min_level + i * step_size, 3) for i in indices]
+
+
+def refine_levels(
+    levels: List[float],
+    sfs: List[float],
+    pfs: List[float],
+    pf_boundaries: List[float],
+    min_level: float,
+    step_size: float,
+    sf_tolerance: float,
+    skip_levels: Optional[List[float]] = None,
+) -> List[float]:
+    """Get the river levels that need to be added to refine the fragility curve
+
+    An interval between two calculated levels is refined if the failure probability
+    crosses one of the category boundaries or if the safety factor curve bends
+    sharply at one of the ends of the interval. The new level is the grid point
+    closest to the center of the interval, intervals of one step are never refined.
+
+    Args:
+        levels (List[float]): the calculated river levels
+        sfs (List[float]): the safety factors per river level
+        pfs (List[float]): the failure probabilities per river level
+        pf_boundaries (List[float]): the (ascending) failure probabilities of the category boundaries
+        min_level (float): the lowest river level (start of the grid)
+        step_size (float): the smallest step between two river levels
+        sf_tolerance (float): the allowed deviation of the safety factor from the line between its neighbours
+        skip_levels (List[float], optional): levels that should not be added (like failed calculations). Defaults to None.
+
+    Returns:
+        List[float]: the river levels to add, empty if the curve is refined enough
+    """
+    points = sorted(zip(levels, sfs, pfs))
+    grid = [int(round((p[0] - min_level) / step_size)) for p in points]
+    skip = [int(round((l - min_level) / step_size)) for l in skip_levels or []]
+
+    intervals = set()
+    for i in range(1, len(points)):
+        if bisect_right(pf_boundaries, points[i - 1][2]) != bisect_right(
+            pf_boundaries, points[i][2]
+        ):
+            intervals.add(i - 1)
+
+    for i in range(1, len(points) - 1):
+        (l1, sf1, _), (l2, sf2, _), (l3, sf3, _) = points[i - 1 : i + 2]
+        sf_line = sf1 + (l2 - l1) / (l3 - l1) * (sf3 - sf1)
+        if abs(sf2 - sf_line) > sf_tolerance:
+            intervals.add(i - 1)
+            intervals.add(i)
+
+    result = []
+    for i in sorted(intervals):
+        if grid[i + 1] - grid[i] < 2:
+            continue
+        new_index = (grid[i] + grid[i + 1]) // 2
+        if new_index in skip:
+            continue
+        result.append(round(min_level + new_index * step_size, 3))
+
+    return result
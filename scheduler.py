@@ -0,0 +1,465 @@
+import logging
+import subprocess
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, Executor, ProcessPoolExecutor, wait
+from pathlib import Path
+from typing import Dict, Generator, Iterable, List, Optional, Set, Union
+
+from instrumentation import PeakRssSampler, Recorder, add_events
+from journal import RunJournal
+from result_cache import ResultCache, get_slip_plane, stix_hash
+
+# a section is a generator that yields the jobs it needs to have calculated and
+# gets the results of these jobs (by job name) sent back, for example;
+#
+# def section():
+#     results = yield [Job("a", "a.stix"), Job("b", "b.stix")]
+#     results = yield [Job("c", "c.stix")] if results["a"].factor_of_safety < 1.0 else []
+#
+# instead of a list of jobs a section can also yield a Submit, Wait or Cancel command
+# (see below) to start jobs speculatively and cancel them when they are not needed
+Section = Generator[
+    Union[List["Job"], "Submit", "Wait", "Cancel"],
+    Optional[Dict[str, "JobResult"]],
+    None,
+]
+
+
+class Job:
+    def __init__(self, name: str, filename: str, scenarios: Optional[List[str]] = None):
+        """A stix file that needs to be calculated
+
+        If scenarios is given the stix file holds multiple models as scenarios
+        (see multi_scenario.py), the results are then returned per scenario
+        using the scenario label as the name of the result.
+
+        Args:
+            name (str): the name of the job (unique within the section)
+            filename (str): the (serialized) stix file to calculate
+            scenarios (Optional[List[str]], optional): the labels of the scenarios to get the results from. Defaults to None.
+        """
+        self.name = name
+        self.filename = str(filename)
+        self.scenarios = scenarios
+        # the hash of the input, set by the scheduler if a cache is used
+        self.key = None
+
+
+class JobResult:
+    def __init__(
+        self,
+        name: str,
+        factor_of_safety: Optional[float] = None,
+        analysis_type: Optional[str] = None,
+        slip_plane: Optional[Dict] = None,
+        runtime: float = 0.0,
+        error: str = "",
+        cached: bool = False,
+        events: Optional[List[Dict]] = None,
+    ):
+        self.name = name
+        self.factor_of_safety = factor_of_safety
+        self.analysis_type = analysis_type
+        self.slip_plane = slip_plane
+        self.runtime = runtime
+        self.error = error
+        self.cached = cached
+        # the stage events of the worker process (see instrumentation.py), only
+        # set on the first result of a job
+        self.events = [] if events is None else events
+
+    @property
+    def ok(self) -> bool:
+        return self.factor_of_safety is not None
+
+
+def get_console_command(console: str) -> List[str]:
+    """The command to start the console (python scripts like fake_console.py are started with this python)"""
+    return [sys.executable, console] if console.endswith(".py") else [console]
+
+
+def get_result_names(job: Job) -> List[str]:
+    """The names of the results of the job (the job name or the scenario labels)"""
+    return job.scenarios if job.scenarios is not None else [job.name]
+
+
+def get_error_results(
+    job: Job, runtime: float, error: str, events: Optional[List[Dict]] = None
+) -> List[JobResult]:
+    """A failed result for every result of the job (the events are set on the first result)"""
+    return [
+        JobResult(
+            name=name,
+            runtime=runtime,
+            error=error,
+            events=events if i == 0 else None,
+        )
+        for i, name in enumerate(get_result_names(job))
+    ]
+
+
+def read_job_results(job: Job, runtime: float) -> List[JobResult]:
+    """Read the result(s) of a calculated job from its stix file, raises an exception if the file cannot be read
+
+    Args:
+        job (Job): the calculated job
+        runtime (float): the runtime of the job, divided over the results
+
+    Returns:
+        List[JobResult]: the result of the calculation or the results per scenario
+    """
+    # import here to keep the startup of the worker processes light
+    from geolib.models import DStabilityModel
+    from multi_scenario import get_scenario_results
+
+    names = get_result_names(job)
+    model = DStabilityModel()
+    model.parse(Path(job.filename))
+    if job.scenarios is None:
+        outputs = {
+            job.name: {
+                "result": model.output[-1],
+                "analysis_type": model.datastructure.calculationsettings[
+                    -1
+                ].AnalysisType.value,
+            }
+        }
+    else:
+        outputs = get_scenario_results(model, job.scenarios)
+
+    runtime = runtime / len(names)
+    results = []
+    for name in names:
+        output = outputs[name]
+        if "error" in output:
+            results.append(JobResult(name=name, runtime=runtime, error=output["error"]))
+        else:
+            results.append(
+                JobResult(
+                    name=name,
+                    factor_of_safety=output["result"].FactorOfSafety,
+                    analysis_type=output["analysis_type"],
+                    slip_plane=get_slip_plane(output["result"]),
+                    runtime=runtime,
+                )
+            )
+    return results
+
+
+def run_job(console: str, job: Job) -> List[JobResult]:
+    """Calculate the job using the DStability console and read the result(s)
+
+    Note that this function runs in a separate process
+
+    Args:
+        console (str): path to the DStability console executable (or a python script like fake_console.py)
+        job (Job): the job to calculate
+
+    Returns:
+        List[JobResult]: the result of the calculation or the results per scenario
+    """
+    # this process has its own recorder, the events are sent back with the result
+    recorder = Recorder()
+    start = time.time()
+    try:
+        with recorder.stage("console", job.filename, child_processes=True) as event:
+            # the console reads and writes the stix file in its own process
+            event["bytes_read"] = Path(job.filename).stat().st_size
+            process = subprocess.Popen(
+                get_console_command(console) + [job.filename],
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+            )
+            sampler = PeakRssSampler(process.pid)
+            process.wait()
+            event["peak_rss"] = sampler.stop()
+            event["bytes_written"] = Path(job.filename).stat().st_size
+        if process.returncode != 0:
+            return get_error_results(
+                job,
+                time.time() - start,
+                f"the console stopped with exit code {process.returncode}",
+                recorder.events,
+            )
+        with recorder.stage("result_parse", job.filename):
+            results = read_job_results(job, time.time() - start)
+    except Exception as e:
+        return get_error_results(job, time.time() - start, str(e), recorder.events)
+
+    results[0].events = recorder.events
+    return results
+
+
+class Submit:
+    def __init__(self, jobs: List[Job]):
+        """Start the jobs without waiting for the results (the section gets None sent back)"""
+        self.jobs = jobs
+
+
+class Wait:
+    def __init__(self, names: List[str], any_of: bool = False):
+        """Wait until the results with the given names are available and send them to the section
+
+        If any_of is set the section continues as soon as one of the results is
+        available and gets all results of the given names that are available by then.
+        """
+        self.names = names
+        self.any_of = any_of
+
+
+class Cancel:
+    def __init__(self, names: List[str]):
+        """Cancel the jobs with results with the given names, the results are not sent to the section"""
+        self.names = names
+
+
+class Scheduler:
+    """Calculate the jobs of many sections using one shared pool of console processes
+
+    Sections are started lazily as long as there is not enough work to keep all
+    processes busy and get their results as soon as all jobs of their current
+    batch are finished so their post processing overlaps with the calculations
+    of other sections.
+
+    Besides a list of jobs (submit and wait for all of them) a section can yield a
+    Submit, Wait or Cancel command to start jobs speculatively, wait for a subset of
+    the results and cancel the jobs that are not needed anymore. Jobs that have not
+    started yet are removed from the queue, running jobs are finished but their
+    results are not sent to the section. When a section is finished its remaining
+    jobs are cancelled.
+
+    By default the jobs run in a pool of nprocesses processes (run_job), another
+    executor like the ConsoleExecutor (see console_driver.py) or the DistributedExecutor
+    (see distributed.py) can be given instead, the scheduler shuts it down when it is
+    done.
+    """
+
+    def __init__(
+        self,
+        console: str,
+        nprocesses: int,
+        cache: Optional[ResultCache] = None,
+        journal: Optional[RunJournal] = None,
+        executor: Optional[Executor] = None,
+    ):
+        self.console = console
+        self.nprocesses = nprocesses
+        self.executor = executor
+        self.cache = cache
+        self.journal = journal
+        self.num_calculated = 0
+        self.num_cached = 0
+        self.num_resumed = 0
+        self.num_cancelled = 0
+
+    def run(self, sections: Iterable[Section]):
+        """Run all sections until they are finished
+
+        Args:
+            sections (Iterable[Section]): the sections, may be a (lazy) generator
+        """
+        sections = iter(sections)
+        self._futures = {}  # future -> (section, job)
+        self._outstanding = {}  # section -> names of the results that are not in yet
+        self._waiting = {}  # section -> names the section is waiting for
+        self._waiting_any = set()  # sections that wait for any of the names
+        self._results = {}  # section -> results by name
+        self._abandoned = set()  # cancelled futures that were already running
+
+        start = time.time()
+        executor = (
+            ProcessPoolExecutor(max_workers=self.nprocesses)
+            if self.executor is None
+            else self.executor
+        )
+        with executor as self._pool:
+            no_more_sections = False
+            while True:
+                while not no_more_sections and len(self._futures) < 2 * self.nprocesses:
+                    section = next(sections, None)
+                    if section is None:
+                        no_more_sections = True
+                        break
+                    self._outstanding[section] = set()
+                    self._results[section] = {}
+                    self._advance(section, None)
+
+                if len(self._futures) == 0:
+                    if no_more_sections:
+                        break
+                    continue
+
+                done, _ = wait(self._futures.keys(), return_when=FIRST_COMPLETED)
+                for future in done:
+                    section, job = self._futures.pop(future)
+                    if future.cancelled():
+                        continue
+                    self.num_calculated += 1
+                    abandoned = future in self._abandoned
+                    self._abandoned.discard(future)
+                    for result in future.result():
+                        add_events(result.events)
+                        self._store(job, result)
+                        if not abandoned and section in self._results:
+                            self._outstanding[section].discard(result.name)
+                            self._results[section][result.name] = result
+
+                    if section in self._waiting and self._is_ready(section):
+                        self._advance(section, self._take_results(section))
+
+        logging.info(
+            f"Scheduler finished {self.num_calculated} calculation(s), used {self.num_cached} cached result(s) and {self.num_resumed} result(s) from the journal and cancelled {self.num_cancelled} calculation(s) in {time.time() - start:.1f} seconds"
+        )
+
+    def _store(self, job: Job, result: JobResult):
+        """Write a calculated result to the journal and the cache"""
+        if self.journal is not None:
+            self.journal.add(
+                job.filename,
+                result.name,
+                result.factor_of_safety,
+                result.analysis_type,
+                result.slip_plane,
+                result.runtime,
+                result.error,
+            )
+        if not result.ok:
+            logging.error(
+                f"Error calculating '{job.filename}' ({result.name}); '{result.error}'"
+            )
+        elif self.cache is not None and job.key is not None:
+            self.cache.put(
+                self._cache_key(job, result.name),
+                result.factor_of_safety,
+                result.analysis_type,
+                result.slip_plane,
+            )
+
+    def _is_ready(self, section: Section) -> bool:
+        names = self._waiting[section]
+        if section in self._waiting_any:
+            return len(names) == 0 or len(names - self._outstanding[section]) > 0
+        return len(names & self._outstanding[section]) == 0
+
+    def _take_results(self, section: Section) -> Dict[str, JobResult]:
+        """The results the section is waiting for"""
+        names = self._waiting.pop(section)
+        self._waiting_any.discard(section)
+        return {
+            name: result
+            for name, result in self._results[section].items()
+            if name in names
+        }
+
+    def _advance(self, section: Section, results: Optional[Dict[str, JobResult]]):
+        """Send the results to the section and handle its commands until it has to wait"""
+        while True:
+            try:
+                command = section.send(results)
+            except StopIteration:
+                self._finish(section)
+                return
+            except Exception as e:
+                logging.exception(f"Error in section, skipping it; '{e}'")
+                self._finish(section)
+                return
+
+            if isinstance(command, Cancel):
+                self._cancel(section, command.names)
+                results = None
+                continue
+
+            if isinstance(command, Submit):
+                self._submit(section, command.jobs)
+                results = None
+                continue
+
+            if isinstance(command, Wait):
+                names = set(command.names)
+                if command.any_of:
+                    self._waiting_any.add(section)
+            else:
+                # a list of jobs, submit them and wait for all of them
+                names = self._submit(section, command)
+
+            self._waiting[section] = names
+            if not self._is_ready(section):
+                return
+            results = self._take_results(section)
+
+    def _submit(self, section: Section, jobs: List[Job]) -> Set[str]:
+        """Submit the jobs (unless the results are in the journal or cache)
+
+        Returns:
+            Set[str]: the names of the results of the jobs
+        """
+        result_names = set()
+        for job in jobs:
+            names = job.scenarios if job.scenarios is not None else [job.name]
+            result_names.update(names)
+
+            if self.journal is not None:
+                records = [self.journal.get(job.filename, name) for name in names]
+                if None not in records:
+                    self.num_resumed += len(records)
+                    for name, record in zip(names, records):
+                        self._results[section][name] = JobResult(
+                            name=name,
+                            factor_of_safety=record["factor_of_safety"],
+                            analysis_type=record["analysis_type"],
+                            slip_plane=record["slip_plane"],
+                            runtime=record["runtime"],
+                            cached=True,
+                        )
+                    continue
+
+            if self.cache is not None:
+                job.key = stix_hash(job.filename)
+                cached = [self.cache.get(self._cache_key(job, name)) for name in names]
+                if None not in cached:
+                    self.num_cached += len(cached)
+                    for name, c in zip(names, cached):
+                        self._results[section][name] = JobResult(
+                            name=name,
+                            factor_of_safety=c.factor_of_safety,
+                            analysis_type=c.analysis_type,
+                            slip_plane=c.slip_plane,
+                            cached=True,
+                        )
+                    continue
+
+            future = self._pool.submit(run_job, self.console, job)
+            self._futures[future] = (section, job)
+            self._outstanding[section].update(names)
+        return result_names
+
+    def _cancel(self, section: Section, names: Iterable[str]):
+        """Cancel the jobs of the section that produce any of the given results"""
+        names = set(names)
+        for future, (s, job) in list(self._futures.items()):
+            job_names = job.scenarios if job.scenarios is not None else [job.name]
+            if s is not section or names.isdisjoint(job_names):
+                continue
+            if future.cancel():
+                # not started yet, the future is removed when it shows up as done
+                self.num_cancelled += 1
+            else:
+                # already running, the result is kept for the cache and journal only
+                self._abandoned.add(future)
+            self._outstanding[section].difference_update(job_names)
+        for name in names:
+            self._results[section].pop(name, None)
+
+    def _finish(self, section: Section):
+        """Cancel the remaining jobs of a finished section and forget the section"""
+        if len(self._outstanding.get(section, ())) > 0:
+            self._cancel(section, set(self._outstanding[section]))
+        self._outstanding.pop(section, None)
+        self._waiting.pop(section, None)
+        self._waiting_any.discard(section)
+        self._results.pop(section, None)
+
+    def _cache_key(self, job: Job, name: str) -> str:
+        """The key of a (scenario) result in the cache"""
+        return job.key if job.scenarios is None else f"{job.key}:{name}"
@@ -0,0 +1,227 @@
+import logging
+from typing import Any, Dict, Optional, Tuple
+
+from geolib.models import DStabilityModel
+from geolib.models.dstability.internal import AnalysisTypeEnum
+
+from multi_scenario import get_calculation_settings
+
+# the critical slip plane of a neighbouring variant (the previous river level or a
+# berm of almost the same size) is used to narrow and re-center the search area of
+# the next variant, if the new optimum lands on the edge of the narrowed area the
+# variant is calculated again with the original search area
+#
+# the slip planes are the results as dictionaries (see result_cache.get_slip_plane)
+# with a 'Circle' (Bishop) or 'LeftCenter', 'RightCenter' and 'TangentLine' (Uplift-Van)
+
+
+def _fit(center: float, size: float, lower: float, upper: float) -> float:
+    """Get the start of a range with the given size around center that lies within lower and upper"""
+    start = center - size / 2.0
+    start = min(start, upper - size)
+    return max(start, lower)
+
+
+def _narrow_grid(grid: Any, center: Dict[str, float], factor: float):
+    """Narrow a Bishop grid (BottomLeft, NumberOfPointsInX / Z, Space) around the center"""
+    nx = max(3, int(round(grid.NumberOfPointsInX * factor)))
+    nz = max(3, int(round(grid.NumberOfPointsInZ * factor)))
+    if nx >= grid.NumberOfPointsInX and nz >= grid.NumberOfPointsInZ:
+        return
+    left, bottom = grid.BottomLeft.X, grid.BottomLeft.Z
+    right = left + (grid.NumberOfPointsInX - 1) * grid.Space
+    top = bottom + (grid.NumberOfPointsInZ - 1) * grid.Space
+    nx, nz = min(nx, grid.NumberOfPointsInX), min(nz, grid.NumberOfPointsInZ)
+    grid.BottomLeft.X = _fit(center["X"], (nx - 1) * grid.Space, left, right)
+    grid.BottomLeft.Z = _fit(center["Z"], (nz - 1) * grid.Space, bottom, top)
+    grid.NumberOfPointsInX = nx
+    grid.NumberOfPointsInZ = nz
+
+
+def _narrow_area(area: Any, center: Dict[str, float], factor: float):
+    """Narrow an Uplift-Van search area (TopLeft, Width, Height) around the center"""
+    left, top = area.TopLeft.X, area.TopLeft.Z
+    width, height = area.Width * factor, area.Height * factor
+    x = _fit(center["X"], width, left, left + area.Width)
+    z = _fit(center["Z"], height, top - area.Height, top)
+    area.TopLeft.X, area.TopLeft.Z = x, z + height
+    area.Width, area.Height = width, height
+
+
+def narrow_search_area(settings: Any, slip_plane: Dict, factor: float = 0.5) -> Any:
+    """Create a copy of the calculation settings with the search area narrowed around the slip plane
+
+    The narrowed area is factor times the size of the original area and always lies
+    within the original area. Supported are Bishop brute force (grid and tangent lines)
+    and Uplift-Van particle swarm (search areas A and B and the tangent area).
+
+    Args:
+        settings (Any): the calculation settings of the model
+        slip_plane (Dict): the critical slip plane of the neighbouring variant
+        factor (float, optional): the size of the narrowed area relative to the original area. Defaults to 0.5.
+
+    Returns:
+        Any: the narrowed calculation settings
+
+    Raises:
+        ValueError: if the analysis type is not supported or does not match the slip plane
+    """
+    settings = settings.copy(deep=True)
+    analysis_type = AnalysisTypeEnum(settings.AnalysisType)
+
+    if analysis_type == AnalysisTypeEnum.BISHOP_BRUTE_FORCE and "Circle" in slip_plane:
+        circle = slip_plane["Circle"]
+        bishop = settings.BishopBruteForce
+        _narrow_grid(bishop.SearchGrid, circle["Center"], factor)
+        tangents = bishop.TangentLines
+        n = max(3, int(round(tangents.NumberOfTangentLines * factor)))
+        if n < tangents.NumberOfTangentLines:
+            bottom = tangents.BottomTangentLineZ
+            top = bottom + (tangents.NumberOfTangentLines - 1) * tangents.Space
+            tangents.BottomTangentLineZ = _fit(
+                circle["Center"]["Z"] - circle["Radius"],
+                (n - 1) * tangents.Space,
+                bottom,
+                top,
+            )
+            tangents.NumberOfTangentLines = n
+    elif (
+        analysis_type == AnalysisTypeEnum.UPLIFT_VAN_PARTICLE_SWARM
+        and "LeftCenter" in slip_plane
+    ):
+        uplift_van = settings.UpliftVanParticleSwarm
+        _narrow_area(uplift_van.SearchAreaA, slip_plane["LeftCenter"], factor)
+        _narrow_area(uplift_van.SearchAreaB, slip_plane["RightCenter"], factor)
+        tangent_area = uplift_van.TangentArea
+        height = tangent_area.Height * factor
+        bottom = _fit(
+            slip_plane["TangentLine"],
+            height,
+            tangent_area.TopZ - tangent_area.Height,
+            tangent_area.TopZ,
+        )
+        tangent_area.TopZ, tangent_area.Height = bottom + height, height
+    else:
+        raise ValueError(
+            f"Cannot narrow the search area of a {analysis_type.value} calculation"
+        )
+    return settings
+
+
+def _on_range_edge(value: float, lower: float, upper: float, tolerance: float) -> bool:
+    return value <= lower + tolerance or value >= upper - tolerance
+
+
+def is_on_edge(
+    settings: Any, slip_plane: Optional[Dict], tolerance: float = 0.01
+) -> bool:
+    """Check if the slip plane lies on the edge of the search area of the calculation settings
+
+    If the optimum is on the edge the real optimum might lie outside the search area.
+    Unsupported analysis types are never on the edge.
+
+    Args:
+        settings (Any): the calculation settings that were used
+        slip_plane (Optional[Dict]): the critical slip plane
+        tolerance (float, optional): distance to the edge that counts as on the edge [m]. Defaults to 0.01.
+
+    Returns:
+        bool: True if the slip plane is on the edge
+    """
+    if slip_plane is None:
+        return False
+    analysis_type = AnalysisTypeEnum(settings.AnalysisType)
+
+    if analysis_type == AnalysisTypeEnum.BISHOP_BRUTE_FORCE and "Circle" in slip_plane:
+        grid = settings.BishopBruteForce.SearchGrid
+        tangents = settings.BishopBruteForce.TangentLines
+        center = slip_plane["Circle"]["Center"]
+        tangent = center["Z"] - slip_plane["Circle"]["Radius"]
+        left, bottom = grid.BottomLeft.X, grid.BottomLeft.Z
+        return (
+            _on_range_edge(
+                center["X"],
+                left,
+                left + (grid.NumberOfPointsInX - 1) * grid.Space,
+                tolerance,
+            )
+            or _on_range_edge(
+                center["Z"],
+                bottom,
+                bottom + (grid.NumberOfPointsInZ - 1) * grid.Space,
+                tolerance,
+            )
+            or _on_range_edge(
+                tangent,
+                tangents.BottomTangentLineZ,
+                tangents.BottomTangentLineZ
+                + (tangents.NumberOfTangentLines - 1) * tangents.Space,
+                tolerance,
+            )
+        )
+
+    if (
+        analysis_type == AnalysisTypeEnum.UPLIFT_VAN_PARTICLE_SWARM
+        and "LeftCenter" in slip_plane
+    ):
+        uplift_van = settings.UpliftVanParticleSwarm
+        for area, center in [
+            (uplift_van.SearchAreaA, slip_plane["LeftCenter"]),
+            (uplift_van.SearchAreaB, slip_plane["RightCenter"]),
+        ]:
+            if _on_range_edge(
+                center["X"], area.TopLeft.X, area.TopLeft.X + area.Width, tolerance
+            ) or _on_range_edge(
+                center["Z"], area.TopLeft.Z - area.Height, area.TopLeft.Z, tolerance
+            ):
+                return True
+        tangent_area = uplift_van.TangentArea
+        return _on_range_edge(
+            slip_plane["TangentLine"],
+            tangent_area.TopZ - tangent_area.Height,
+            tangent_area.TopZ,
+            tolerance,
+        )
+
+    return False
+
+
+def set_calculation_settings(
+    model: DStabilityModel, scenario_index: int, settings: Any
+):
+    """Replace the calculation settings (with the same id) of the given scenario"""
+    current = get_calculation_settings(model, scenario_index)
+    calculationsettings = model.datastructure.calculationsettings
+    for i, calculation_settings in enumerate(calculationsettings):
+        if calculation_settings.Id == current.Id:
+            calculationsettings[i] = settings
+            return
+
+
+def warm_start(
+    model: DStabilityModel,
+    slip_plane: Optional[Dict],
+    factor: float = 0.5,
+    scenario_index: int = 0,
+) -> Tuple[Any, Optional[Any]]:
+    """Narrow the search area of the model around the slip plane of a neighbouring variant
+
+    Args:
+        model (DStabilityModel): the model to change
+        slip_plane (Optional[Dict]): the critical slip plane of the neighbouring variant (None to keep the original search area)
+        factor (float, optional): the size of the narrowed area relative to the original area. Defaults to 0.5.
+        scenario_index (int, optional): the scenario to change. Defaults to 0.
+
+    Returns:
+        Tuple[Any, Optional[Any]]: the original and the narrowed calculation settings (None if not narrowed)
+    """
+    original = get_calculation_settings(model, scenario_index)
+    if slip_plane is None:
+        return original, None
+    try:
+        narrowed = narrow_search_area(original, slip_plane, factor)
+    except Exception as e:
+        logging.debug(f"Not narrowing the search area; '{e}'")
+        return original, None
+    set_calculation_settings(model, scenario_index, narrowed)
+    return original, narrowed
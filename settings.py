@@ -54,3 +54,15 @@ P_EIS_OND_DSN = {
     "35-1": 3.95726e-06,
     "35-2": 3.80807e-06,
 }
+
+# de metrering van de stix bestanden loopt tegen de richting van de referentielijn in
+REFLINE_REVERSED = {
+    "34-1": False,
+    "34-2": True,
+    "34-3": False,
+    "34-4": False,
+    "34-5": False,
+    "34A-1": False,
+    "35-1": False,
+    "35-2": False,
+}
@@ -0,0 +1,192 @@
+# berekent de fragility curves (fc_plline.py) en de bermen (berm.py) in een keer
+#
+# alle berekeningen van beide scripts gebruiken dezelfde processen zodat alle cores
+# bezig blijven tot de laatste berekening klaar is, de paden en instellingen van
+# de scripts zelf worden gebruikt, alleen de console, het aantal processen en de
+# cache worden hier ingesteld
+import argparse
+import logging
+from itertools import chain
+
+import berm
+import fc_plline
+import gis_export
+import instrumentation
+from console_driver import ConsoleExecutor
+from distributed import DistributedExecutor
+from helpers import read_param_lines
+from journal import RunJournal
+from old_code.get_reflines import get_reflines
+from plotting import render_fragility_curves
+from preflight import run_preflight
+from result_cache import ResultCache
+from results_store import ResultsStore
+from scheduler import Scheduler
+from workspace import ScratchWorkspace
+
+LOG_FILE = "Z:\\Documents\\Klanten\\Output\\WSBD\\sweep.log"
+DSTABILITY_EXE = (
+    "Z:\\Apps\\Deltares\\Consoles\\DStabilityConsole\\D-Stability Console.exe"
+)
+MAX_THREADS = 8  # increase if you need more threads
+
+USE_RESULT_CACHE = True
+RESULT_CACHE_FILE = "Z:\\Documents\\Klanten\\Output\\WSBD\\result_cache.sqlite"
+RESULT_CACHE_MAX_SIZE = 500 * 1024 * 1024  # bytes
+
+# finished calculations are written to this journal, use --resume to continue a run
+JOURNAL_FILE = "Z:\\Documents\\Klanten\\Output\\WSBD\\journal.jsonl"
+
+# every calculated point is written to this database (see results_store.py)
+RESULTS_STORE_FILE = "Z:\\Documents\\Klanten\\Output\\WSBD\\results.sqlite"
+
+# write the stix files for the console of both scripts to a local scratch directory
+# (see USE_SCRATCH in fc_plline.py), the calculated stix files are copied to the
+# CALCULATIONS_PATH of the scripts at the end (if COPY_BACK_CALCULATIONS)
+USE_SCRATCH = False
+SCRATCH_PATH = None
+COPY_BACK_CALCULATIONS = True
+
+# check the parameter files and try the waternets and berm geometries of every line
+# (see preflight.py) before starting the calculations, the run stops if there are errors
+PREFLIGHT = True
+
+# the results along the reference lines are written to this shapefile at the end of
+# the run (see gis_export.py), None to skip
+GIS_EXPORT_FILE = None
+
+# start the consoles from an asyncio loop (see console_driver.py) instead of one blocking
+# process per console, a console that runs longer than CONSOLE_TIMEOUT seconds is killed
+# and failed runs are retried CONSOLE_RETRIES times (after CONSOLE_RETRY_DELAY seconds,
+# doubled for every next retry)
+USE_CONSOLE_DRIVER = False
+CONSOLE_TIMEOUT = 3600
+CONSOLE_RETRIES = 1
+CONSOLE_RETRY_DELAY = 10.0
+
+# put the calculations in a queue in this shared directory instead of calculating them
+# here, the workers on the other computers calculate them (see distributed.py), None to
+# calculate locally, DISTRIBUTED_SLOTS is the number of consoles of all workers together
+DISTRIBUTED_QUEUE_PATH = None
+DISTRIBUTED_SLOTS = 32
+
+# duration, bytes read / written and peak memory per stage and model (see instrumentation.py)
+EVENTS_FILE = "Z:\\Documents\\Klanten\\Output\\WSBD\\stages.jsonl"
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Calculate the fragility curves and the berms in one run"
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="continue the previous run, calculations in the journal are not calculated again",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="profile the python side stages with cProfile (written to EVENTS_FILE.prof)",
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        filename=LOG_FILE,
+        filemode="a" if args.resume else "w",
+        format="%(asctime)s %(levelname)s %(message)s",
+        datefmt="%H:%M:%S",
+        level=logging.INFO,
+    )
+    instrumentation.enable(EVENTS_FILE, profile=args.profile)
+
+    if PREFLIGHT:
+        report = run_preflight(
+            fc_plline.PARAMETERS_FILE, berm.PARAMETERS_FILE, MAX_THREADS
+        )
+        report.log()
+        if not report.ok:
+            instrumentation.close()
+            return
+
+    result_cache = (
+        ResultCache(RESULT_CACHE_FILE, max_size=RESULT_CACHE_MAX_SIZE)
+        if USE_RESULT_CACHE
+        else None
+    )
+
+    journal = RunJournal(JOURNAL_FILE, resume=args.resume)
+    store = ResultsStore(RESULTS_STORE_FILE)
+
+    workspaces = {}
+    if USE_SCRATCH:
+        for module in [fc_plline, berm]:
+            workspaces[module] = ScratchWorkspace(
+                module.CALCULATIONS_PATH, SCRATCH_PATH
+            )
+            module.CALCULATIONS_PATH = str(workspaces[module].path)
+
+    executor = None
+    nprocesses = MAX_THREADS
+    if DISTRIBUTED_QUEUE_PATH is not None:
+        executor = DistributedExecutor(DISTRIBUTED_QUEUE_PATH)
+        nprocesses = DISTRIBUTED_SLOTS
+    elif USE_CONSOLE_DRIVER:
+        executor = ConsoleExecutor(
+            MAX_THREADS, CONSOLE_TIMEOUT, CONSOLE_RETRIES, CONSOLE_RETRY_DELAY
+        )
+    scheduler = Scheduler(
+        DSTABILITY_EXE,
+        nprocesses,
+        cache=result_cache,
+        journal=journal,
+        executor=executor,
+    )
+    try:
+        scheduler.run(
+            chain(
+                (
+                    fc_plline.fragility_curve_section(param_line, store, args.resume)
+                    for param_line in read_param_lines(fc_plline.PARAMETERS_FILE)
+                ),
+                (
+                    berm.berm_section(param_line, store, args.resume)
+                    for param_line in read_param_lines(berm.PARAMETERS_FILE)
+                ),
+            )
+        )
+    finally:
+        for module, workspace in workspaces.items():
+            workspace.close(copy_back=COPY_BACK_CALCULATIONS)
+            module.CALCULATIONS_PATH = workspace.target
+
+    # the plots are made after the calculations from the points in the store
+    render_fragility_curves(
+        store,
+        fc_plline.OUTPUT_PATH,
+        MAX_THREADS,
+        filenames=[
+            param_line.split(",")[0].strip()
+            for param_line in read_param_lines(fc_plline.PARAMETERS_FILE)
+        ],
+    )
+
+    if GIS_EXPORT_FILE is not None:
+        gis_export.export_results(
+            store, get_reflines(gis_export.REFLINES_PATH), GIS_EXPORT_FILE
+        )
+
+    if result_cache is not None:
+        logging.info(
+            f"Result cache hits: {result_cache.hits}, misses: {result_cache.misses}"
+        )
+        result_cache.close()
+
+    journal.close()
+    store.close()
+
+    instrumentation.log_summary()
+    instrumentation.close()
+
+
+if __name__ == "__main__":
+    main()
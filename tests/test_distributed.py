@@ -0,0 +1,125 @@
+import os
+import time
+from concurrent.futures import wait
+
+import distributed
+from distributed import DistributedExecutor, claim
+from scheduler import Job, run_job
+
+
+def test_lost_workers_give_up(tmp_path, monkeypatch):
+    """A unit whose worker is lost MAX_ASSIGNMENTS times is reported as failed"""
+    monkeypatch.setattr(distributed, "POLL_INTERVAL", 0.05)
+    monkeypatch.setattr(distributed, "HEARTBEAT_TIMEOUT", 0.3)
+    stixfile = tmp_path / "model.stix"
+    stixfile.write_bytes(b"stix")
+    queue = tmp_path / "queue"
+
+    executor = DistributedExecutor(str(queue))
+    try:
+        future = executor.submit(run_job, "console", Job("model", str(stixfile)))
+        num_claims = 0
+        deadline = time.time() + 30.0
+        while not future.done() and time.time() < deadline:
+            # a worker that claims the unit and disappears without a heartbeat
+            if claim(queue) is not None:
+                num_claims += 1
+            time.sleep(0.05)
+
+        results = future.result(timeout=1.0)
+        assert num_claims == distributed.MAX_ASSIGNMENTS
+        assert executor.num_reassigned == distributed.MAX_ASSIGNMENTS - 1
+        assert not results[0].ok
+        assert results[0].error == "the worker was lost too often"
+        for state in ["units", "pending", "claimed", "done"]:
+            assert os.listdir(queue / state) == []
+    finally:
+        executor.shutdown()
+
+
+def test_done_unit_copies_back(tmp_path, monkeypatch):
+    """The result of a finished unit is set and the calculated stix file is copied back"""
+    monkeypatch.setattr(distributed, "POLL_INTERVAL", 0.05)
+    stixfile = tmp_path / "model.stix"
+    stixfile.write_bytes(b"stix")
+    queue = tmp_path / "queue"
+
+    executor = DistributedExecutor(str(queue))
+    try:
+        future = executor.submit(run_job, "console", Job("model", str(stixfile)))
+        unit = claim(queue)
+        (queue / "units" / f"{unit['id']}.stix").write_bytes(b"calculated")
+        result = distributed.JobResult("model", factor_of_safety=1.2)
+        distributed.write_json(
+            queue / "done" / f"{unit['id']}.json",
+            {"id": unit["id"], "results": [distributed.result_to_dict(result)]},
+        )
+        results = future.result(timeout=10.0)
+        assert results[0].factor_of_safety == 1.2
+        assert stixfile.read_bytes() == b"calculated"
+    finally:
+        executor.shutdown()
+
+
+def test_cancel_pending_unit(tmp_path, monkeypatch):
+    """A cancelled unit is removed from the queue and reported as done"""
+    monkeypatch.setattr(distributed, "POLL_INTERVAL", 0.05)
+    queue = tmp_path / "queue"
+    jobs = []
+    for name in ["a", "b"]:
+        stixfile = tmp_path / f"{name}.stix"
+        stixfile.write_bytes(b"stix")
+        jobs.append(Job(name, str(stixfile)))
+
+    executor = DistributedExecutor(str(queue))
+    try:
+        futures = [executor.submit(run_job, "console", job) for job in jobs]
+        assert futures[1].cancel()
+        unit = claim(queue)
+        distributed.write_json(
+            queue / "done" / f"{unit['id']}.json",
+            {
+                "id": unit["id"],
+                "results": [
+                    distributed.result_to_dict(
+                        distributed.JobResult("a", factor_of_safety=1.2)
+                    )
+                ],
+            },
+        )
+        done, not_done = wait(futures, timeout=10.0)
+        assert len(not_done) == 0
+        assert futures[0].result()[0].factor_of_safety == 1.2
+        assert futures[1].cancelled()
+        assert os.listdir(queue / "pending") == []
+    finally:
+        executor.shutdown()
+
+
+def test_cancel_claimed_unit(tmp_path, monkeypatch):
+    """A unit that is claimed after it was cancelled is reported as done and its result is discarded"""
+    monkeypatch.setattr(distributed, "POLL_INTERVAL", 0.5)
+    stixfile = tmp_path / "model.stix"
+    stixfile.write_bytes(b"stix")
+    queue = tmp_path / "queue"
+
+    executor = DistributedExecutor(str(queue))
+    try:
+        future = executor.submit(run_job, "console", Job("model", str(stixfile)))
+        unit = claim(queue)
+        assert future.cancel()
+        done, _ = wait([future], timeout=10.0)
+        assert future in done
+
+        (queue / "units" / f"{unit['id']}.stix").write_bytes(b"calculated")
+        result = distributed.JobResult("model", factor_of_safety=1.2)
+        distributed.write_json(
+            queue / "done" / f"{unit['id']}.json",
+            {"id": unit["id"], "results": [distributed.result_to_dict(result)]},
+        )
+        time.sleep(1.5)
+        assert stixfile.read_bytes() == b"stix"
+        for state in ["units", "pending", "claimed", "done"]:
+            assert os.listdir(queue / state) == []
+    finally:
+        executor.shutdown()
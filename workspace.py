@@ -0,0 +1,80 @@
+import logging
+import shutil
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import List, Optional
+
+from instrumentation import stage
+
+# the intermediate files (the stix files for the console) are written to a local
+# scratch directory instead of the (network) calculations path, at the end the
+# files that need to be kept are copied back in one step and the scratch directory
+# is removed at once
+#
+# use a directory on a local disk or a tmpfs (like /dev/shm on linux) as root
+
+MAX_COPY_THREADS = 8  # copying over a network share is latency bound, copy in parallel
+
+
+class ScratchWorkspace:
+    """A local scratch directory for the intermediate files of a run
+
+    Args:
+        target (str): the path the files are copied back to (like CALCULATIONS_PATH)
+        root (Optional[str], optional): the local directory to create the scratch directory in (the temp directory of the system if None). Defaults to None.
+    """
+
+    def __init__(self, target: str, root: Optional[str] = None):
+        self.target = target
+        if root is not None:
+            Path(root).mkdir(parents=True, exist_ok=True)
+        self.path = Path(tempfile.mkdtemp(prefix="wsbd_", dir=root))
+        logging.info(f"Using scratch directory '{self.path}' for '{target}'")
+
+    def copy_back(self, patterns: Optional[List[str]] = None) -> int:
+        """Copy the files matching the patterns to the target (keeping the subdirectories)
+
+        Args:
+            patterns (Optional[List[str]], optional): the patterns of the files to copy (all stix files if None). Defaults to None.
+
+        Returns:
+            int: the number of copied files
+        """
+        patterns = ["*.stix"] if patterns is None else patterns
+        filenames = {f for pattern in patterns for f in self.path.rglob(pattern)}
+        filenames = [f for f in filenames if f.is_file()]
+        if len(filenames) == 0:
+            return 0
+
+        start = time.time()
+        target = Path(self.target)
+        for directory in {f.parent for f in filenames}:
+            (target / directory.relative_to(self.path)).mkdir(
+                parents=True, exist_ok=True
+            )
+        with stage("copy", self.target):
+            with ThreadPoolExecutor(max_workers=MAX_COPY_THREADS) as pool:
+                list(
+                    pool.map(
+                        lambda f: shutil.copyfile(f, target / f.relative_to(self.path)),
+                        filenames,
+                    )
+                )
+        logging.info(
+            f"Copied {len(filenames)} file(s) from '{self.path}' to '{self.target}' in {time.time() - start:.1f} seconds"
+        )
+        return len(filenames)
+
+    def cleanup(self):
+        """Remove the scratch directory"""
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    def close(self, copy_back: bool = True):
+        """Copy the files back (optional) and remove the scratch directory"""
+        try:
+            if copy_back:
+                self.copy_back()
+        finally:
+            self.cleanup()